@@ -6,11 +6,13 @@ from alembic import context
 from app.config import (DB_HOST, DB_NAME, DB_PORT, POSTGRES_PASSWORD,
                         POSTGRES_USER)
 from app.db.database import Base
-from app.matching.models import (DelMatchingProductDealer,
-                                 MatchingProductDealer,
-                                 MatchPositiveProductDealer, Statistics)
-from app.products.models import (MarketingDealer, MarketingDealerPrice,
-                                 MarketingProduct, MarketingProductDealerKey)
+# Модели импортируются, что-бы их таблицы попали в Base.metadata
+from app.matching.models import (  # noqa: F401
+    DelMatchingProductDealer, MatchingJob, MatchingProductDealer,
+    MatchPositiveProductDealer, Statistics)
+from app.products.models import (  # noqa: F401
+    CatalogVersion, MarketingDealer, MarketingDealerPrice, MarketingProduct,
+    MarketingProductDealerKey)
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,115 @@
+"""Matching queue indexes, leases and background jobs
+
+Revision ID: 0002_matching_queue
+Revises: 0001_initial
+Create Date: 2026-10-18 10:10:24.859342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_matching_queue'
+down_revision: Union[str, None] = '0001_initial'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'catalog_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False,
+                  comment='Номер версии каталога'),
+        sa.Column('updated_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=True,
+                  comment='Время последнего изменения'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'matching_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False,
+                  comment='queued, running, done, failed или cancelled'),
+        sa.Column('processed', sa.Integer(), nullable=False,
+                  comment='Количество обработанных карточек дилеров'),
+        sa.Column('total', sa.Integer(), nullable=True,
+                  comment='Количество карточек дилеров'),
+        sa.Column('error', sa.String(), nullable=True,
+                  comment='Текст ошибки для статуса failed'),
+        sa.Column('created_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=True,
+                  comment='Время создания задачи'),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True,
+                  comment='Время запуска'),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True,
+                  comment='Время завершения'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_matching_job_id'), 'matching_job', ['id'],
+                    unique=False)
+    op.create_index(op.f('ix_matching_job_status'), 'matching_job',
+                    ['status'], unique=False)
+
+    op.create_index(
+        'ix_match_positive_prod_dealer_dealer_product_id_product_id',
+        'match_positive_prod_dealer', ['dealer_product_id', 'product_id'],
+        unique=False)
+
+    # Последовательность для поля order начинается после текущего максимума
+    op.execute(sa.schema.CreateSequence(
+        sa.Sequence('matching_product_dealer_order_seq')))
+    op.execute(
+        "SELECT setval('matching_product_dealer_order_seq', "
+        "COALESCE((SELECT max(\"order\") FROM matching_product_dealer), 0) + 1, "
+        "false)")
+    op.alter_column(
+        'matching_product_dealer', 'order',
+        server_default=sa.text(
+            "nextval('matching_product_dealer_order_seq'::regclass)"))
+
+    op.add_column('matching_product_dealer', sa.Column(
+        'leased_by', sa.Integer(), nullable=True,
+        comment='ID оператора, который взял карточку'))
+    op.add_column('matching_product_dealer', sa.Column(
+        'leased_until', sa.DateTime(timezone=True), nullable=True,
+        comment='До какого времени карточка закреплена за оператором'))
+
+    # У карточки дилера одна запись в очереди: повторы, оставшиеся от
+    # одновременных запусков матчинга, удаляются до уникального индекса
+    op.execute(
+        'DELETE FROM matching_product_dealer AS m '
+        'USING matching_product_dealer AS d '
+        'WHERE m.dealer_product_id = d.dealer_product_id AND m.id > d.id')
+    op.create_index(op.f('ix_matching_product_dealer_dealer_product_id'),
+                    'matching_product_dealer', ['dealer_product_id'],
+                    unique=True)
+    op.create_index('ix_matching_product_dealer_leased_until',
+                    'matching_product_dealer', ['leased_until'], unique=False,
+                    postgresql_where=sa.text('leased_until IS NOT NULL'))
+    op.create_index('ix_matching_product_dealer_order_id',
+                    'matching_product_dealer', ['order', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_matching_product_dealer_order_id',
+                  table_name='matching_product_dealer')
+    op.drop_index('ix_matching_product_dealer_leased_until',
+                  table_name='matching_product_dealer')
+    op.drop_index(op.f('ix_matching_product_dealer_dealer_product_id'),
+                  table_name='matching_product_dealer')
+    op.drop_column('matching_product_dealer', 'leased_until')
+    op.drop_column('matching_product_dealer', 'leased_by')
+    op.alter_column('matching_product_dealer', 'order', server_default=None)
+    op.execute(sa.schema.DropSequence(
+        sa.Sequence('matching_product_dealer_order_seq')))
+    op.drop_index(
+        'ix_match_positive_prod_dealer_dealer_product_id_product_id',
+        table_name='match_positive_prod_dealer')
+    op.drop_index(op.f('ix_matching_job_status'), table_name='matching_job')
+    op.drop_index(op.f('ix_matching_job_id'), table_name='matching_job')
+    op.drop_table('matching_job')
+    op.drop_table('catalog_version')
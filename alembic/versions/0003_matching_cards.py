@@ -0,0 +1,56 @@
+"""Precomputed matching queue cards
+
+Revision ID: 0003_matching_cards
+Revises: 0002_matching_queue
+Create Date: 2026-10-18 14:32:07.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_matching_cards'
+down_revision: Union[str, None] = '0002_matching_queue'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('matching_product_dealer', sa.Column(
+        'dealer_id', sa.Integer(), nullable=True,
+        comment='ID дилера, копия из карточки дилера'))
+    op.add_column('matching_product_dealer', sa.Column(
+        'card', postgresql.JSONB(astext_type=sa.Text()), nullable=True,
+        comment='Готовая карточка для оператора в формате ответа API'))
+    op.create_index('ix_matching_product_dealer_dealer_id_order_id',
+                    'matching_product_dealer', ['dealer_id', 'order', 'id'],
+                    unique=False)
+
+    # Карточки существующей очереди, как в app.matching.cards.refresh_cards
+    op.execute(
+        "UPDATE matching_product_dealer AS m SET dealer_id = p.dealer_id, "
+        "card = jsonb_build_object("
+        "'id', m.id, "
+        "'dealer_product', jsonb_build_object("
+        "'id', p.id, 'dealer_name', d.name, "
+        "'product_name', p.product_name, 'price', p.price, "
+        "'product_url', p.product_url), "
+        "'products', (SELECT coalesce(jsonb_agg(jsonb_build_object("
+        "'id', r.id, 'article', r.article, 'cost', r.cost, "
+        "'name_1c', r.name_1c) ORDER BY ranked.position), '[]'::jsonb) "
+        "FROM unnest(m.product_ids) WITH ORDINALITY "
+        "AS ranked(product_id, position) "
+        "JOIN marketing_product AS r ON r.id = ranked.product_id)) "
+        "FROM marketing_dealerprice AS p, marketing_dealer AS d "
+        "WHERE m.dealer_product_id = p.id AND p.dealer_id = d.id")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_matching_product_dealer_dealer_id_order_id',
+                  table_name='matching_product_dealer')
+    op.drop_column('matching_product_dealer', 'card')
+    op.drop_column('matching_product_dealer', 'dealer_id')
@@ -0,0 +1,35 @@
+"""Matching job heartbeat and single unfinished job
+
+Revision ID: 0004_matching_job_heartbeat
+Revises: 0003_matching_cards
+Create Date: 2026-10-18 16:05:41.702519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_matching_job_heartbeat'
+down_revision: Union[str, None] = '0003_matching_cards'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('matching_job', sa.Column(
+        'heartbeat_at', sa.DateTime(timezone=True),
+        server_default=sa.text('now()'), nullable=False,
+        comment='Последняя отметка процесса задачи'))
+    op.create_index(
+        'ix_matching_job_unfinished', 'matching_job', [sa.text('(true)')],
+        unique=True, postgresql_where=sa.text(
+            "status IN ('queued', 'running') "
+            "OR (status = 'cancelled' AND finished_at IS NULL)"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_matching_job_unfinished', table_name='matching_job')
+    op.drop_column('matching_job', 'heartbeat_at')
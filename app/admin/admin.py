@@ -1,5 +1,8 @@
 from sqladmin import Admin, ModelView
 
+from app.db.database import SessionLocal
+from app.matching.cards import dealer_cards, product_cards, refresh_cards
+from app.matching.catalog_cache import bump_catalog_version
 from app.matching.models import (DelMatchingProductDealer,
                                  MatchingProductDealer,
                                  MatchPositiveProductDealer)
@@ -7,20 +10,69 @@ from app.products.models import (MarketingDealer, MarketingDealerPrice,
                                  MarketingProduct)
 
 
+class CatalogChangeMixin:
+    """Правка каталога в админке увеличивает версию каталога для кэша.
+
+    Пересчитываются только карточки очереди, которые ссылаются на
+    изменённую запись. Условие для них задаёт метод cards_filter
+    представления.
+    """
+
+    def cards_filter(self, model):
+        raise NotImplementedError
+
+    async def after_model_change(self, data, model, is_created, request):
+        async with SessionLocal() as db:
+            await bump_catalog_version(db, self.cards_filter(model))
+
+    async def after_model_delete(self, model, request):
+        async with SessionLocal() as db:
+            await bump_catalog_version(db, self.cards_filter(model))
+
+
+class MatchingCardsMixin:
+    """Правка строки в админке пересчитывает связанные карточки очереди.
+
+    В cards_key представление задаёт имя колонки «MatchingProductDealer»,
+    которая ссылается на id изменённой записи.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if getattr(MatchingProductDealer, getattr(cls, 'cards_key', ''),
+                   None) is None:
+            raise TypeError(f'{cls.__name__}: cards_key должен быть '
+                            'колонкой MatchingProductDealer')
+
+    async def after_model_change(self, data, model, is_created, request):
+        key = getattr(MatchingProductDealer, self.cards_key)
+        async with SessionLocal() as db:
+            await refresh_cards(db, key == model.id)
+            await db.commit()
+
+
 def setup_admin(app, engine):
     admin = Admin(app, engine, title='Админ Панель')
 
-    class MarketingDealerAdmin(ModelView, model=MarketingDealer):
+    class MarketingDealerAdmin(CatalogChangeMixin, ModelView,
+                               model=MarketingDealer):
         """Отображение Модели Маркетинг Дилер."""
 
         name = 'Дилер'
         name_plural = 'Дилеры'
+
+        def cards_filter(self, model):
+            return dealer_cards(model.id)
+
         column_labels = {MarketingDealer.name: 'Имя Дилера'}
         column_list = [MarketingDealer.id, MarketingDealer.name]
 
-    class MarketingDealerPriceAdmin(ModelView, model=MarketingDealerPrice):
+    class MarketingDealerPriceAdmin(MatchingCardsMixin, ModelView,
+                                    model=MarketingDealerPrice):
         """Отображение Модели Цена Дилера."""
 
+        cards_key = 'dealer_product_id'
+
         name = 'Продукты Дилера'
         name_plural = 'Продукты Дилеров'
         column_labels = {
@@ -43,7 +95,8 @@ def setup_admin(app, engine):
             MarketingDealerPrice.date
         ]
 
-    class MarketingProductAdmin(ModelView, model=MarketingProduct):
+    class MarketingProductAdmin(CatalogChangeMixin, ModelView,
+                                model=MarketingProduct):
         """Отображение Модели Просепт."""
 
         def colum_format(self, value):
@@ -51,6 +104,9 @@ def setup_admin(app, engine):
 
             return self.name[:40] if value else ''
 
+        def cards_filter(self, model):
+            return product_cards(model.id)
+
         name = 'Просепт'
         name_plural = 'Продукты Просепта'
         column_searchable_list = [
@@ -80,9 +136,12 @@ def setup_admin(app, engine):
             MarketingProduct.recommended_price,
         ]
 
-    class MatchingProductDealerAdmin(ModelView, model=MatchingProductDealer):
+    class MatchingProductDealerAdmin(MatchingCardsMixin, ModelView,
+                                     model=MatchingProductDealer):
         """Отображение модели матчинга."""
 
+        cards_key = 'id'
+
         name = 'Матчинг товаров'
         name_plural = 'Матчинг товаров'
         column_labels = {
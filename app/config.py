@@ -18,3 +18,67 @@ DB_TEST_PASSWORD = os.environ.get('DB_TEST_PASSWORD')
 DB_TEST_HOST = os.environ.get('DB_TEST_HOST')
 DB_TEST_PORT = os.environ.get('DB_TEST_PORT')
 DB_TEST_NAME = os.environ.get('DB_TEST_NAME')
+
+# Энкодер LaBSE, общий для обучения и предсказания
+ENCODER_NAME = os.environ.get('ENCODER_NAME', 'sentence-transformers/LaBSE')
+ENCODER_NUM_THREADS = int(os.environ.get('ENCODER_NUM_THREADS', 0))
+ENCODER_PREWARM = os.environ.get('ENCODER_PREWARM', 'false').lower() == 'true'
+# Бэкенд энкодера: torch, int8, torchscript или onnx
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'torch')
+ENCODER_CACHE_DIR = os.environ.get('ENCODER_CACHE_DIR', 'app/csv/encoders')
+
+# Размер батча для энкодера: ограничение по суммарному числу токенов
+EMBEDDING_TOKEN_BUDGET = int(os.environ.get('EMBEDDING_TOKEN_BUDGET', 4096))
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get('EMBEDDING_MAX_BATCH_SIZE', 256))
+
+# Векторный индекс каталога для предсказания: exact, ivf или пусто
+MATCHING_INDEX = os.environ.get('MATCHING_INDEX', '')
+MATCHING_CANDIDATES = int(os.environ.get('MATCHING_CANDIDATES', 50))
+
+# Кэш эмбеддингов названий дилеров (пустой путь отключает кэш)
+EMBEDDING_CACHE_PATH = os.environ.get(
+    'EMBEDDING_CACHE_PATH', 'app/csv/embedding_cache.sqlite3')
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 500000))
+
+# Параллельная нормализация и векторизация: число процессов и максимальный
+# размер чанка. Данные одного вызова делятся между процессами поровну
+MATCHING_WORKERS = int(os.environ.get('MATCHING_WORKERS', 1))
+MATCHING_CHUNK_SIZE = int(os.environ.get('MATCHING_CHUNK_SIZE', 2000))
+
+# Потоковое предсказание: количество строк дилеров в одном чанке
+MATCHING_PREDICT_CHUNK_SIZE = int(
+    os.environ.get('MATCHING_PREDICT_CHUNK_SIZE', 1000))
+
+# Модель матчинга: multiclass (по всей строке расстояний) или reranker
+# (переранжирование MATCHING_CANDIDATES кандидатов, lambdarank или binary)
+MATCHING_MODEL = os.environ.get('MATCHING_MODEL', 'multiclass')
+MATCHING_RERANKER_OBJECTIVE = os.environ.get(
+    'MATCHING_RERANKER_OBJECTIVE', 'lambdarank')
+
+# Фоновые задачи перематчинга: количество процессов пула, как часто
+# процесс задачи обновляет heartbeat_at и через сколько секунд без отметки
+# задача считается прерванной
+MATCHING_JOB_WORKERS = int(os.environ.get('MATCHING_JOB_WORKERS', 1))
+MATCHING_JOB_HEARTBEAT_SECONDS = float(
+    os.environ.get('MATCHING_JOB_HEARTBEAT_SECONDS', 60))
+MATCHING_JOB_STALE_SECONDS = int(
+    os.environ.get('MATCHING_JOB_STALE_SECONDS', 1800))
+
+# Онлайн-предсказание: микро-батчинг одновременных запросов
+MATCHING_BATCH_MAX_SIZE = int(os.environ.get('MATCHING_BATCH_MAX_SIZE', 32))
+MATCHING_BATCH_MAX_WAIT_MS = float(
+    os.environ.get('MATCHING_BATCH_MAX_WAIT_MS', 5))
+
+# Максимальный размер страницы очереди карточек оператора
+MATCHING_PAGE_MAX_SIZE = int(os.environ.get('MATCHING_PAGE_MAX_SIZE', 500))
+
+# Аренда карточек оператором: срок аренды и период очистки просроченной, сек
+MATCHING_LEASE_SECONDS = int(os.environ.get('MATCHING_LEASE_SECONDS', 600))
+MATCHING_LEASE_SWEEP_SECONDS = float(
+    os.environ.get('MATCHING_LEASE_SWEEP_SECONDS', 60))
+
+# Потоковая выгрузка NDJSON/CSV: строк в одном чанке чтения из БД
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# Кэш каталога «Просепт» и дилеров: как часто сверять версию каталога, сек
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', 30))
@@ -1,9 +1,14 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.admin.admin import setup_admin
-from app.config import CORS_ORIGINS
-from app.db.database import engine
+from app.config import CORS_ORIGINS, ENCODER_PREWARM
+from app.db.database import SessionLocal, engine
+from app.matching.crud import sync_order_sequence
+from app.matching.jobs import fail_interrupted_jobs, shutdown_executor
+from app.matching.leases import start_lease_sweeper, stop_lease_sweeper
+from app.matching.parallel import shutdown_pools
 from app.matching.routers import api_version1
 
 app = FastAPI(title='FastAPI Prosept Dealer')
@@ -15,9 +20,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PATCH", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Lease-Expires"],
 )
 
 setup_admin(app, engine)
 
 
 app.include_router(api_version1)
+
+
+@app.on_event('startup')
+async def prewarm_encoder():
+    """Заранее загружаем энкодер LaBSE, если это включено в настройках."""
+
+    if ENCODER_PREWARM:
+        # Импорт внутри функции, что-бы не тянуть torch без необходимости
+        from app.matching.encoder import warmup_encoder
+        from app.matching.predictor import warmup_predictor
+
+        await run_in_threadpool(warmup_encoder)
+        await run_in_threadpool(warmup_predictor)
+
+
+@app.on_event('startup')
+async def recover_matching_jobs():
+    """Задачи перематчинга, процесс которых перестал отмечаться, прерваны."""
+
+    async with SessionLocal() as db:
+        await fail_interrupted_jobs(db)
+
+
+@app.on_event('startup')
+async def start_matching_queue():
+    """Готовим последовательность поля order и очистку аренды карточек."""
+
+    async with SessionLocal() as db:
+        await sync_order_sequence(db)
+    start_lease_sweeper()
+
+
+@app.on_event('shutdown')
+async def stop_matching_jobs():
+    shutdown_executor()
+    await run_in_threadpool(shutdown_pools)
+
+
+@app.on_event('shutdown')
+async def stop_matching_queue():
+    await stop_lease_sweeper()
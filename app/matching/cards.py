@@ -0,0 +1,163 @@
+"""Готовые карточки очереди оператора.
+
+Каждая строка «MatchingProductDealer» хранит в поле card карточку в
+формате ответа GET /api/v1/matching: карточку дилера с названием дилера
+и пять товаров «Просепт» в порядке product_ids. Страница очереди
+читается одним запросом по индексу (order, id) без JOIN, а JSON из БД
+отдаётся клиенту как есть.
+
+Карточка удаляется вместе со строкой очереди при принятии и удалении,
+кнопка «Отложить» и аренда её не меняют. Карточки пересчитываются
+функцией refresh_cards после загрузки и перематчинга, после изменения
+каталога (bump_catalog_version) и после правки карточек в админке.
+После правки одного товара или дилера пересчитываются только карточки,
+которые на него ссылаются (product_cards, dealer_cards).
+"""
+from typing import List, Optional, Tuple
+
+from fastapi.responses import Response
+from sqlalchemy import Row, Text, cast, func, literal, tuple_, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.products.models import (MarketingDealer, MarketingDealerPrice,
+                                 MarketingProduct)
+
+from .models import MatchingProductDealer
+
+
+def card_expression():
+    """SQL-выражение карточки для строки «MatchingProductDealer».
+
+    Используется в UPDATE вместе с таблицами карточек и названий дилеров.
+    """
+
+    ranked = (func.unnest(MatchingProductDealer.product_ids)
+              .table_valued('product_id', with_ordinality='position')
+              .render_derived(name='ranked'))
+    products = (
+        select(func.coalesce(
+            func.jsonb_agg(aggregate_order_by(
+                func.jsonb_build_object(
+                    'id', MarketingProduct.id,
+                    'article', MarketingProduct.article,
+                    'cost', MarketingProduct.cost,
+                    'name_1c', MarketingProduct.name_1c),
+                ranked.c.position)),
+            literal([], type_=MatchingProductDealer.card.type)))
+        .select_from(ranked)
+        .join(MarketingProduct, MarketingProduct.id == ranked.c.product_id)
+        .scalar_subquery())
+
+    return func.jsonb_build_object(
+        'id', MatchingProductDealer.id,
+        'dealer_product', func.jsonb_build_object(
+            'id', MarketingDealerPrice.id,
+            'dealer_name', MarketingDealer.name,
+            'product_name', MarketingDealerPrice.product_name,
+            'price', MarketingDealerPrice.price,
+            'product_url', MarketingDealerPrice.product_url),
+        'products', products)
+
+
+def product_cards(product_id: int):
+    """Условие для карточек, среди товаров которых есть product_id."""
+
+    return MatchingProductDealer.product_ids.any(product_id)
+
+
+def dealer_cards(dealer_id: int):
+    """Условие для карточек товаров дилера dealer_id."""
+
+    return MarketingDealerPrice.dealer_id == dealer_id
+
+
+async def refresh_cards(db: AsyncSession, *criteria) -> int:
+    """Пересчитываем карточки очереди одной командой UPDATE.
+
+    Транзакция не фиксируется, это делает вызывающий код.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - criteria: Условия отбора строк «MatchingProductDealer» или
+          «MarketingDealerPrice». Без условий пересчитываются все карточки.
+
+    Returns:
+        - int: Количество пересчитанных карточек.
+    """
+
+    result = await db.execute(
+        update(MatchingProductDealer)
+        .where(MatchingProductDealer.dealer_product_id == MarketingDealerPrice.id,
+               MarketingDealerPrice.dealer_id == MarketingDealer.id,
+               *criteria)
+        .values(card=card_expression(),
+                dealer_id=MarketingDealerPrice.dealer_id)
+        .execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+def cards_query(
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        dealer_id: Optional[int] = None
+):
+    """Запрос готовых карточек страницы очереди в порядке (order, id).
+
+    Args:
+        - limit (Optional[int]): Количество карточек. None - все карточки.
+        - after (Optional[Tuple[int, int]]): (order, id) последней
+          карточки предыдущей страницы.
+        - dealer_id (Optional[int]): Только карточки этого дилера.
+    """
+
+    query = (
+        select(MatchingProductDealer.order, MatchingProductDealer.id,
+               cast(MatchingProductDealer.card, Text).label('card'))
+        .order_by(MatchingProductDealer.order, MatchingProductDealer.id))
+    if after is not None:
+        query = query.where(tuple_(MatchingProductDealer.order,
+                                   MatchingProductDealer.id) > tuple_(*after))
+    if dealer_id is not None:
+        query = query.where(MatchingProductDealer.dealer_id == dealer_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+async def read_cards(
+        db: AsyncSession,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        dealer_id: Optional[int] = None
+) -> List[Row]:
+    """Готовые карточки страницы очереди.
+
+    Карточки, которые ещё не рассчитаны (например, строки добавлены в
+    обход load_data и перематчинга), рассчитываются при чтении. С
+    фильтром по дилеру такие строки не находятся, пока у них нет dealer_id.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - limit, after, dealer_id: См. cards_query.
+
+    Returns:
+        - List[Row]: Строки (order, id, card), card - JSON карточки.
+    """
+
+    query = cards_query(limit, after, dealer_id)
+    rows = (await db.execute(query)).all()
+    missing = [row.id for row in rows if row.card is None]
+    if missing:
+        await refresh_cards(db, MatchingProductDealer.id.in_(missing))
+        await db.commit()
+        rows = (await db.execute(query)).all()
+    return [row for row in rows if row.card is not None]
+
+
+def cards_response(rows: List[Row]) -> Response:
+    """JSON-массив из готовых карточек без повторной сериализации."""
+
+    return Response(content='[' + ','.join(row.card for row in rows) + ']',
+                    media_type='application/json')
@@ -0,0 +1,182 @@
+"""Кэш каталога «Просепт» и названий дилеров в памяти процесса.
+
+Каталог меняется только при загрузке данных (load_data.py) и при
+правке в админке, а читается при отрисовке каждой карточки оператора.
+Кэш хранит компактные неизменяемые записи и сверяет номер версии из
+таблицы «CatalogVersion» не чаще раза в CATALOG_CACHE_TTL секунд. Если
+версия изменилась, каталог перечитывается целиком. Тот, кто меняет
+каталог, вызывает bump_catalog_version, она же пересчитывает готовые
+карточки очереди.
+"""
+import math
+import time
+from typing import Dict, Iterable, NamedTuple
+
+from sqlalchemy import ARRAY, Integer, any_, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.config import CATALOG_CACHE_TTL
+from app.products.models import (CatalogVersion, MarketingDealer,
+                                 MarketingProduct)
+
+from .cards import refresh_cards
+
+CATALOG_VERSION_ID = 1
+
+
+class ProductCard(NamedTuple):
+    """Поля товара «Просепт», которые нужны для карточки оператора."""
+
+    id: int
+    article: str
+    cost: float
+    name_1c: str
+
+    def to_dict(self) -> Dict:
+        return self._asdict()
+
+
+PRODUCT_COLUMNS = [getattr(MarketingProduct, name)
+                   for name in ProductCard._fields]
+
+
+async def get_catalog_version(db: AsyncSession) -> int:
+    """Текущая версия каталога, 0 если каталог ещё не загружался."""
+
+    version = await db.scalar(select(CatalogVersion.version).where(
+        CatalogVersion.id == CATALOG_VERSION_ID))
+    return version or 0
+
+
+async def bump_catalog_version(db: AsyncSession, *criteria) -> int:
+    """Увеличиваем версию каталога после его изменения.
+
+    Кэш текущего процесса сбрасывается сразу, остальные процессы
+    перечитают каталог не позже чем через CATALOG_CACHE_TTL секунд.
+    Готовые карточки очереди пересчитываются в той же транзакции.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - criteria: Условия отбора карточек, которые затронуло изменение,
+          см. refresh_cards. Без условий пересчитываются все карточки.
+
+    Returns:
+        - int: Новая версия каталога.
+    """
+
+    query = insert(CatalogVersion).values(id=CATALOG_VERSION_ID, version=1)
+    query = query.on_conflict_do_update(
+        index_elements=[CatalogVersion.id],
+        set_={'version': CatalogVersion.version + 1,
+              'updated_at': func.now()},
+    ).returning(CatalogVersion.version)
+    version = await db.scalar(query)
+    await refresh_cards(db, *criteria)
+    await db.commit()
+
+    catalog_cache.invalidate()
+    return version
+
+
+class CatalogCache:
+    """Кэш товаров «Просепт» и названий дилеров со сверкой версии.
+
+    Args:
+        - ttl (float): Как часто сверять версию каталога, в секундах.
+    """
+
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Сбрасываем кэш, при следующем обращении каталог перечитается."""
+
+        self.products: Dict[int, ProductCard] = {}
+        self.dealers: Dict[int, str] = {}
+        self.version = -1
+        self.checked_at = -math.inf
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Перечитываем каталог, если с прошлой сверки изменилась версия."""
+
+        now = time.monotonic()
+        if now - self.checked_at < self.ttl:
+            return
+
+        version = await get_catalog_version(db)
+        if version != self.version:
+            products = await db.execute(select(*PRODUCT_COLUMNS))
+            dealers = await db.execute(
+                select(MarketingDealer.id, MarketingDealer.name))
+            # словари заменяются целиком, читатели видят старую или
+            # новую версию, но не их смесь
+            self.products = {row.id: ProductCard(*row) for row in products}
+            self.dealers = dict(dealers.all())
+            self.version = version
+        self.checked_at = now
+
+    async def get_products(
+        self, db: AsyncSession, ids: Iterable[int]
+    ) -> Dict[int, ProductCard]:
+        """Товары «Просепт» по списку ID.
+
+        Товары, которых нет в кэше (например, добавленные без смены
+        версии), читаются из БД одним запросом и добавляются в кэш.
+
+        Args:
+            - db (AsyncSession): Асинхронная сессия для подключения к БД.
+            - ids (Iterable[int]): ID товаров, могут повторяться.
+
+        Returns:
+            - Dict[int, ProductCard]: Найденные товары по ID.
+        """
+
+        await self.refresh(db)
+        products = self.products
+        ids = set(ids)
+        found = {id: products[id] for id in ids if id in products}
+        missing = sorted(ids - found.keys())
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            result = await db.execute(select(*PRODUCT_COLUMNS).where(
+                MarketingProduct.id == any_(literal(missing, ARRAY(Integer)))))
+            for row in result:
+                found[row.id] = products[row.id] = ProductCard(*row)
+        return found
+
+    async def get_dealer_name(self, db: AsyncSession, id: int) -> str:
+        """Название дилера по ID."""
+
+        await self.refresh(db)
+        name = self.dealers.get(id)
+        if name is not None:
+            self.hits += 1
+            return name
+
+        self.misses += 1
+        name = await db.scalar(
+            select(MarketingDealer.name).where(MarketingDealer.id == id))
+        if name is not None:
+            self.dealers[id] = name
+        return name
+
+    def stats(self) -> Dict[str, int]:
+        """Версия, размер кэша, количество попаданий и промахов."""
+
+        return {
+            'version': self.version,
+            'products': len(self.products),
+            'dealers': len(self.dealers),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+catalog_cache = CatalogCache()
@@ -1,34 +1,97 @@
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from fastapi import HTTPException
-from sqlalchemy import and_, asc, delete, func, update
+from sqlalchemy import (CTE, ColumnElement, Row, Select, asc, delete, func,
+                        literal, or_, text, update)
+from sqlalchemy.dialects.postgresql import Insert, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.products.models import (MarketingDealer, MarketingDealerPrice,
                                  MarketingProduct)
 
-from .models import (DelMatchingProductDealer, MatchingProductDealer,
-                     MatchPositiveProductDealer, Statistics)
+from .models import (ORDER_SEQUENCE, DelMatchingProductDealer,
+                     MatchingProductDealer, MatchPositiveProductDealer,
+                     Statistics)
 
 ModelType = Union[MarketingProduct, MarketingDealerPrice, Statistics]
 
+# Оператор по умолчанию, если клиент не передал заголовок X-Operator-Id
+DEFAULT_OPERATOR_ID = 1
+STATISTICS_COLUMNS = ('accepted_cards', 'delete_cards', 'postponed_cards')
 
-async def get_data_matching_product_dealer(
-        db: AsyncSession
-) -> Optional[MatchingProductDealer]:
-    """Получаем все объекты из модели «MatchingProductDealer».
+
+def encode_cursor(order: int, id: int) -> str:
+    """Курсор страницы: значения (order, id) последней карточки."""
+
+    return f'{order}:{id}'
+
+
+def decode_cursor(after: str) -> Tuple[int, int]:
+    """Разбираем курсор страницы.
+
+    Raises:
+        - HTTPException: 422, если курсор не в формате «order:id».
+    """
+
+    try:
+        order, id = after.split(':')
+        return int(order), int(id)
+    except ValueError:
+        raise HTTPException(status_code=422,
+                            detail='Параметр after должен быть в формате order:id')
+
+
+def positive_pairs_query() -> Select:
+    """Запрос принятых оператором пар с карточками дилера и «Просепт».
+
+    Returns:
+        - Select: Строки (MatchPositiveProductDealer, MarketingDealerPrice,
+          название дилера, MarketingProduct) в порядке id.
+    """
+
+    return (
+        select(MatchPositiveProductDealer, MarketingDealerPrice,
+               MarketingDealer.name, MarketingProduct)
+        .join(MarketingDealerPrice,
+              MatchPositiveProductDealer.dealer_product_id == MarketingDealerPrice.id)
+        .join(MarketingDealer,
+              MarketingDealerPrice.dealer_id == MarketingDealer.id)
+        .join(MarketingProduct,
+              MatchPositiveProductDealer.product_id == MarketingProduct.id)
+        .order_by(asc(MatchPositiveProductDealer.id)))
+
+
+async def count_matching_cards(
+        db: AsyncSession,
+        dealer_id: Optional[int] = None
+) -> int:
+    """Количество карточек в очереди оператора.
+
+    Без фильтра по дилеру возвращается оценка из статистики Postgres
+    (pg_class.reltuples), она не требует чтения таблицы. Если таблица ещё
+    не анализировалась, количество считается точно.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - dealer_id (Optional[int]): Только карточки этого дилера.
 
     Returns:
-        - Optional[MatchingProductDealer]: Объект модели «MatchingProductDealer» или None.
+        - int: Точное или приблизительное количество карточек.
     """
 
-    result = await db.execute(select(MatchingProductDealer).
-                              order_by(asc(MatchingProductDealer.order)))
-    return result.scalars().all()
+    if dealer_id is None:
+        estimate = await db.scalar(
+            select(text('reltuples::bigint')).select_from(text('pg_class'))
+            .where(text('oid = CAST(:table AS regclass)'))
+            .params(table=MatchingProductDealer.__tablename__))
+        if estimate is not None and estimate >= 0:
+            return estimate
+
+    query = select(func.count()).select_from(MatchingProductDealer)
+    if dealer_id is not None:
+        query = query.where(MatchingProductDealer.dealer_id == dealer_id)
+    return await db.scalar(query)
 
 
 async def get_data_by_id(db: AsyncSession, model: ModelType, id: int) -> Optional[ModelType]:
@@ -47,195 +110,430 @@ async def get_data_by_id(db: AsyncSession, model: ModelType, id: int) -> Optiona
     return result.scalars().one_or_none()
 
 
-async def get_dealer_name(db: AsyncSession, id: int) -> str:
-    """Получаем название дилера из модели «MarketingDealer» по значению ID.
+def statistics_increment(column: str, operator_id: int,
+                         decided: Optional[CTE] = None) -> Insert:
+    """Команда атомарного увеличения счётчика оператора в «Statistics».
+
+    INSERT ... ON CONFLICT DO UPDATE SET column = column + 1 без
+    предварительного чтения, поэтому одновременные действия не теряют
+    увеличений. У каждого оператора своя строка (id - ID оператора), она
+    создаётся при первом действии, и операторы не ждут блокировку одной
+    общей строки.
 
     Args:
-        - db (AsyncSession): Асинхронная сессия для подключения к БД.
-        - id (int): ID объекта в модели «MarketingDealer».
+        - column (str): Поле из модели «Statistics».
+        - operator_id (int): ID оператора.
+        - decided (Optional[CTE]): Строки, изменённые действием оператора.
+          Если передано, счётчик увеличивается, только когда CTE вернул
+          строку, иначе - всегда.
 
-    Returns:
-        - str: Поле name из модели «MarketingDealer».
+    Raises:
+        - ValueError: Неизвестное поле статистики.
+    """
+
+    if column not in STATISTICS_COLUMNS:
+        raise ValueError(f'Неизвестное поле статистики: {column}')
+
+    if decided is None:
+        query = insert(Statistics).values({'id': operator_id, column: 1})
+    else:
+        query = insert(Statistics).from_select(
+            ['id', column],
+            select(literal(operator_id), literal(1)).select_from(decided))
+
+    counter = getattr(Statistics, column)
+    return query.on_conflict_do_update(
+        index_elements=[Statistics.id],
+        set_={column: func.coalesce(counter, 0) + 1},
+    ).returning(counter)
+
+
+def lease_available(operator_id: int) -> ColumnElement[bool]:
+    """Условие: карточка свободна или арендована этим оператором.
+
+    Просроченная аренда считается свободной, даже если фоновая очистка
+    ещё не сняла её.
     """
 
-    dealer = await db.execute(select(MarketingDealer).filter(
-        MarketingDealer.id == id))
-    dealer = dealer.scalars().one_or_none()
-    return dealer.name
+    return or_(MatchingProductDealer.leased_until.is_(None),
+               MatchingProductDealer.leased_until < func.now(),
+               MatchingProductDealer.leased_by == operator_id)
 
 
-async def get_5_prosept_products(
+async def raise_decision_error(
         db: AsyncSession,
-        list_ids: List[int]
-) -> List[MarketingProduct]:
-    """Получаем 5 объектов модели «MarketingProduct», по списку с ID.
+        dealer_product_id: int,
+        operator_id: int,
+        detail: str = 'Объект не найден'
+) -> None:
+    """Ошибка для решения оператора, которое не изменило ни одной строки.
+
+    Откатываем транзакцию и выясняем причину отдельным запросом, только
+    на этом пути.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
-        - list_ids (List[int]): Список ID из модели «MatchingProductDealer».
+        - dealer_product_id (int): ID карточки дилера.
+        - operator_id (int): ID оператора.
+        - detail (str): Текст ошибки, если карточка есть и доступна оператору.
 
-    Returns:
-        - List[MarketingProduct]: Список из 5 объектов модели «MarketingProduct».
+    Raises:
+        - HTTPException: 404, если карточки нет в очереди, 409, если её
+          арендовал другой оператор, иначе 404 с текстом detail.
     """
 
-    prosept_products = await db.execute(select(MarketingProduct).where(
-        MarketingProduct.id.in_(list_ids)))
-    prosept_products = prosept_products.scalars().all()
-    return prosept_products
+    await db.rollback()
+    available = await db.scalar(
+        select(lease_available(operator_id)).where(
+            MatchingProductDealer.dealer_product_id == dealer_product_id))
+    if available is None:
+        raise HTTPException(status_code=404, detail='Объект не найден')
+    if not available:
+        raise HTTPException(status_code=409,
+                            detail='Карточку обрабатывает другой оператор')
+    raise HTTPException(status_code=404, detail=detail)
 
 
 async def create_dealer_product(
         db: AsyncSession,
         dealer_product_id: int,
-        prosept_product_id: int
-) -> None:
+        prosept_product_id: int,
+        operator_id: int = DEFAULT_OPERATOR_ID
+) -> Row:
     """Обработка POST-запроса.
 
-    - Создаем новую запись в таблице «MatchPositiveProductDealer»
+    Одной командой в одной транзакции:
     - Удаляем запись из «MatchingProductDealer».
+    - Создаем новую запись в таблице «MatchPositiveProductDealer».
+    - Увеличиваем счётчик принятых карточек оператора.
+    - Возвращаем созданную запись вместе с карточкой и названием дилера.
+
+    Если карточку одновременно обрабатывают два оператора, второй получит
+    404, а не дубль в «MatchPositiveProductDealer». Карточку, арендованную
+    другим оператором, принять нельзя (409).
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
         - dealer_product_id (int): ID карточки дилера.
         - prosept_product_id (int): ID карточки товара от Просепт.
+        - operator_id (int): ID оператора.
+
+    Returns:
+        - Row: ID созданной записи, ID товара «Просепт», объект
+          «MarketingDealerPrice» и название дилера.
     """
 
-    create_object = await db.execute(select(MatchingProductDealer).where(
-        MatchingProductDealer.dealer_product_id == dealer_product_id))
-    create_object = create_object.scalars().one_or_none()
+    deleted = (
+        delete(MatchingProductDealer)
+        .where(MatchingProductDealer.dealer_product_id == dealer_product_id,
+               MatchingProductDealer.product_ids.any(prosept_product_id),
+               lease_available(operator_id))
+        .returning(MatchingProductDealer.dealer_product_id)
+        .cte('deleted'))
+    inserted = (
+        insert(MatchPositiveProductDealer)
+        .from_select(['dealer_product_id', 'product_id'],
+                     select(deleted.c.dealer_product_id,
+                            literal(prosept_product_id)))
+        .returning(MatchPositiveProductDealer.id,
+                   MatchPositiveProductDealer.dealer_product_id,
+                   MatchPositiveProductDealer.product_id)
+        .cte('inserted'))
+    counted = statistics_increment(
+        'accepted_cards', operator_id, inserted).cte('counted')
 
-    if not create_object:
-        raise HTTPException(status_code=404, detail='Объект не найден')
-    elif prosept_product_id not in create_object.product_ids:
-        raise HTTPException(
-            status_code=404,
+    result = await db.execute(
+        select(inserted.c.id, inserted.c.product_id, MarketingDealerPrice,
+               MarketingDealer.name)
+        .add_cte(counted)
+        .join(MarketingDealerPrice,
+              MarketingDealerPrice.id == inserted.c.dealer_product_id)
+        .join(MarketingDealer,
+              MarketingDealerPrice.dealer_id == MarketingDealer.id))
+    created = result.one_or_none()
+
+    if created is None:
+        await raise_decision_error(
+            db, dealer_product_id, operator_id,
             detail=('Для параметра prosept_product_id передайте одно из '
                     'значений ID, которые есть в списке product_ids'))
 
-    product_id = await get_data_by_id(db, MarketingProduct, prosept_product_id)
-    positive_product_dealer = MatchPositiveProductDealer(
-        dealer_product_id=create_object.dealer_product_id,
-        product_id=product_id.id
-    )
-
-    # Добавляем объекты в сеанс
-    db.add(positive_product_dealer)
-
-    # Удаляем из таблицы MatchingProductDealer
-    await delete_dealer_product(db, dealer_product_id)
-
-    # Сохраняем изменения в базе данных
     await db.commit()
+    return created
 
 
-async def patch_dealer_product(db: AsyncSession, id: int) -> None:
+async def patch_dealer_product(db: AsyncSession, id: int,
+                               operator_id: int = DEFAULT_OPERATOR_ID) -> None:
     """Обработка PATCH-запроса.
 
-    Обновляем поле order в модели «MatchingProductDealer». Что-бы перенести
-    объект в конец списка.
+    Одной командой в одной транзакции:
+    - Записываем в поле order следующее значение последовательности, что-бы
+      при сортировке по этому полю объект оказался в конце списка.
+    - Снимаем аренду карточки, её сможет взять любой оператор.
+    - Увеличиваем счётчик отложенных карточек оператора.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
         - id (int): ID карточки дилера.
+        - operator_id (int): ID оператора.
     """
 
-    max_order = await db.execute(func.max(MatchingProductDealer.order))
-    max_order = max_order.scalar()
+    updated = (
+        update(MatchingProductDealer)
+        .where(MatchingProductDealer.dealer_product_id == id,
+               lease_available(operator_id))
+        .values(order=ORDER_SEQUENCE.next_value(), leased_by=None,
+                leased_until=None)
+        .returning(MatchingProductDealer.id)
+        .cte('updated'))
+    counted = statistics_increment(
+        'postponed_cards', operator_id, updated).cte('counted')
+
+    updated_id = await db.scalar(select(updated.c.id).add_cte(counted))
+    if updated_id is None:
+        await raise_decision_error(db, id, operator_id)
+    await db.commit()
+
+
+async def sync_order_sequence(db: AsyncSession) -> None:
+    """Сдвигаем последовательность поля order за максимальное значение.
 
-    await db.execute(update(MatchingProductDealer).
-                     where(MatchingProductDealer.dealer_product_id == id).
-                     values(order=max_order+1))
+    Нужно для очереди, заполненной с явными значениями order. Максимум
+    читается по индексу (order, id), без чтения всей таблицы.
+    """
+
+    max_order = select(func.max(MatchingProductDealer.order)).scalar_subquery()
+    await db.execute(select(func.setval(
+        ORDER_SEQUENCE.name,
+        func.greatest(func.coalesce(max_order, 1),
+                      text(f'(SELECT last_value FROM {ORDER_SEQUENCE.name})')))))
     await db.commit()
 
 
-async def delete_dealer_product(db: AsyncSession, id: int) -> None:
-    """Удаляем объект «MatchingProductDealer», по значению поля dealer_product_id.
+async def update_statistics(db: AsyncSession, column: str,
+                            operator_id: int = DEFAULT_OPERATOR_ID) -> int:
+    """Атомарно увеличиваем счётчик оператора в модели «Statistics».
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
-        - id (int): ID карточки дилера.
-    """
-
-    object_to_delete = await db.execute(select(MatchingProductDealer).where(
-        MatchingProductDealer.dealer_product_id == id))
+        - column (str): Поле из модели «Statistics».
+        - operator_id (int): ID оператора.
 
-    if not object_to_delete.scalars().one_or_none():
-        raise HTTPException(status_code=404, detail='Объект не найден')
+    Returns:
+        - int: Новое значение счётчика.
+    """
 
-    await db.execute(delete(MatchingProductDealer).where(
-        MatchingProductDealer.dealer_product_id == id))
+    value = await db.scalar(statistics_increment(column, operator_id))
     await db.commit()
+    return value
 
 
-async def update_statistics(db: AsyncSession, column: str) -> None:
-    """Обновляем статистику в полученном поле модели «Statistics».
+async def get_statistics_totals(
+        db: AsyncSession,
+        operator_id: Optional[int] = None
+) -> Dict[str, int]:
+    """Суммы счётчиков статистики одним запросом.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
-        - column (str): Поле из модели «Statistics».
+        - operator_id (Optional[int]): ID оператора. None - по всем операторам.
+
+    Returns:
+        - Dict[str, int]: Значение каждого поля из STATISTICS_COLUMNS.
     """
 
-    id = 1  # В теории тут можно будет передавать ID оператора
-    values = await db.scalar(select(getattr(Statistics, column)).
-                             where(Statistics.id == id))
+    query = select(*[
+        func.coalesce(func.sum(getattr(Statistics, column)), 0).label(column)
+        for column in STATISTICS_COLUMNS])
+    if operator_id is not None:
+        query = query.where(Statistics.id == operator_id)
 
-    await db.execute(update(Statistics).
-                     where(Statistics.id == id).
-                     values({column: values + 1}))
-    await db.commit()
+    result = await db.execute(query)
+    return dict(result.one()._mapping)
 
 
-async def save_delete_dealer_product(db: AsyncSession, id: int) -> None:
+async def save_delete_dealer_product(
+        db: AsyncSession,
+        id: int,
+        operator_id: int = DEFAULT_OPERATOR_ID
+) -> None:
     """Обработка DELETE-запроса.
 
-    - Сохраняем новый объект в модели «DelMatchingProductDealer».
-    - Удаляем объект в модели «MatchingProductDealer», по значению поля dealer_product_id.
+    Одной командой в одной транзакции:
+    - Удаляем объект в модели «MatchingProductDealer», по значению поля
+      dealer_product_id.
+    - Сохраняем его в модели «DelMatchingProductDealer».
+    - Увеличиваем счётчик неподходящих карточек оператора.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
         - id (int): ID карточки дилера.
+        - operator_id (int): ID оператора.
     """
 
-    cur_object = await db.execute(select(MatchingProductDealer).where(
-        MatchingProductDealer.dealer_product_id == id))
-    cur_object = cur_object.scalars().one_or_none()
+    deleted = (
+        delete(MatchingProductDealer)
+        .where(MatchingProductDealer.dealer_product_id == id,
+               lease_available(operator_id))
+        .returning(MatchingProductDealer.dealer_product_id,
+                   MatchingProductDealer.product_ids)
+        .cte('deleted'))
+    inserted = (
+        insert(DelMatchingProductDealer)
+        .from_select(['dealer_product_id', 'product_ids'],
+                     select(deleted.c.dealer_product_id,
+                            deleted.c.product_ids))
+        .returning(DelMatchingProductDealer.id)
+        .cte('inserted'))
+    counted = statistics_increment(
+        'delete_cards', operator_id, inserted).cte('counted')
+
+    inserted_id = await db.scalar(select(inserted.c.id).add_cte(counted))
+    if inserted_id is None:
+        await raise_decision_error(db, id, operator_id)
+    await db.commit()
 
-    if not cur_object:
-        raise HTTPException(status_code=404, detail='Объект не найден')
 
-    new_del_matching_product_dealer = DelMatchingProductDealer(
-        dealer_product_id=cur_object.dealer_product_id,
-        product_ids=cur_object.product_ids
-    )
+# Действия оператора в пакетном запросе и поля статистики для них
+DECISION_COLUMNS = {
+    'accept': 'accepted_cards',
+    'postpone': 'postponed_cards',
+    'delete': 'delete_cards',
+}
 
-    db.add(new_del_matching_product_dealer)
-    await delete_dealer_product(db, id)
-    await db.commit()
 
+def statistics_add(operator_id: int, deltas: Dict[str, int]) -> Insert:
+    """Команда увеличения нескольких счётчиков оператора на deltas."""
 
-async def get_match_positive_product_dealer(
-        db: AsyncSession,
-        dealer_product_id: int,
-        prosept_product_id: int
-) -> Optional[MatchPositiveProductDealer]:
+    query = insert(Statistics).values(id=operator_id, **deltas)
+    return query.on_conflict_do_update(
+        index_elements=[Statistics.id],
+        set_={column: func.coalesce(getattr(Statistics, column), 0) +
+              getattr(query.excluded, column) for column in deltas})
+
+
+def decision_status(
+        decision: Dict,
+        card: Optional[Tuple[List[int], bool]],
+        repeated: bool
+) -> Tuple[int, Optional[str]]:
+    """Можно ли применить решение из пакета.
+
+    Args:
+        - decision (Dict): Решение оператора.
+        - card (Optional[Tuple]): product_ids карточки и доступна ли она
+          оператору, None - карточки нет в очереди.
+        - repeated (bool): Карточка уже встречалась в пакете.
+
+    Returns:
+        - Tuple[int, Optional[str]]: 200 и None или код и текст ошибки.
     """
-    Получаем объект из модели «MatchPositiveProductDealer».
+
+    if repeated:
+        return 409, 'Карточка повторяется в запросе'
+    if card is None:
+        return 404, 'Объект не найден'
+    product_ids, available = card
+    if not available:
+        return 409, 'Карточку обрабатывает другой оператор'
+    if (decision['action'] == 'accept' and
+            decision['prosept_id'] not in product_ids):
+        return 404, ('Для параметра prosept_id передайте одно из значений '
+                     'ID, которые есть в списке product_ids')
+    return 200, None
+
+
+async def apply_decisions(
+        db: AsyncSession,
+        decisions: List[Dict],
+        operator_id: int = DEFAULT_OPERATOR_ID
+) -> List[Dict]:
+    """Обработка пакета решений оператора в одной транзакции.
+
+    - Все карточки пакета читаются и блокируются одним запросом.
+    - Решения, которые нельзя применить, получают свой статус ошибки и
+      не мешают остальным.
+    - Принятые и удалённые карточки сохраняются массовыми INSERT, из
+      очереди удаляются одним DELETE, отложенные переносятся одним UPDATE.
+    - Статистика оператора обновляется одной командой на сумму решений.
+
+    Количество запросов не зависит от размера пакета.
 
     Args:
         - db (AsyncSession): Асинхронная сессия для подключения к БД.
-        - dealer_product_id (int): ID карточки дилера.
-        - prosept_product_id (int): ID карточки товара «Просепт».
+        - decisions (List[Dict]): Решения с ключами dealer_product_id,
+          action (accept, postpone или delete) и prosept_id для accept.
+        - operator_id (int): ID оператора.
 
     Returns:
-        - Optional[MatchPositiveProductDealer]: Объект «MatchPositiveProductDealer» или None.
+        - List[Dict]: Результат для каждого решения в порядке запроса:
+          dealer_product_id, action, status (200, 404 или 409), detail и
+          id созданной записи «MatchPositiveProductDealer» для accept.
     """
 
-    model = MatchPositiveProductDealer
+    ids = [decision['dealer_product_id'] for decision in decisions]
     result = await db.execute(
-        select(model).
-        filter(
-            and_(model.dealer_product_id == dealer_product_id,
-                 model.product_id == prosept_product_id)
-        )
-    )
-    return result.scalars().one_or_none()
+        select(MatchingProductDealer.dealer_product_id,
+               MatchingProductDealer.product_ids,
+               lease_available(operator_id))
+        .where(MatchingProductDealer.dealer_product_id.in_(ids))
+        .with_for_update(of=MatchingProductDealer))
+    cards = {id: (product_ids, available)
+             for id, product_ids, available in result}
+
+    results = []
+    seen = set()
+    for decision in decisions:
+        id = decision['dealer_product_id']
+        status, detail = decision_status(decision, cards.get(id), id in seen)
+        seen.add(id)
+        results.append({'dealer_product_id': id, 'action': decision['action'],
+                        'status': status, 'detail': detail, 'id': None})
+
+    applied = [(decision, item) for decision, item in zip(decisions, results)
+               if item['status'] == 200]
+    by_action = {action: [decision for decision, _ in applied
+                          if decision['action'] == action]
+                 for action in DECISION_COLUMNS}
+
+    if by_action['accept']:
+        created = await db.execute(
+            insert(MatchPositiveProductDealer)
+            .values([{'dealer_product_id': decision['dealer_product_id'],
+                      'product_id': decision['prosept_id']}
+                     for decision in by_action['accept']])
+            .returning(MatchPositiveProductDealer.dealer_product_id,
+                       MatchPositiveProductDealer.id))
+        created = dict(created.all())
+        for decision, item in applied:
+            if decision['action'] == 'accept':
+                item['id'] = created[decision['dealer_product_id']]
+
+    if by_action['delete']:
+        await db.execute(insert(DelMatchingProductDealer).values([
+            {'dealer_product_id': decision['dealer_product_id'],
+             'product_ids': cards[decision['dealer_product_id']][0]}
+            for decision in by_action['delete']]))
+
+    removed = [decision['dealer_product_id']
+               for decision in by_action['accept'] + by_action['delete']]
+    if removed:
+        await db.execute(delete(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id.in_(removed)))
+
+    if by_action['postpone']:
+        await db.execute(
+            update(MatchingProductDealer)
+            .where(MatchingProductDealer.dealer_product_id.in_(
+                [decision['dealer_product_id']
+                 for decision in by_action['postpone']]))
+            .values(order=ORDER_SEQUENCE.next_value(), leased_by=None,
+                    leased_until=None))
+
+    deltas = {DECISION_COLUMNS[action]: len(items)
+              for action, items in by_action.items() if items}
+    if deltas:
+        await db.execute(statistics_add(operator_id, deltas))
+
+    await db.commit()
+    return results
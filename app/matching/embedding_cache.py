@@ -0,0 +1,126 @@
+"""Постоянный кэш эмбеддингов названий товаров.
+
+Ключ записи - хэш от названия модели и нормализованного названия
+(product_name_tok), значение - вектор float32. Кэш хранится в локальном
+файле SQLite, размер ограничен: при переполнении удаляются записи, к
+которым дольше всего не обращались.
+"""
+import hashlib
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import (EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE,
+                        ENCODER_BACKEND, ENCODER_NAME)
+
+# ограничение SQLite на количество параметров в одном запросе
+SQL_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """Кэш эмбеддингов в файле SQLite.
+
+    Args:
+        - path (str): Путь к файлу кэша.
+        - model_name (str): Название модели энкодера, входит в ключ.
+        - max_entries (int): Максимальное количество записей.
+        - backend (str): Бэкенд энкодера. Векторы разных бэкендов немного
+          отличаются, поэтому бэкенд, кроме «torch», тоже входит в ключ.
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        model_name: str = ENCODER_NAME,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        backend: str = ENCODER_BACKEND
+    ):
+        if backend != 'torch':
+            model_name = f'{model_name}@{backend}'
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            'key TEXT PRIMARY KEY, vector BLOB NOT NULL, '
+            'last_used REAL NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS embeddings_last_used '
+            'ON embeddings (last_used)')
+
+    def key(self, text: str) -> str:
+        """Ключ записи: sha1 от модели и названия без лишних пробелов."""
+
+        normalized = ' '.join(text.split())
+        return hashlib.sha1(
+            f'{self.model_name}\0{normalized}'.encode('utf-8')).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Получаем эмбеддинги для списка названий.
+
+        Returns:
+            - List[Optional[np.ndarray]]: Вектор или None для каждого названия.
+        """
+
+        keys = [self.key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        for start in range(0, len(unique_keys), SQL_BATCH_SIZE):
+            batch = unique_keys[start:start + SQL_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.connection.execute(
+                f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})',
+                batch)
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+
+        if found:
+            now = time.time()
+            self.connection.executemany(
+                'UPDATE embeddings SET last_used = ? WHERE key = ?',
+                [(now, key) for key in found])
+            self.connection.commit()
+
+        result = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in result)
+        self.hits += hits
+        self.misses += len(result) - hits
+        return result
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """Сохраняем эмбеддинги и удаляем лишние записи."""
+
+        now = time.time()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO embeddings (key, vector, last_used) '
+            'VALUES (?, ?, ?)',
+            [(self.key(text), vector.tobytes(), now)
+             for text, vector in zip(texts, vectors)])
+        self.evict()
+        self.connection.commit()
+
+    def evict(self) -> None:
+        """Удаляем самые давно использованные записи сверх max_entries."""
+
+        count = self.connection.execute(
+            'SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM embeddings WHERE key IN ('
+                'SELECT key FROM embeddings ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,))
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий и промахов."""
+
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,148 @@
+"""Хранилище эмбеддингов товаров «Просепт».
+
+Эмбеддинги сохраняются в бинарный файл .npy (float32), рядом лежит
+манифест .json с ID товаров, названием модели, размерностью и
+контрольной суммой. Файл открывается через memory-map, поэтому загрузка
+не копирует данные, а несколько процессов делят один page cache.
+"""
+import hashlib
+import json
+import os
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+FEATURES_PATH = os.path.join('app/csv/features_mp.npy')
+LEGACY_FEATURES_PATH = os.path.join('app/csv/features_mp.csv')
+
+
+class CatalogEmbeddings(NamedTuple):
+    """Эмбеддинги каталога и ID товаров в порядке строк матрицы."""
+
+    features: np.ndarray
+    ids: np.ndarray
+    model_name: str
+
+
+def manifest_path(path: str) -> str:
+    """Путь к манифесту для файла с эмбеддингами."""
+
+    return os.path.splitext(path)[0] + '.json'
+
+
+def file_checksum(path: str) -> str:
+    """Считаем sha256 файла."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_embeddings(
+    features: np.ndarray,
+    ids: Sequence[int],
+    model_name: str,
+    path: str = FEATURES_PATH
+) -> CatalogEmbeddings:
+    """Сохраняем эмбеддинги каталога и манифест.
+
+    Файлы сначала пишутся во временные, а затем атомарно заменяют старые,
+    что-бы параллельно работающие процессы не прочитали файл наполовину.
+
+    Args:
+        - features (np.ndarray): Матрица эмбеддингов (товары x размерность).
+        - ids (Sequence[int]): ID товаров в порядке строк матрицы.
+        - model_name (str): Название модели энкодера.
+        - path (str): Путь к файлу .npy.
+
+    Returns:
+        - CatalogEmbeddings: Сохранённые эмбеддинги.
+    """
+
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    if features.ndim != 2 or features.shape[0] != ids.shape[0]:
+        raise ValueError('Количество эмбеддингов не совпадает с количеством ID')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, features)
+
+    manifest = {
+        'model': model_name,
+        'dim': features.shape[1],
+        'count': features.shape[0],
+        'dtype': 'float32',
+        'sha256': file_checksum(tmp_path),
+        'ids': ids.tolist(),
+    }
+    tmp_manifest = manifest_path(path) + '.tmp'
+    with open(tmp_manifest, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+
+    os.replace(tmp_path, path)
+    os.replace(tmp_manifest, manifest_path(path))
+
+    return CatalogEmbeddings(features, ids, model_name)
+
+
+def load_embeddings(
+    path: str = FEATURES_PATH,
+    model_name: Optional[str] = None,
+    verify: bool = False
+) -> CatalogEmbeddings:
+    """Открываем эмбеддинги каталога через memory-map.
+
+    Args:
+        - path (str): Путь к файлу .npy.
+        - model_name (Optional[str]): Ожидаемое название модели энкодера.
+        - verify (bool): Проверить контрольную сумму файла.
+
+    Raises:
+        - FileNotFoundError: Если файла или манифеста нет.
+        - ValueError: Если файл не соответствует манифесту.
+
+    Returns:
+        - CatalogEmbeddings: Эмбеддинги (read-only memmap) и ID товаров.
+    """
+
+    with open(manifest_path(path), encoding='utf-8') as file:
+        manifest = json.load(file)
+
+    if model_name is not None and manifest['model'] != model_name:
+        raise ValueError(f'Эмбеддинги получены моделью {manifest["model"]}, '
+                         f'а ожидается {model_name}')
+    if verify and file_checksum(path) != manifest['sha256']:
+        raise ValueError(f'Контрольная сумма {path} не совпадает с манифестом')
+
+    features = np.load(path, mmap_mode='r')
+    if features.shape != (manifest['count'], manifest['dim']):
+        raise ValueError(f'Размер {path} не совпадает с манифестом')
+
+    return CatalogEmbeddings(
+        features, np.asarray(manifest['ids'], dtype=np.int64), manifest['model'])
+
+
+def load_legacy_csv(path: str = LEGACY_FEATURES_PATH) -> np.ndarray:
+    """Читаем эмбеддинги из старого формата features_mp.csv."""
+
+    return pd.read_csv(path, index_col=[0]).to_numpy(dtype=np.float32)
+
+
+def migrate_legacy_csv(
+    ids: Sequence[int],
+    model_name: str,
+    csv_path: str = LEGACY_FEATURES_PATH,
+    path: str = FEATURES_PATH
+) -> CatalogEmbeddings:
+    """Переносим эмбеддинги из features_mp.csv в бинарное хранилище.
+
+    В старом формате ID товаров не сохранялись, поэтому их нужно передать
+    в том же порядке, в котором строился csv-файл.
+    """
+
+    save_embeddings(load_legacy_csv(csv_path), ids, model_name, path)
+    return load_embeddings(path)
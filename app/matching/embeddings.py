@@ -0,0 +1,179 @@
+"""Получение эмбеддингов LaBSE батчами с динамическим паддингом.
+
+Строки сортируются по длине в токенах и группируются в батчи так, что-бы
+суммарное число токенов в батче (с учётом паддинга) не превышало бюджет.
+Каждый батч дополняется нулями только до своей максимальной длины,
+а результат возвращается в исходном порядке строк.
+"""
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from app.config import (EMBEDDING_MAX_BATCH_SIZE, EMBEDDING_TOKEN_BUDGET,
+                        ENCODER_BACKEND, ENCODER_NUM_THREADS,
+                        MATCHING_CHUNK_SIZE)
+
+from .embedding_cache import EmbeddingCache
+from .encoder import get_encoder
+from .parallel import map_chunks, threads_per_worker
+
+MAX_LENGTH = 512
+
+
+def iter_batches(
+    lengths: np.ndarray,
+    token_budget: int = EMBEDDING_TOKEN_BUDGET,
+    max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE
+) -> Iterator[np.ndarray]:
+    """Разбиваем строки на батчи по длине.
+
+    Args:
+        - lengths (np.ndarray): Длины строк в токенах.
+        - token_budget (int): Максимум токенов в батче (строки * длина).
+        - max_batch_size (int): Максимум строк в батче.
+
+    Yields:
+        - np.ndarray: Индексы строк одного батча, по возрастанию длины.
+    """
+
+    order = np.argsort(lengths, kind='stable')
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and end - start < max_batch_size:
+            # строки отсортированы, поэтому длина батча - длина последней строки
+            if (end - start + 1) * lengths[order[end]] > token_budget:
+                break
+            end += 1
+        yield order[start:end]
+        start = end
+
+
+def embed_texts(
+    texts: Sequence[str],
+    token_budget: int = EMBEDDING_TOKEN_BUDGET,
+    max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+    cache: Optional[EmbeddingCache] = None,
+    workers: int = 1,
+    backend: str = ENCODER_BACKEND,
+    progress: bool = True
+) -> np.ndarray:
+    """Получаем эмбеддинги (CLS-токен) для списка строк.
+
+    Args:
+        - texts (Sequence[str]): Подготовленные названия товаров.
+        - token_budget (int): Максимум токенов в батче (строки * длина).
+        - max_batch_size (int): Максимум строк в батче.
+        - cache (Optional[EmbeddingCache]): Кэш эмбеддингов. Если передан,
+          через энкодер проходят только названия, которых нет в кэше.
+        - workers (int): Количество процессов для энкодера. 1 - без пула.
+        - backend (str): Бэкенд энкодера.
+        - progress (bool): Показывать прогресс по батчам.
+
+    Returns:
+        - np.ndarray: Матрица float32 размера (len(texts), hidden_size).
+    """
+
+    encode = partial(_encode_texts, token_budget=token_budget,
+                     max_batch_size=max_batch_size, backend=backend,
+                     progress=progress)
+    if workers > 1:
+        encode = partial(_encode_parallel, encode=encode, workers=workers,
+                         backend=backend)
+
+    if cache is None:
+        return encode(texts)
+
+    cached = cache.get_many(texts)
+    # одинаковые названия кодируем один раз
+    missing = list(dict.fromkeys(
+        text for text, vector in zip(texts, cached) if vector is None))
+    if not missing:
+        if not cached:
+            return encode(texts)
+        return np.stack(cached)
+
+    encoded = encode(missing)
+    cache.put_many(missing, encoded)
+
+    encoded_by_text = dict(zip(missing, encoded))
+    return np.stack([
+        vector if vector is not None else encoded_by_text[text]
+        for text, vector in zip(texts, cached)
+    ])
+
+
+def _init_encoder_worker(threads: int, backend: str) -> None:
+    """Загружаем энкодер в процессе пула один раз.
+
+    Количество потоков torch в процессе ограничивается, что-бы процессы
+    пула не конкурировали за ядра.
+    """
+
+    torch.set_num_threads(threads)
+    get_encoder(backend=backend)
+
+
+def _encode_parallel(
+    texts: Sequence[str],
+    encode: Callable[[Sequence[str]], np.ndarray],
+    workers: int,
+    backend: str = ENCODER_BACKEND
+) -> np.ndarray:
+    """Кодируем чанки строк в нескольких процессах.
+
+    Пул процессов общий для всех вызовов, каждый процесс загружает свой
+    экземпляр энкодера при запуске, поэтому количество процессов
+    ограничено доступной памятью.
+    """
+
+    chunks = map_chunks(
+        encode, list(texts), workers, MATCHING_CHUNK_SIZE,
+        initializer=_init_encoder_worker,
+        initargs=(threads_per_worker(workers, ENCODER_NUM_THREADS),
+                  backend))
+    if not chunks:
+        return encode([])
+    return np.concatenate(chunks)
+
+
+def _encode_texts(
+    texts: Sequence[str],
+    token_budget: int,
+    max_batch_size: int,
+    backend: str = ENCODER_BACKEND,
+    progress: bool = True
+) -> np.ndarray:
+    """Пропускаем строки через энкодер батчами с динамическим паддингом."""
+
+    enc_tokenizer, encoder = get_encoder(backend=backend)
+
+    tokenized: List[List[int]] = [
+        enc_tokenizer.encode(text, max_length=MAX_LENGTH, truncation=True,
+                             add_special_tokens=True)
+        for text in texts
+    ]
+    lengths = np.fromiter(map(len, tokenized), dtype=np.int64,
+                          count=len(tokenized))
+
+    features = np.empty((len(tokenized), encoder.config.hidden_size),
+                        dtype=np.float32)
+    batches = list(iter_batches(lengths, token_budget, max_batch_size))
+
+    for batch_index in tqdm(batches, disable=not progress):
+        batch_len = lengths[batch_index[-1]]
+        padded = np.zeros((len(batch_index), batch_len), dtype=np.int64)
+        for row, i in enumerate(batch_index):
+            padded[row, :lengths[i]] = tokenized[i]
+        attention_mask = np.arange(batch_len) < lengths[batch_index, None]
+
+        with torch.inference_mode():
+            batch_embeddings = encoder(
+                torch.from_numpy(padded),
+                attention_mask=torch.from_numpy(attention_mask.astype(np.int64)))
+        features[batch_index] = batch_embeddings[0][:, 0, :].numpy()
+
+    return features
@@ -0,0 +1,82 @@
+"""Общий реестр энкодера LaBSE.
+
+Токенизатор и модель загружаются один раз на процесс при первом
+обращении и переиспользуются функциями обучения и предсказания.
+Модель загружается в бэкенде ENCODER_BACKEND (см. encoder_backends).
+"""
+import gc
+import threading
+from typing import Dict, Tuple
+
+import torch
+import transformers
+
+from app.config import ENCODER_BACKEND, ENCODER_NAME, ENCODER_NUM_THREADS
+
+from .encoder_backends import load_backend
+
+_lock = threading.Lock()
+_encoders: Dict[Tuple[str, str], Tuple] = {}
+
+
+def _load_encoder(name: str, backend: str) -> Tuple:
+    """Загружаем токенизатор и модель в выбранном бэкенде."""
+
+    if ENCODER_NUM_THREADS > 0:
+        torch.set_num_threads(ENCODER_NUM_THREADS)
+
+    enc_tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    encoder = load_backend(name, backend)
+
+    return enc_tokenizer, encoder
+
+
+def get_encoder(name: str = ENCODER_NAME,
+                backend: str = ENCODER_BACKEND) -> Tuple:
+    """Получаем токенизатор и модель из реестра.
+
+    При первом вызове для данного имени и бэкенда модель загружается,
+    при последующих возвращается уже «прогретый» экземпляр.
+
+    Args:
+        - name (str): Название модели на HuggingFace.
+        - backend (str): Бэкенд: «torch», «int8», «torchscript» или «onnx».
+
+    Returns:
+        - Tuple: Токенизатор и модель энкодера.
+    """
+
+    key = (name, backend)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        with _lock:
+            encoder = _encoders.get(key)
+            if encoder is None:
+                encoder = _load_encoder(name, backend)
+                _encoders[key] = encoder
+    return encoder
+
+
+def warmup_encoder(name: str = ENCODER_NAME,
+                   backend: str = ENCODER_BACKEND) -> None:
+    """Загружаем энкодер и прогоняем через него одну строку."""
+
+    enc_tokenizer, encoder = get_encoder(name, backend)
+    batch = enc_tokenizer(['warmup'], return_tensors='pt')
+    with torch.inference_mode():
+        encoder(batch['input_ids'], attention_mask=batch['attention_mask'])
+
+
+def unload_encoder(name: str = None) -> None:
+    """Выгружаем энкодер из памяти процесса.
+
+    Args:
+        - name (str): Название модели. Если не передано, выгружаются все.
+          Выгружаются все бэкенды модели.
+    """
+
+    with _lock:
+        for key in list(_encoders):
+            if name is None or key[0] == name:
+                del _encoders[key]
+    gc.collect()
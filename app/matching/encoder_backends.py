@@ -0,0 +1,206 @@
+"""Бэкенды энкодера для инференса на CPU.
+
+- torch: исходная модель transformers в float32.
+- int8: динамическое квантование линейных слоёв в int8.
+- torchscript: трассированный и замороженный граф TorchScript.
+- onnx: граф ONNX, исполняется в onnxruntime, если он установлен.
+
+Преобразованная модель сохраняется в ENCODER_CACHE_DIR, при следующих
+запусках она загружается с диска без повторной конвертации.
+"""
+import os
+from typing import Callable, Optional
+
+import torch
+import transformers
+
+from app.config import ENCODER_CACHE_DIR
+
+BACKENDS = ('torch', 'int8', 'torchscript', 'onnx')
+
+# строки для трассировки графа, длина и размер батча при инференсе
+# могут быть любыми
+EXAMPLE_TEXTS = ['пример названия товара', 'example product 500 ml']
+
+
+class ExportedEncoder:
+    """Экспортированный граф с интерфейсом модели transformers.
+
+    Args:
+        - run (Callable): Функция (input_ids, attention_mask) ->
+          последний скрытый слой.
+        - config (transformers.PretrainedConfig): Конфигурация модели.
+    """
+
+    def __init__(self, run: Callable, config: transformers.PretrainedConfig):
+        self.run = run
+        self.config = config
+
+    def __call__(self, input_ids, attention_mask=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return (self.run(input_ids, attention_mask),)
+
+
+def backend_path(name: str, backend: str,
+                 cache_dir: str = ENCODER_CACHE_DIR) -> str:
+    """Путь к сохранённой модели бэкенда."""
+
+    extension = 'onnx' if backend == 'onnx' else 'pt'
+    return os.path.join(cache_dir, f'{name.replace("/", "--")}-{backend}.{extension}')
+
+
+def load_backend(name: str, backend: str,
+                 cache_dir: str = ENCODER_CACHE_DIR):
+    """Загружаем модель энкодера в выбранном бэкенде.
+
+    Args:
+        - name (str): Название модели на HuggingFace.
+        - backend (str): Бэкенд: «torch», «int8», «torchscript» или «onnx».
+        - cache_dir (str): Папка для преобразованных моделей.
+
+    Raises:
+        - ValueError: Неизвестный бэкенд.
+
+    Returns:
+        - Модель, которая принимает input_ids и attention_mask и
+          возвращает кортеж, первый элемент которого - последний скрытый слой.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f'Неизвестный бэкенд энкодера: {backend}')
+
+    if backend == 'onnx' and _onnxruntime() is None:
+        print('onnxruntime не установлен, используется бэкенд torchscript.')
+        backend = 'torchscript'
+
+    if backend == 'torch':
+        return _load_fp32(name)
+
+    path = backend_path(name, backend, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        EXPORTS[backend](name, path)
+    return LOADERS[backend](name, path)
+
+
+class _LastHiddenState(torch.nn.Module):
+    """Модель для экспорта: возвращает только последний скрытый слой."""
+
+    def __init__(self, encoder: torch.nn.Module):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, input_ids, attention_mask):
+        return self.encoder(input_ids=input_ids,
+                            attention_mask=attention_mask)[0]
+
+
+def _load_fp32(name: str) -> torch.nn.Module:
+    encoder = transformers.AutoModel.from_pretrained(name)
+    encoder.eval()
+    encoder.requires_grad_(False)
+    return encoder
+
+
+def _quantize(encoder: torch.nn.Module) -> torch.nn.Module:
+    """Динамическое квантование весов линейных слоёв в int8."""
+
+    return torch.ao.quantization.quantize_dynamic(
+        encoder, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _example_inputs(name: str):
+    enc_tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    batch = enc_tokenizer(EXAMPLE_TEXTS, padding=True, return_tensors='pt')
+    return batch['input_ids'], batch['attention_mask']
+
+
+def _save_atomic(save: Callable[[str], None], path: str) -> None:
+    tmp_path = path + '.tmp'
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _export_int8(name: str, path: str) -> None:
+    encoder = _quantize(_load_fp32(name))
+    _save_atomic(lambda tmp: torch.save(encoder.state_dict(), tmp), path)
+
+
+def _load_int8(name: str, path: str) -> torch.nn.Module:
+    # веса float32 не загружаются: модель создаётся по конфигурации,
+    # квантуется и получает сохранённые веса int8
+    encoder = transformers.AutoModel.from_config(
+        transformers.AutoConfig.from_pretrained(name))
+    encoder.eval()
+    encoder = _quantize(encoder)
+    encoder.load_state_dict(torch.load(path, weights_only=False))
+    encoder.requires_grad_(False)
+    return encoder
+
+
+def _export_torchscript(name: str, path: str) -> None:
+    encoder = _LastHiddenState(_load_fp32(name))
+    with torch.no_grad():
+        traced = torch.jit.trace(encoder, _example_inputs(name))
+    frozen = torch.jit.freeze(traced.eval())
+    _save_atomic(lambda tmp: torch.jit.save(frozen, tmp), path)
+
+
+def _load_torchscript(name: str, path: str) -> ExportedEncoder:
+    module = torch.jit.load(path)
+    return ExportedEncoder(
+        module,
+        transformers.AutoConfig.from_pretrained(name))
+
+
+def _export_onnx(name: str, path: str) -> None:
+    encoder = _LastHiddenState(_load_fp32(name))
+    dynamic_axes = {'input_ids': {0: 'batch', 1: 'sequence'},
+                    'attention_mask': {0: 'batch', 1: 'sequence'},
+                    'last_hidden_state': {0: 'batch', 1: 'sequence'}}
+    _save_atomic(lambda tmp: torch.onnx.export(
+        encoder, _example_inputs(name), tmp,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['last_hidden_state'],
+        dynamic_axes=dynamic_axes,
+        opset_version=14), path)
+
+
+def _load_onnx(name: str, path: str) -> ExportedEncoder:
+    onnxruntime = _onnxruntime()
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    session = onnxruntime.InferenceSession(
+        path, options, providers=['CPUExecutionProvider'])
+
+    def run(input_ids, attention_mask):
+        outputs = session.run(['last_hidden_state'], {
+            'input_ids': input_ids.numpy(),
+            'attention_mask': attention_mask.numpy()})
+        return torch.from_numpy(outputs[0])
+
+    return ExportedEncoder(run, transformers.AutoConfig.from_pretrained(name))
+
+
+def _onnxruntime() -> Optional[object]:
+    """Модуль onnxruntime или None, если он не установлен."""
+
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    return onnxruntime
+
+
+EXPORTS = {
+    'int8': _export_int8,
+    'torchscript': _export_torchscript,
+    'onnx': _export_onnx,
+}
+
+LOADERS = {
+    'int8': _load_int8,
+    'torchscript': _load_torchscript,
+    'onnx': _load_onnx,
+}
@@ -0,0 +1,121 @@
+"""Проверка точности бэкенда энкодера относительно float32.
+
+Эмбеддинги выборки названий считаются исходной моделью (torch) и
+проверяемым бэкендом. Сравниваются косинусная близость векторов одного
+названия и совпадение пяти ближайших товаров каталога для названий
+дилеров.
+
+Запуск из корня проекта:
+    python -m app.matching.encoder_check --backend int8
+"""
+import argparse
+import csv
+import sys
+import time
+from typing import Dict, Sequence
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from app.config import ENCODER_NAME
+
+from .embeddings import embed_texts
+from .encoder import get_encoder
+from .normalizer import normalize_titles
+from .topk import top_k
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Косинусная близость соответствующих строк двух матриц."""
+
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    return np.einsum('ij,ij->i', a, b) / (
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def compare_backends(
+    queries: Sequence[str],
+    catalog: Sequence[str],
+    backend: str,
+    k: int = 5
+) -> Dict[str, float]:
+    """Сравниваем бэкенд с исходной моделью float32.
+
+    Args:
+        - queries (Sequence[str]): Нормализованные названия дилеров.
+        - catalog (Sequence[str]): Нормализованные названия каталога.
+        - backend (str): Проверяемый бэкенд модели ENCODER_NAME.
+        - k (int): Количество ближайших товаров для сравнения.
+
+    Returns:
+        - Dict[str, float]: Средняя и минимальная косинусная близость,
+          доля совпадающих k ближайших товаров и совпадение первого
+          товара, время векторизации для обоих бэкендов.
+    """
+
+    texts = list(queries) + list(catalog)
+    result = {}
+    embeddings = {}
+    for label, current in (('reference', 'torch'), ('backend', backend)):
+        # модель загружается до замера времени
+        get_encoder(ENCODER_NAME, current)
+        start = time.perf_counter()
+        embeddings[label] = embed_texts(texts, backend=current)
+        result[f'seconds_{label}'] = time.perf_counter() - start
+
+    cosine = cosine_rows(embeddings['reference'], embeddings['backend'])
+    result['cosine_mean'] = float(cosine.mean())
+    result['cosine_min'] = float(cosine.min())
+
+    neighbours = {}
+    for label, features in embeddings.items():
+        distances = cdist(features[:len(queries)], features[len(queries):])
+        neighbours[label] = top_k(distances, min(k, len(catalog)))
+
+    overlap = [np.intersect1d(a, b).shape[0] for a, b in
+               zip(neighbours['reference'], neighbours['backend'])]
+    result[f'top{k}_agreement'] = float(
+        np.mean(overlap) / neighbours['reference'].shape[1])
+    result['top1_agreement'] = float(np.mean(
+        neighbours['reference'][:, 0] == neighbours['backend'][:, 0]))
+    return result
+
+
+def load_sample(size: int, seed: int = 0):
+    """Названия каталога и названия с маркетплейсов в роли запросов."""
+
+    with open('app/csv/marketing_product.csv', encoding='utf-8',
+              newline='') as file:
+        rows = list(csv.DictReader(file, delimiter=';'))
+
+    rng = np.random.default_rng(seed)
+    catalog = [row['name'] for row in rows if row['name']]
+    queries = [row[column] for row in rows
+               for column in ('ozon_name', 'wb_name') if row[column]]
+    queries = [queries[i] for i in rng.permutation(len(queries))[:size]]
+    return normalize_titles(queries), normalize_titles(catalog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--backend', required=True)
+    parser.add_argument('--sample', type=int, default=500)
+    parser.add_argument('--min-cosine', type=float, default=0.99)
+    parser.add_argument('--min-agreement', type=float, default=0.95)
+    args = parser.parse_args()
+
+    queries, catalog = load_sample(args.sample)
+    result = compare_backends(queries, catalog, args.backend)
+    for key, value in result.items():
+        print(f'{key:<20} {value:.4f}')
+
+    if (result['cosine_min'] < args.min_cosine
+            or result['top5_agreement'] < args.min_agreement):
+        print(f'Бэкенд {args.backend} не прошёл проверку точности.')
+        sys.exit(1)
+    print(f'Бэкенд {args.backend} прошёл проверку точности.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Потоковая выгрузка очереди матчинга и принятых пар.
+
+Формат выбирается заголовком Accept: application/x-ndjson (одна
+JSON-строка на карточку) или text/csv. Строки читаются из БД чанками по
+EXPORT_CHUNK_SIZE и сериализуются по мере чтения, поэтому первый байт
+отправляется сразу, а память не зависит от количества строк. Карточки
+очереди читаются готовыми (см. cards.py) страницами по ключу (order, id),
+в NDJSON их JSON из БД отдаётся как есть.
+
+Если чтение прервалось ошибкой, когда часть ответа уже отправлена,
+последней строкой выгрузки записывается сообщение об ошибке.
+"""
+import csv
+import io
+import json
+from typing import (Any, AsyncIterator, Callable, Dict, List, Optional,
+                    Sequence, Tuple)
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import EXPORT_CHUNK_SIZE
+from app.products.models import MarketingDealerPrice
+
+from .cards import read_cards
+from .catalog_cache import ProductCard
+from .crud import positive_pairs_query
+from .models import MatchingProductDealer
+from .schemas import (DealerProductModel, MatchingProductDealerModel,
+                      MatchPositiveProductDealerModel)
+
+NDJSON = 'application/x-ndjson'
+CSV = 'text/csv'
+STREAM_MEDIA_TYPES = (NDJSON, CSV)
+
+MATCHING_CSV_COLUMNS = [
+    'id', 'dealer_product_id', 'dealer_name', 'product_name', 'price',
+    'product_url', 'prosept_id_1', 'prosept_id_2', 'prosept_id_3',
+    'prosept_id_4', 'prosept_id_5',
+]
+
+POSITIVE_CSV_COLUMNS = [
+    'id', 'dealer_product_id', 'dealer_name', 'product_name', 'price',
+    'product_url', 'prosept_id', 'article', 'name_1c', 'cost',
+]
+
+EXPORT_ERROR = 'Выгрузка прервана из-за ошибки сервера'
+
+
+def streaming_media_type(accept: Optional[str]) -> Optional[str]:
+    """Потоковый формат из заголовка Accept.
+
+    Returns:
+        - Optional[str]: NDJSON или CSV, если клиент запросил один из них,
+          иначе None (обычный JSON-ответ).
+    """
+
+    if not accept:
+        return None
+    for media_type in accept.split(','):
+        media_type = media_type.split(';')[0].strip().lower()
+        if media_type in STREAM_MEDIA_TYPES:
+            return media_type
+    return None
+
+
+def dealer_product_model(dealer_product: MarketingDealerPrice,
+                         dealer_name: str) -> DealerProductModel:
+    """Карточка дилера для ответа API."""
+
+    return DealerProductModel(
+        id=dealer_product.id,
+        product_name=dealer_product.product_name,
+        price=dealer_product.price,
+        product_url=dealer_product.product_url,
+        dealer_name=dealer_name)
+
+
+def matching_card_model(
+    matching_product: MatchingProductDealer,
+    dealer_product: MarketingDealerPrice,
+    dealer_name: str,
+    products_dict: Dict[int, ProductCard]
+) -> MatchingProductDealerModel:
+    """Карточка очереди оператора: карточка дилера и пять товаров «Просепт».
+
+    Товары «Просепт» идут в порядке списка product_ids.
+    """
+
+    return MatchingProductDealerModel(
+        id=matching_product.id,
+        dealer_product=dealer_product_model(dealer_product, dealer_name),
+        products=[products_dict[id].to_dict() for id in
+                  matching_product.product_ids if id in products_dict])
+
+
+def matching_csv_row(row: Row) -> List:
+    card = json.loads(row.card)
+    dealer = card['dealer_product']
+    return [card['id'], dealer['id'], dealer['dealer_name'],
+            dealer['product_name'], dealer['price'], dealer['product_url'],
+            *[product['id'] for product in card['products']]]
+
+
+def positive_csv_row(pair: MatchPositiveProductDealerModel) -> List:
+    dealer = pair.dealer_product
+    prosept = pair.prosept_product
+    return [pair.id, dealer.id, dealer.dealer_name, dealer.product_name,
+            dealer.price, dealer.product_url, prosept.id, prosept.article,
+            prosept.name_1c, prosept.cost]
+
+
+async def iter_matching_cards(
+    db: AsyncSession,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[int, int]] = None,
+    dealer_id: Optional[int] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[List[Row]]:
+    """Готовые карточки очереди оператора чанками.
+
+    Каждый чанк - страница read_cards после последней карточки
+    предыдущего чанка, поэтому ещё не рассчитанные карточки
+    рассчитываются так же, как в обычном ответе GET /api/v1/matching.
+
+    Yields:
+        - List[Row]: Строки (order, id, card) одного чанка.
+    """
+
+    while limit is None or limit > 0:
+        size = chunk_size if limit is None else min(chunk_size, limit)
+        rows = await read_cards(db, size, after, dealer_id)
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        after = (rows[-1].order, rows[-1].id)
+        if limit is not None:
+            limit -= len(rows)
+
+
+async def iter_positive_pairs(
+    db: AsyncSession,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> AsyncIterator[List[MatchPositiveProductDealerModel]]:
+    """Принятые оператором пары чанками из серверного курсора.
+
+    Yields:
+        - List[MatchPositiveProductDealerModel]: Пары одного чанка.
+    """
+
+    result = await db.stream(
+        positive_pairs_query().execution_options(yield_per=chunk_size))
+    async for partition in result.partitions():
+        yield [MatchPositiveProductDealerModel(
+            id=pair.id,
+            dealer_product=dealer_product_model(dealer_product, dealer_name),
+            prosept_product=prosept.to_dict())
+            for pair, dealer_product, dealer_name, prosept in partition]
+
+
+def model_json(item: BaseModel) -> str:
+    return item.model_dump_json()
+
+
+def card_json(row: Row) -> str:
+    return row.card
+
+
+async def ndjson_chunks(
+    chunks: AsyncIterator[Sequence[Any]],
+    to_json: Callable[[Any], str] = model_json
+) -> AsyncIterator[str]:
+    """Сериализуем чанки в NDJSON, один элемент на строку."""
+
+    try:
+        async for chunk in chunks:
+            yield ''.join(to_json(item) + '\n' for item in chunk)
+    except Exception as e:
+        # заголовки уже отправлены, код ответа изменить нельзя
+        print(f'Ошибка потоковой выгрузки: {e!r}')
+        yield json.dumps({'error': EXPORT_ERROR}, ensure_ascii=False) + '\n'
+
+
+async def csv_chunks(
+    chunks: AsyncIterator[Sequence[Any]],
+    columns: Sequence[str],
+    to_row: Callable[[Any], List]
+) -> AsyncIterator[str]:
+    """Сериализуем чанки в CSV, первая строка - заголовок."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    try:
+        async for chunk in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(to_row(item) for item in chunk)
+            yield buffer.getvalue()
+    except Exception as e:
+        # заголовки уже отправлены, код ответа изменить нельзя
+        print(f'Ошибка потоковой выгрузки: {e!r}')
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(['error', EXPORT_ERROR])
+        yield buffer.getvalue()
+
+
+def streaming_response(
+    chunks: AsyncIterator[Sequence[Any]],
+    media_type: str,
+    columns: Sequence[str],
+    to_row: Callable[[Any], List],
+    filename: str,
+    to_json: Callable[[Any], str] = model_json
+) -> StreamingResponse:
+    """Потоковый ответ в формате NDJSON или CSV.
+
+    Args:
+        - chunks (AsyncIterator): Чанки элементов ответа.
+        - media_type (str): NDJSON или CSV.
+        - columns (Sequence[str]): Заголовок CSV.
+        - to_row (Callable): Преобразование элемента в строку CSV.
+        - filename (str): Имя файла для CSV без расширения.
+        - to_json (Callable): Преобразование элемента в строку NDJSON.
+
+    Returns:
+        - StreamingResponse: Ответ, который сериализует чанки по мере чтения.
+    """
+
+    if media_type == CSV:
+        return StreamingResponse(
+            csv_chunks(chunks, columns, to_row),
+            media_type=CSV,
+            headers={'Content-Disposition':
+                     f'attachment; filename="{filename}.csv"'})
+    return StreamingResponse(ndjson_chunks(chunks, to_json),
+                             media_type=NDJSON)
@@ -0,0 +1,296 @@
+"""Векторные индексы для поиска ближайших товаров «Просепт».
+
+- BruteForceIndex: точный поиск, расстояния считаются блоками через
+  матричное умножение без построения полной матрицы N x M.
+- IVFIndex: приближённый поиск. Каталог разбивается k-means на кластеры,
+  запрос сравнивается только с товарами из n_probe ближайших кластеров.
+
+Оба индекса возвращают евклидовы расстояния и ID товаров, отсортированные
+по возрастанию расстояния.
+"""
+import hashlib
+import os
+from typing import Dict, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+from .embedding_store import CatalogEmbeddings
+from .topk import top_k
+
+INDEX_PATH = os.path.join('app/csv/index_mp.npz')
+
+
+def squared_distances(queries: np.ndarray, vectors: np.ndarray,
+                      vectors_norms: np.ndarray) -> np.ndarray:
+    """Квадраты евклидовых расстояний через ||q||^2 - 2 q·x + ||x||^2."""
+
+    distances = queries @ vectors.T
+    distances *= -2
+    distances += np.einsum('ij,ij->i', queries, queries)[:, None]
+    distances += vectors_norms[None, :]
+    return np.maximum(distances, 0, out=distances)
+
+
+def merge_top_k(
+    distances: np.ndarray, ids: np.ndarray,
+    new_distances: np.ndarray, new_ids: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Объединяем два набора кандидатов и оставляем k лучших."""
+
+    distances = np.concatenate([distances, new_distances], axis=1)
+    ids = np.concatenate([ids, new_ids], axis=1)
+    best = top_k(distances, k)
+    return (np.take_along_axis(distances, best, axis=1),
+            np.take_along_axis(ids, best, axis=1))
+
+
+def catalog_checksum(catalog: CatalogEmbeddings) -> str:
+    """Считаем sha256 эмбеддингов каталога вместе с ID и названием модели."""
+
+    digest = hashlib.sha256(catalog.model_name.encode())
+    digest.update(np.ascontiguousarray(catalog.ids, dtype=np.int64))
+    digest.update(np.ascontiguousarray(catalog.features, dtype=np.float32))
+    return digest.hexdigest()
+
+
+class VectorIndex:
+    """Базовый класс индекса: хранение векторов, сохранение и загрузка."""
+
+    kind = ''
+    dtype = np.float32
+
+    def __init__(self, dim: int, block_size: int = 4096):
+        self.dim = dim
+        self.block_size = block_size
+        self.vectors = np.empty((0, dim), dtype=self.dtype)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.norms = np.empty(0, dtype=self.dtype)
+        # контрольная сумма эмбеддингов, по которым построен индекс
+        self.checksum = ''
+
+    def __len__(self) -> int:
+        return self.ids.shape[0]
+
+    def add(self, vectors: np.ndarray, ids: Sequence[int]) -> None:
+        """Добавляем векторы товаров в индекс."""
+
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64)
+        if vectors.shape[0] != ids.shape[0]:
+            raise ValueError('Количество векторов не совпадает с количеством ID')
+
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.ids = np.concatenate([self.ids, ids])
+        self.norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+
+    def search(self, queries: np.ndarray, k: int
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """Ищем k ближайших товаров для каждого запроса.
+
+        Args:
+            - queries (np.ndarray): Эмбеддинги карточек дилеров (N x dim).
+            - k (int): Количество кандидатов.
+
+        Returns:
+            - Tuple[np.ndarray, np.ndarray]: Расстояния и ID товаров (N x k).
+        """
+
+        queries = np.asarray(queries, dtype=self.dtype).reshape(-1, self.dim)
+        k = min(k, len(self))
+        distances = np.empty((queries.shape[0], k), dtype=self.dtype)
+        ids = np.empty((queries.shape[0], k), dtype=np.int64)
+
+        for start in range(0, queries.shape[0], self.block_size):
+            block = slice(start, start + self.block_size)
+            distances[block], ids[block] = self._search_block(queries[block], k)
+
+        return np.sqrt(distances), ids
+
+    def _search_block(self, queries: np.ndarray, k: int
+                      ) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        return {}
+
+    def _load_state(self, state: Dict[str, np.ndarray]) -> None:
+        pass
+
+    def save(self, path: str = INDEX_PATH) -> None:
+        """Сохраняем индекс в файл .npz."""
+
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, kind=self.kind, dim=self.dim,
+                 checksum=self.checksum, vectors=self.vectors, ids=self.ids,
+                 **self._state())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH) -> 'VectorIndex':
+        """Загружаем индекс, сохранённый методом save."""
+
+        with np.load(path) as data:
+            index = INDEXES[str(data['kind'])](int(data['dim']))
+            index._load_state(data)
+            index.add(data['vectors'], data['ids'])
+            if 'checksum' in data:
+                index.checksum = str(data['checksum'])
+        return index
+
+
+class BruteForceIndex(VectorIndex):
+    """Точный поиск перебором по всему каталогу.
+
+    Расстояния считаются в float64, что-бы совпадать с cdist: модель
+    ранжирования чувствительна к ошибкам округления в признаках.
+    """
+
+    kind = 'exact'
+    dtype = np.float64
+
+    def _search_block(self, queries, k):
+        distances = squared_distances(queries, self.vectors, self.norms)
+        best = top_k(distances, k)
+        return (np.take_along_axis(distances, best, axis=1), self.ids[best])
+
+
+class IVFIndex(VectorIndex):
+    """Приближённый поиск по инвертированным спискам (IVF-Flat).
+
+    Args:
+        - dim (int): Размерность векторов.
+        - n_lists (Optional[int]): Количество кластеров, по умолчанию sqrt(M).
+        - n_probe (int): Сколько ближайших кластеров просматривать при поиске.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim: int, n_lists: Optional[int] = None,
+                 n_probe: int = 8, block_size: int = 4096):
+        super().__init__(dim, block_size)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int64)
+
+    def train(self, vectors: np.ndarray, n_iter: int = 20,
+              seed: int = 0) -> None:
+        """Обучаем центроиды кластеров алгоритмом k-means."""
+
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        n_lists = self.n_lists or max(1, int(np.sqrt(vectors.shape[0])))
+        n_lists = min(n_lists, vectors.shape[0])
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)]
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+
+        for _ in range(n_iter):
+            assignments = self._nearest_centroids(vectors, centroids, 1)[:, 0]
+            for i in range(n_lists):
+                members = vectors[assignments == i]
+                if members.shape[0]:
+                    centroids[i] = members.mean(axis=0)
+                else:
+                    # пустой кластер переносим в самую дальнюю точку
+                    far = np.argmax(squared_distances(
+                        centroids, vectors, norms).min(axis=0))
+                    centroids[i] = vectors[far]
+
+        self.centroids = centroids
+        self.n_lists = n_lists
+        self.assignments = np.empty(0, dtype=np.int64)
+        if len(self):
+            self.assignments = self._nearest_centroids(
+                self.vectors, centroids, 1)[:, 0]
+
+    def _nearest_centroids(self, vectors, centroids, n):
+        centroids_norms = np.einsum('ij,ij->i', centroids, centroids)
+        return top_k(squared_distances(vectors, centroids, centroids_norms), n)
+
+    def add(self, vectors, ids):
+        if self.centroids is None:
+            self.train(vectors)
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        assignments = self._nearest_centroids(vectors, self.centroids, 1)[:, 0]
+        super().add(vectors, ids)
+        self.assignments = np.concatenate([self.assignments, assignments])
+
+    def _search_block(self, queries, k):
+        probes = self._nearest_centroids(
+            queries, self.centroids, min(self.n_probe, self.n_lists))
+
+        distances = np.full((queries.shape[0], k), np.inf, dtype=self.dtype)
+        ids = np.full((queries.shape[0], k), -1, dtype=np.int64)
+
+        # Запросы группируются по просматриваемым кластерам, что-бы
+        # каждый кластер обрабатывался одним матричным умножением.
+        for list_no in np.unique(probes):
+            query_rows = np.flatnonzero((probes == list_no).any(axis=1))
+            members = np.flatnonzero(self.assignments == list_no)
+            if not members.shape[0]:
+                continue
+            list_distances = squared_distances(
+                queries[query_rows], self.vectors[members], self.norms[members])
+            list_ids = np.broadcast_to(self.ids[members], list_distances.shape)
+            distances[query_rows], ids[query_rows] = merge_top_k(
+                distances[query_rows], ids[query_rows],
+                list_distances, list_ids, k)
+
+        return distances, ids
+
+    def _state(self):
+        return {'centroids': self.centroids, 'n_probe': self.n_probe}
+
+    def _load_state(self, state):
+        self.centroids = state['centroids']
+        self.n_lists = self.centroids.shape[0]
+        self.n_probe = int(state['n_probe'])
+
+
+INDEXES: Dict[str, Type[VectorIndex]] = {
+    BruteForceIndex.kind: BruteForceIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def build_index(catalog: CatalogEmbeddings, kind: str = 'exact',
+                **params) -> VectorIndex:
+    """Строим индекс выбранного типа по эмбеддингам каталога.
+
+    Args:
+        - catalog (CatalogEmbeddings): Эмбеддинги товаров «Просепт».
+        - kind (str): Тип индекса: «exact» или «ivf».
+        - params: Параметры конструктора индекса.
+
+    Returns:
+        - VectorIndex: Индекс, содержащий весь каталог.
+    """
+
+    if kind not in INDEXES:
+        raise ValueError(f'Неизвестный тип индекса: {kind}')
+
+    index = INDEXES[kind](catalog.features.shape[1], **params)
+    index.add(catalog.features, catalog.ids)
+    index.checksum = catalog_checksum(catalog)
+    return index
+
+
+def get_catalog_index(catalog: CatalogEmbeddings, kind: str,
+                      path: str = INDEX_PATH) -> VectorIndex:
+    """Загружаем сохранённый индекс или строим новый.
+
+    Сохранённый индекс используется, только если он того же типа и
+    построен по тем же эмбеддингам: совпадают ID товаров, модель и
+    векторы (сравниваются по контрольной сумме).
+    """
+
+    if os.path.exists(path):
+        index = VectorIndex.load(path)
+        if (index.kind == kind and np.array_equal(index.ids, catalog.ids)
+                and index.checksum == catalog_checksum(catalog)):
+            return index
+
+    index = build_index(catalog, kind)
+    index.save(path)
+    return index
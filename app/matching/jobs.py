@@ -0,0 +1,428 @@
+"""Фоновые задачи перематчинга.
+
+Задача сохраняется в таблице «MatchingJob» со статусом queued и
+выполняется в отдельном процессе пула, поэтому тяжёлые вычисления на
+pandas и torch не блокируют цикл событий API. Процесс задачи пишет в
+таблицу прогресс после каждого чанка карточек дилеров и там же
+проверяет, не отменена ли задача. Отметку heartbeat_at всё время работы
+задачи обновляет отдельный поток, в том числе пока загружается или
+обучается модель DS.
+"""
+import asyncio
+import multiprocessing
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import (ARRAY, Integer, and_, case, column, exists, func,
+                        or_, update, values)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from app.config import (MATCHING_JOB_HEARTBEAT_SECONDS,
+                        MATCHING_JOB_STALE_SECONDS, MATCHING_JOB_WORKERS,
+                        MATCHING_PREDICT_CHUNK_SIZE)
+from app.db.database import SessionLocal
+from app.products.models import MarketingDealerPrice
+
+from .cards import refresh_cards
+from .models import (DelMatchingProductDealer, MatchingJob,
+                     MatchingProductDealer, MatchPositiveProductDealer)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+_executor: Optional[ProcessPoolExecutor] = None
+# ссылки на задачи asyncio, что-бы их не удалил сборщик мусора
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Пул процессов для задач перематчинга, создаётся при первом запуске."""
+
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=MATCHING_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Останавливаем пул процессов, задачи из очереди не запускаются."""
+
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def unfinished_jobs():
+    """Условие для задач, которые ещё могут писать в очередь.
+
+    Отменённая задача остаётся незавершённой, пока её процесс не
+    сохранит текущий чанк и не запишет finished_at.
+    """
+
+    return or_(MatchingJob.status.in_(ACTIVE_STATUSES),
+               and_(MatchingJob.status == CANCELLED,
+                    MatchingJob.finished_at.is_(None)))
+
+
+async def get_job(db: AsyncSession, job_id: int) -> MatchingJob:
+    """Получаем задачу по ID.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - job_id (int): ID задачи.
+
+    Returns:
+        - MatchingJob: Объект задачи.
+    """
+
+    job = await db.get(MatchingJob, job_id, populate_existing=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Задача не найдена')
+    return job
+
+
+async def create_job(db: AsyncSession) -> MatchingJob:
+    """Создаём задачу перематчинга со статусом queued.
+
+    Одновременно может выполняться только одна задача, в том числе
+    отменённая, но ещё не остановившаяся. Это гарантирует уникальный
+    частичный индекс, поэтому параллельные запросы не создадут две
+    задачи. Задачи, процесс которых перестал отмечаться, перед проверкой
+    помечаются как failed.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+
+    Returns:
+        - MatchingJob: Созданная задача.
+    """
+
+    await fail_interrupted_jobs(db)
+    active = await db.scalar(select(MatchingJob.id).where(
+        unfinished_jobs()).limit(1))
+    if active is not None:
+        raise HTTPException(
+            status_code=409,
+            detail=f'Перематчинг уже выполняется, задача {active}')
+
+    job = MatchingJob(status=QUEUED, processed=0)
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # задачу одновременно создал другой запрос,
+        # вторую отклонил индекс ix_matching_job_unfinished
+        await db.rollback()
+        raise HTTPException(status_code=409,
+                            detail='Перематчинг уже выполняется')
+    await db.refresh(job)
+    return job
+
+
+async def cancel_job(db: AsyncSession, job_id: int) -> MatchingJob:
+    """Отменяем задачу.
+
+    Задача из очереди не запустится и сразу считается завершённой.
+    Выполняющаяся задача остановится после текущего чанка, finished_at
+    запишет её процесс.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - job_id (int): ID задачи.
+
+    Returns:
+        - MatchingJob: Задача после отмены.
+    """
+
+    job = await get_job(db, job_id)
+    if job.status not in ACTIVE_STATUSES:
+        raise HTTPException(
+            status_code=409,
+            detail=f'Задача уже завершена со статусом {job.status}')
+
+    # статус проверяется в том же UPDATE: задача могла успеть запуститься
+    await set_status(db, job_id, CANCELLED, ACTIVE_STATUSES,
+                     finished_at=case((MatchingJob.status == QUEUED,
+                                       func.now())))
+    return await get_job(db, job_id)
+
+
+async def fail_interrupted_jobs(db: AsyncSession) -> None:
+    """Помечаем как failed задачи, процесс которых перестал отмечаться.
+
+    Задачи других процессов и реплик приложения, которые обновляли
+    heartbeat_at не позже MATCHING_JOB_STALE_SECONDS назад, не меняются.
+    """
+
+    stale = func.now() - timedelta(seconds=MATCHING_JOB_STALE_SECONDS)
+    await db.execute(
+        update(MatchingJob)
+        .where(unfinished_jobs(), MatchingJob.heartbeat_at < stale)
+        .values(status=FAILED, error='Процесс задачи перестал отвечать',
+                finished_at=func.now()))
+    await db.commit()
+
+
+async def set_status(db: AsyncSession, job_id: int, status: str,
+                     current: Tuple[str, ...] = (), **values) -> bool:
+    """Обновляем статус задачи и дополнительные поля.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - job_id (int): ID задачи.
+        - status (str): Новый статус.
+        - current (Tuple[str, ...]): Статусы, из которых разрешён переход.
+          Если пусто - из любого. Защищает от гонки с отменой задачи.
+        - values: Дополнительные поля задачи.
+
+    Returns:
+        - bool: Был ли статус изменён.
+    """
+
+    query = update(MatchingJob).where(MatchingJob.id == job_id)
+    if current:
+        query = query.where(MatchingJob.status.in_(current))
+    result = await db.execute(query.values(status=status, **values))
+    await db.commit()
+    return result.rowcount > 0
+
+
+def submit_job(job_id: int) -> Future:
+    """Запускаем задачу в пуле процессов.
+
+    Если процесс задачи завершился аварийно и не успел записать статус,
+    задача помечается как failed из процесса приложения.
+    """
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_executor(), run_matching_job, job_id)
+
+    def done(future):
+        if future.cancelled() or future.exception() is None:
+            return
+        task = loop.create_task(
+            _mark_failed(job_id, repr(future.exception())))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    future.add_done_callback(done)
+    return future
+
+
+async def fail_job(db: AsyncSession, job_id: int, error: str) -> None:
+    """Помечаем незавершённую задачу как failed."""
+
+    await db.execute(
+        update(MatchingJob)
+        .where(MatchingJob.id == job_id, unfinished_jobs())
+        .values(status=FAILED, error=error, finished_at=func.now()))
+    await db.commit()
+
+
+async def _mark_failed(job_id: int, error: str) -> None:
+    async with SessionLocal() as db:
+        await fail_job(db, job_id, error)
+
+
+@contextmanager
+def heartbeat(job_id: int, session_factory=SessionLocal) -> Iterator[None]:
+    """Обновляем heartbeat_at задачи из отдельного потока.
+
+    Загрузка и обучение модели DS выполняются синхронно и блокируют цикл
+    событий процесса задачи, поэтому отметка пишется из потока со своим
+    циклом событий и своими подключениями к БД.
+
+    Args:
+        - job_id (int): ID задачи.
+        - session_factory: Фабрика сессий, из неё берётся адрес БД.
+    """
+
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=asyncio.run, daemon=True,
+        args=(_beat(job_id, session_factory.kw['bind'].url, stop),))
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+async def _beat(job_id: int, url, stop: threading.Event) -> None:
+    engine = create_async_engine(url, poolclass=NullPool)
+    try:
+        while not stop.wait(MATCHING_JOB_HEARTBEAT_SECONDS):
+            try:
+                async with engine.begin() as connection:
+                    await connection.execute(
+                        update(MatchingJob)
+                        .where(MatchingJob.id == job_id, unfinished_jobs())
+                        .values(heartbeat_at=func.now()))
+            except Exception as e:
+                # следующая отметка попробует снова
+                print(f'Не удалось обновить heartbeat задачи {job_id}: {e!r}')
+    finally:
+        await engine.dispose()
+
+
+def run_matching_job(job_id: int) -> None:
+    """Точка входа процесса пула."""
+
+    asyncio.run(run_job(job_id))
+
+
+async def run_job(job_id: int, session_factory=SessionLocal) -> None:
+    """Выполняем задачу перематчинга.
+
+    Args:
+        - job_id (int): ID задачи.
+        - session_factory: Фабрика асинхронных сессий.
+    """
+
+    async with session_factory() as read, session_factory() as write:
+        total = await read.scalar(
+            select(func.count()).select_from(MarketingDealerPrice))
+        # задачу могли отменить, пока она стояла в очереди
+        if not await set_status(write, job_id, RUNNING, (QUEUED,),
+                                total=total, started_at=func.now(),
+                                heartbeat_at=func.now()):
+            return
+
+        try:
+            with heartbeat(job_id, session_factory):
+                status = await rematch(read, write, job_id)
+        except Exception as e:
+            await write.rollback()
+            await fail_job(write, job_id, repr(e))
+            raise
+
+        done = status == RUNNING and await set_status(
+            write, job_id, DONE, (RUNNING,), finished_at=func.now())
+        if not done:
+            # задачу отменили: время фактической остановки
+            await set_status(write, job_id, CANCELLED, (CANCELLED,),
+                             finished_at=func.now())
+
+
+async def rematch(read: AsyncSession, write: AsyncSession,
+                  job_id: int) -> str:
+    """Пересчитываем матчинг для всех карточек дилеров.
+
+    - Карточки, которые оператор уже принял или удалил, не меняются.
+    - У существующих объектов «MatchingProductDealer» обновляется список
+      product_ids, порядок «Отложить» сохраняется.
+    - Для новых карточек дилеров создаются новые объекты.
+
+    Предсказания читаются через сессию read, результаты и прогресс
+    сохраняются через сессию write после каждого чанка. Пока задача
+    выполняется, операторы продолжают работать с очередью, поэтому
+    принятые и удалённые карточки проверяются при каждой записи.
+
+    Returns:
+        - str: Статус задачи после последнего чанка (running или cancelled).
+    """
+
+    # Импорт внутри функции, что-бы API не загружал torch и модели DS
+    from .load_db import iter_matching_products
+
+    # карточки, решённые до запуска, отбрасываются до записи
+    excluded = set(await write.scalars(
+        select(MatchPositiveProductDealer.dealer_product_id)))
+    excluded |= set(await write.scalars(
+        select(DelMatchingProductDealer.dealer_product_id)))
+
+    status = RUNNING
+    processed = 0
+    batch: List[MatchingProductDealer] = []
+    products = iter_matching_products(read)
+    try:
+        async for item in products:
+            processed += 1
+            if item.dealer_product_id not in excluded:
+                batch.append(item)
+            if processed % MATCHING_PREDICT_CHUNK_SIZE == 0:
+                status = await save_batch(write, job_id, batch, processed)
+                batch = []
+                if status != RUNNING:
+                    break
+        else:
+            status = await save_batch(write, job_id, batch, processed)
+    finally:
+        await products.aclose()
+
+    return status
+
+
+async def save_batch(write: AsyncSession, job_id: int,
+                     batch: List[MatchingProductDealer],
+                     processed: int) -> str:
+    """Сохраняем чанк предсказаний и прогресс задачи.
+
+    - Строки очереди обновляются по dealer_product_id. Строки, которые
+      оператор успел принять или удалить, уже удалены и не обновляются.
+    - Новые строки создаются только для карточек, которых нет в очереди
+      и среди принятых и удалённых.
+
+    Returns:
+        - str: Текущий статус задачи.
+    """
+
+    changed: List[int] = []
+    if batch:
+        predicted = values(
+            column('dealer_product_id', Integer),
+            column('product_ids', ARRAY(Integer)),
+            name='predicted',
+        ).data([(item.dealer_product_id, item.product_ids)
+                for item in batch])
+
+        updated = await write.execute(
+            update(MatchingProductDealer)
+            .where(MatchingProductDealer.dealer_product_id
+                   == predicted.c.dealer_product_id)
+            .values(product_ids=predicted.c.product_ids)
+            .returning(MatchingProductDealer.id))
+        changed += updated.scalars().all()
+
+        # order новых карточек берётся из последовательности ORDER_SEQUENCE
+        new_rows = (
+            select(predicted.c.dealer_product_id, predicted.c.product_ids)
+            .where(*[~exists().where(model.dealer_product_id
+                                     == predicted.c.dealer_product_id)
+                     for model in (MatchingProductDealer,
+                                   MatchPositiveProductDealer,
+                                   DelMatchingProductDealer)]))
+        inserted = await write.execute(
+            insert(MatchingProductDealer)
+            .from_select(['dealer_product_id', 'product_ids'], new_rows)
+            .on_conflict_do_nothing(
+                index_elements=[MatchingProductDealer.dealer_product_id])
+            .returning(MatchingProductDealer.id))
+        changed += inserted.scalars().all()
+
+    if changed:
+        await refresh_cards(write, MatchingProductDealer.id.in_(changed))
+
+    await write.execute(update(MatchingJob).where(MatchingJob.id == job_id)
+                        .values(processed=processed, heartbeat_at=func.now()))
+    await write.commit()
+    write.expunge_all()
+
+    return await write.scalar(
+        select(MatchingJob.status).where(MatchingJob.id == job_id))
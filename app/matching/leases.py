@@ -0,0 +1,136 @@
+"""Аренда карточек очереди операторами.
+
+GET /api/v1/matching/next закрепляет за оператором следующие доступные
+ему карточки на MATCHING_LEASE_SECONDS. Строки выбираются
+SELECT ... FOR UPDATE SKIP LOCKED, поэтому одновременные запросы разных
+операторов получают разные карточки и не ждут друг друга. Решение по
+карточке, которую арендовал другой оператор, отклоняется с кодом 409.
+Просроченная аренда считается свободной сразу, а фоновая задача раз в
+MATCHING_LEASE_SWEEP_SECONDS очищает её поля.
+"""
+import asyncio
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+
+from app.config import MATCHING_LEASE_SECONDS, MATCHING_LEASE_SWEEP_SECONDS
+from app.db.database import SessionLocal
+from app.products.models import MarketingDealer, MarketingDealerPrice
+
+from .crud import lease_available
+from .models import MatchingProductDealer
+
+_sweeper: Optional[asyncio.Task] = None
+
+
+async def claim_cards(
+        db: AsyncSession,
+        operator_id: int,
+        n: int,
+        dealer_id: Optional[int] = None
+) -> List[Tuple[MatchingProductDealer, MarketingDealerPrice, str]]:
+    """Арендуем для оператора n первых доступных ему карточек очереди.
+
+    Карточки, которые оператор уже арендовал, возвращаются снова, и их
+    аренда продлевается. Выбор строк, аренда и чтение карточек дилеров
+    выполняются одной командой.
+
+    Args:
+        - db (AsyncSession): Асинхронная сессия для подключения к БД.
+        - operator_id (int): ID оператора.
+        - n (int): Количество карточек.
+        - dealer_id (Optional[int]): ID дилера, если нужны только его карточки.
+
+    Returns:
+        - List[Tuple]: Объект «MatchingProductDealer», карточка дилера и
+          название дилера в порядке (order, id).
+    """
+
+    candidates = (
+        select(MatchingProductDealer.id)
+        .where(lease_available(operator_id))
+        .order_by(MatchingProductDealer.order, MatchingProductDealer.id)
+        .limit(n)
+        .with_for_update(of=MatchingProductDealer, skip_locked=True))
+    if dealer_id is not None:
+        candidates = candidates.join(
+            MarketingDealerPrice,
+            MatchingProductDealer.dealer_product_id == MarketingDealerPrice.id
+        ).where(MarketingDealerPrice.dealer_id == dealer_id)
+    candidates = candidates.cte('candidates')
+
+    claimed = (
+        update(MatchingProductDealer)
+        .where(MatchingProductDealer.id == candidates.c.id)
+        .values(leased_by=operator_id,
+                leased_until=func.now() + timedelta(
+                    seconds=MATCHING_LEASE_SECONDS))
+        .returning(*MatchingProductDealer.__table__.columns)
+        .cte('claimed'))
+    card = aliased(MatchingProductDealer, claimed)
+
+    result = await db.execute(
+        select(card, MarketingDealerPrice, MarketingDealer.name)
+        .join(MarketingDealerPrice,
+              card.dealer_product_id == MarketingDealerPrice.id)
+        .join(MarketingDealer,
+              MarketingDealerPrice.dealer_id == MarketingDealer.id)
+        .order_by(card.order, card.id))
+    cards = result.all()
+    await db.commit()
+    return cards
+
+
+async def release_expired_leases(db: AsyncSession) -> int:
+    """Снимаем просроченную аренду карточек.
+
+    Returns:
+        - int: Количество освобождённых карточек.
+    """
+
+    result = await db.execute(
+        update(MatchingProductDealer)
+        .where(MatchingProductDealer.leased_until < func.now())
+        .values(leased_by=None, leased_until=None))
+    await db.commit()
+    return result.rowcount
+
+
+async def sweep_leases(interval: float = MATCHING_LEASE_SWEEP_SECONDS,
+                       session_factory=SessionLocal) -> None:
+    """Периодически снимаем просроченную аренду, пока задачу не отменят."""
+
+    while True:
+        try:
+            async with session_factory() as db:
+                released = await release_expired_leases(db)
+            if released:
+                print(f'Снята просроченная аренда карточек: {released}.')
+        except Exception as e:
+            # ошибка одной очистки не останавливает следующие
+            print(f'Ошибка очистки аренды карточек: {e!r}')
+        await asyncio.sleep(interval)
+
+
+def start_lease_sweeper() -> None:
+    """Запускаем фоновую очистку аренды в цикле событий приложения."""
+
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.get_running_loop().create_task(sweep_leases())
+
+
+async def stop_lease_sweeper() -> None:
+    global _sweeper
+    if _sweeper is None:
+        return
+    _sweeper.cancel()
+    try:
+        await _sweeper
+    except asyncio.CancelledError:
+        pass
+    _sweeper = None
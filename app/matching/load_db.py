@@ -1,63 +1,80 @@
 """Подготавливаем данные от DS и загружаем их в БД."""
 import os
 import pickle
-from typing import List
+from typing import AsyncIterator, Dict, List
 
-import pandas as pd
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.config import (EMBEDDING_CACHE_PATH, ENCODER_NAME, MATCHING_INDEX,
+                        MATCHING_PREDICT_CHUNK_SIZE)
 from app.db.database import get_db
 from app.products.models import (MarketingDealerPrice, MarketingProduct,
                                  MarketingProductDealerKey)
 
+from .cards import refresh_cards
+from .embedding_cache import EmbeddingCache
+from .embedding_store import load_embeddings, migrate_legacy_csv
+from .index import get_catalog_index
 from .models import MatchingProductDealer
-from .script_ds import matching_predict, matching_training
+from .script_ds import matching_predict_stream, matching_training
 
 
-async def data_preparation(
-        db: AsyncSession = Depends(get_db)
-) -> List[MatchingProductDealer]:
-    """Подготавливаем данные от DS. Функция вернёт список со словарями.
+def print_dedup_stats(stats: Dict[str, int]) -> None:
+    """Выводим долю строк дилеров, которые не пришлось векторизовать."""
+
+    if stats['rows']:
+        print(f'Дедупликация названий дилеров: {stats["rows"]} строк, '
+              f'{stats["unique"]} уникальных, повторов '
+              f'{1 - stats["unique"] / stats["rows"]:.1%}.')
+
 
-    - Получаем данные из моделей MarketingProductDealerKey, MarketingProduct,
-      и MarketingDealerPrice, преобразуем их в списки со словарями.
-    - Обучаем модель DS, и передаём данные в функцию для предсказания.
-    - Добавляем в каждый словарь дополнительный ключ «dealerprice_id», для
-      связи с объектами модели «MarketingDealerPrice».
-    - В каждом словаре объединяем полученные пять ID в один список.
-    - Создаём объекты модели «MatchingProductDealer».
+async def iter_matching_products(
+        db: AsyncSession
+) -> AsyncIterator[MatchingProductDealer]:
+    """Потоково подготавливаем данные от DS.
+
+    - Получаем данные из моделей MarketingProductDealerKey и MarketingProduct.
+    - Обучаем модель DS, если обученной модели ещё нет.
+    - Строки MarketingDealerPrice читаем из БД частями по
+      MATCHING_PREDICT_CHUNK_SIZE и передаём каждую часть в функцию для
+      предсказания, поэтому в памяти находится только один чанк.
+    - Для каждой строки объединяем полученные пять ID в один список и
+      создаём объект модели «MatchingProductDealer».
 
     Args:
         db(AsyncSession): Асинхронная сессия для доступа к базе данных.
 
-    Returns:
-        List[MatchingProductDealer]: Список объектов MatchingProductDealer.
+    Yields:
+        MatchingProductDealer: Объекты MatchingProductDealer.
     """
 
-    # Получаем данные из трёх моделей
-    productdealerkey = await db.execute(select(MarketingProductDealerKey))
+    # Получаем данные из моделей
     product = await db.execute(select(MarketingProduct))
-    dealerprice = await db.execute(select(MarketingDealerPrice))
 
     # Преобразуем данные из моделей в список со словарями
     lst_dict_pr = [item.to_dict() for item in product.scalars().all()]
-    lst_dict_dr = [item.to_dict() for item in dealerprice.scalars().all()]
-    lst_dict_k = [item.to_dict() for item in productdealerkey.scalars().all()]
+
+    # Кэш эмбеддингов: заново кодируются только новые и изменённые названия
+    cache = EmbeddingCache() if EMBEDDING_CACHE_PATH else None
 
     # Обучаем модель DS, и передаём данные в функцию для предсказания.
-    def training_match(name_model, name_features):
+    async def training_match(name_model):
         """
         Проверяем если есть обученная модель передаем ее,
         Если нет то обучаем и сохраняем в папку csv.
 
+        Эмбеддинги каталога открываются из бинарного хранилища через
+        memory-map. Если есть только старый features_mp.csv, он
+        переносится в бинарный формат.
+
         Args:
             Передаем в виде строчки название
             файла который будет создан или искать в папке csv.
 
         Returns:
-            Возвращается обученную модель.
+            Возвращается обученную модель и эмбеддинги каталога.
         """
         try:
 
@@ -66,58 +83,117 @@ async def data_preparation(
             with open(Pkl_filename, 'rb') as file:
                 model = pickle.load(file)
 
-                features_mp = pd.read_csv(
-                    os.path.join(f'app/csv/{name_features}'), index_col=[0])
+            try:
+                features_mp = load_embeddings(model_name=ENCODER_NAME)
+            except FileNotFoundError:
+                ids = [item['id'] for item in lst_dict_pr
+                       if item['name'] is not None]
+                features_mp = migrate_legacy_csv(ids, ENCODER_NAME)
 
             return model, features_mp
 
         except FileNotFoundError:
 
+            # Для обучения нужны все данные дилеров и разметка
+            productdealerkey = await db.execute(
+                select(MarketingProductDealerKey))
+            dealerprice = await db.execute(select(MarketingDealerPrice))
+            lst_dict_dr = [item.to_dict()
+                           for item in dealerprice.scalars().all()]
+            lst_dict_k = [item.to_dict()
+                          for item in productdealerkey.scalars().all()]
+
             model, features_mp = matching_training(
-                lst_dict_pr, lst_dict_dr, lst_dict_k)
+                lst_dict_pr, lst_dict_dr, lst_dict_k, cache=cache)
 
             return model, features_mp
 
-    matching = matching_predict(
-        lst_dict_pr, lst_dict_dr, training_match(
-            'Pikel_model.pkl',
-            'features_mp.csv'))
+    try:
+        model_embeddings = await training_match('Pikel_model.pkl')
 
-    """
-    Добавляем в каждый словарь дополнительный ключ «dealerprice_id», что-бы
-    была связь между полученными id и объектами модели «MarketingDealerPrice».
-    """
-    if len(matching) == len(lst_dict_dr):
-        for match_dict, dr_dict in zip(matching, lst_dict_dr):
-            match_dict['dealerprice_id'] = dr_dict['id']
+        # Векторный индекс каталога, если он включён в настройках
+        index = None
+        if MATCHING_INDEX:
+            index = get_catalog_index(model_embeddings[1], MATCHING_INDEX)
 
+        dealerprice = await db.stream_scalars(
+            select(MarketingDealerPrice).order_by(MarketingDealerPrice.id)
+            .execution_options(yield_per=MATCHING_PREDICT_CHUNK_SIZE))
+
+        # Счётчики строк и уникальных названий для отчёта о дедупликации
+        stats = {'rows': 0, 'unique': 0}
+        async for partition in dealerprice.partitions():
+            lst_dict_dr = [item.to_dict() for item in partition]
+
+            # Чанк целиком проходит предсказание, id строки дилера
+            # приходит вместе с предсказанием для неё.
+            for dr_dict, dict_item in matching_predict_stream(
+                    lst_dict_pr, lst_dict_dr, model_embeddings, index=index,
+                    cache=cache, chunk_size=len(lst_dict_dr), stats=stats):
+                product_ids = [dict_item[str(i)] for i in range(1, 6)]
+
+                yield MatchingProductDealer(
+                    product_ids=product_ids,
+                    dealer_product_id=dr_dict['id'])
+
+        print_dedup_stats(stats)
+    finally:
+        if cache is not None:
+            print(f'Кэш эмбеддингов: {cache.stats()}')
+            cache.close()
+
+
+async def data_preparation(
+        db: AsyncSession = Depends(get_db)
+) -> List[MatchingProductDealer]:
+    """Подготавливаем данные от DS. Функция вернёт список объектов.
+
+    Args:
+        db(AsyncSession): Асинхронная сессия для доступа к базе данных.
+
+    Returns:
+        List[MatchingProductDealer]: Список объектов MatchingProductDealer.
     """
-    - В каждом словаре объединяем полученные пять ID в один список.
-    - И создаём объекты модели «MatchingProductDealer».
-    """
-    matching_products = []
-    for dict_item in matching:
-        product_ids = [dict_item[str(i)] for i in range(1, 6)]
 
-        new_matching_product = MatchingProductDealer(
-            product_ids=product_ids,
-            dealer_product_id=dict_item['dealerprice_id'])
+    return [item async for item in iter_matching_products(db)]
+
 
-        matching_products.append(new_matching_product)
+async def save_chunk(session: AsyncSession,
+                     items: List[MatchingProductDealer]) -> None:
+    """Сохраняем чанк объектов «MatchingProductDealer» вместе с карточками.
 
-    return matching_products
+    После фиксации объекты отсоединяются от сессии, что-бы в памяти не
+    накапливалась вся выгрузка дилеров.
+    """
+
+    if not items:
+        return
+    # order новых карточек берётся из последовательности ORDER_SEQUENCE
+    session.add_all(items)
+    await session.flush()
+    await refresh_cards(
+        session, MatchingProductDealer.id.in_([item.id for item in items]))
+    await session.commit()
+    session.expunge_all()
 
 
 async def load_data(session: AsyncSession) -> None:
-    """Загрузка подготовленных данных матчинга в БД."""
+    """Загрузка подготовленных данных матчинга в БД.
+
+    Предсказания читаются через отдельную сессию, как в перематчинге.
+    Объекты сохраняются через session чанками по
+    MATCHING_PREDICT_CHUNK_SIZE, каждый чанк в своей транзакции.
+    """
 
-    matching_products = await data_preparation(session)
     try:
-        for item in matching_products:
-            session.add(item)
-            await session.flush()
-            item.order = item.id
-        await session.commit()
+        async with AsyncSession(session.bind) as read:
+            chunk: List[MatchingProductDealer] = []
+            async for item in iter_matching_products(read):
+                chunk.append(item)
+                if len(chunk) == MATCHING_PREDICT_CHUNK_SIZE:
+                    await save_chunk(session, chunk)
+                    chunk = []
+            await save_chunk(session, chunk)
         print('Данные DS добавлены в БД.')
     except Exception as e:
         await session.rollback()
@@ -1,8 +1,14 @@
-from sqlalchemy import ARRAY, Column, ForeignKey, Integer
+from sqlalchemy import (ARRAY, Column, DateTime, ForeignKey, Index, Integer,
+                        Sequence, String, func, text)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
 
+# Значения поля order: новые карточки и кнопка «Отложить» берут следующее
+# значение последовательности, без max(order) по всей таблице
+ORDER_SEQUENCE = Sequence('matching_product_dealer_order_seq')
+
 
 class MatchingProductDealer(Base):
     """Матчинг товаров «Просепт» и товаров дилеров от наших DS."""
@@ -13,14 +19,32 @@ class MatchingProductDealer(Base):
     product_ids = Column(ARRAY(Integer), comment='Пять ID товаров от Просепт')
     dealer_product_id = Column(
         Integer, ForeignKey('marketing_dealerprice.id'),
-        comment='ID товара от диллера'
+        unique=True, index=True, comment='ID товара от диллера'
     )
     order = Column(
-        Integer,
+        Integer, ORDER_SEQUENCE, server_default=ORDER_SEQUENCE.next_value(),
         comment='Поле для сортировки. Для реализации кнопки «Отложить»')
+    leased_by = Column(Integer, comment='ID оператора, который взял карточку')
+    leased_until = Column(
+        DateTime(timezone=True),
+        comment='До какого времени карточка закреплена за оператором')
+    dealer_id = Column(Integer, comment='ID дилера, копия из карточки дилера')
+    card = Column(
+        JSONB(none_as_null=True),
+        comment='Готовая карточка для оператора в формате ответа API')
 
     dealer_product = relationship("MarketingDealerPrice")
 
+    __table_args__ = (
+        # Постраничное чтение очереди оператора по ключу (order, id)
+        Index('ix_matching_product_dealer_order_id', 'order', 'id'),
+        Index('ix_matching_product_dealer_dealer_id_order_id',
+              'dealer_id', 'order', 'id'),
+        # Поиск просроченной аренды без чтения свободных карточек
+        Index('ix_matching_product_dealer_leased_until', 'leased_until',
+              postgresql_where=text('leased_until IS NOT NULL')),
+    )
+
 
 class MatchPositiveProductDealer(Base):
     """Итоговая таблица с карточкой дилера и карточкой «Просепт», которую выбрал оператор."""
@@ -40,6 +64,12 @@ class MatchPositiveProductDealer(Base):
     dealer_product = relationship("MarketingDealerPrice")
     product = relationship("MarketingProduct")
 
+    # Поиск принятой пары по карточке дилера
+    __table_args__ = (
+        Index('ix_match_positive_prod_dealer_dealer_product_id_product_id',
+              'dealer_product_id', 'product_id'),
+    )
+
 
 class DelMatchingProductDealer(Base):
     """
@@ -60,7 +90,7 @@ class DelMatchingProductDealer(Base):
 
 
 class Statistics(Base):
-    """Сохраняем в БД все действия оператора."""
+    """Сохраняем в БД все действия оператора, id - ID оператора."""
 
     __tablename__ = 'statistics'
 
@@ -77,3 +107,35 @@ class Statistics(Base):
         Integer, default=0,
         comment='Количество отложенных карточек'
     )
+
+
+class MatchingJob(Base):
+    """Фоновая задача перематчинга карточек дилеров."""
+
+    __tablename__ = 'matching_job'
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(
+        String, nullable=False, default='queued', index=True,
+        comment='queued, running, done, failed или cancelled')
+    processed = Column(
+        Integer, nullable=False, default=0,
+        comment='Количество обработанных карточек дилеров')
+    total = Column(Integer, comment='Количество карточек дилеров')
+    error = Column(String, comment='Текст ошибки для статуса failed')
+    created_at = Column(
+        DateTime(timezone=True), server_default=func.now(),
+        comment='Время создания задачи')
+    started_at = Column(DateTime(timezone=True), comment='Время запуска')
+    finished_at = Column(DateTime(timezone=True), comment='Время завершения')
+    heartbeat_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(),
+        comment='Последняя отметка процесса задачи')
+
+    __table_args__ = (
+        # Не больше одной незавершённой задачи: вторую вставку отклонит БД
+        Index('ix_matching_job_unfinished', text('(true)'), unique=True,
+              postgresql_where=text(
+                  "status IN ('queued', 'running') "
+                  "OR (status = 'cancelled' AND finished_at IS NULL)")),
+    )
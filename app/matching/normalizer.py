@@ -0,0 +1,109 @@
+"""Нормализация названий товаров перед векторизацией.
+
+Общий для обучения и предсказания модуль: разделение склеенных слов,
+токенизация, удаление стоп-слов, лемматизация и стемминг. Регулярные
+выражения компилируются один раз, стоп-слова хранятся во frozenset,
+результаты лемматизации, стемминга и нормализации целых названий
+кэшируются.
+"""
+import re
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List
+
+import nltk
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer, WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+
+from app.config import MATCHING_CHUNK_SIZE
+
+from .parallel import map_chunks
+
+nltk.download('stopwords', quiet=True)
+nltk.download('punkt', quiet=True)
+nltk.download('wordnet', quiet=True)
+nltk.download('omw-1.4', quiet=True)
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+LATIN = re.compile(r'[a-zA-Z]+')
+DIGITS = re.compile(r'\d+')
+UPPER_CYRILLIC = re.compile(r'[А-Я]+')
+
+porter = PorterStemmer()
+lemmatizer = WordNetLemmatizer()
+
+
+@lru_cache(maxsize=None)
+def get_stopwords() -> FrozenSet[str]:
+    """Английские и русские стоп-слова одним множеством."""
+
+    return frozenset(stopwords.words('english') + stopwords.words('russian'))
+
+
+@lru_cache(maxsize=None)
+def lemmatize(word: str) -> str:
+    return lemmatizer.lemmatize(word)
+
+
+@lru_cache(maxsize=None)
+def stem(word: str) -> str:
+    return porter.stem(word)
+
+
+def separation(s: str) -> str:
+    """
+    Функция для удаления знаков препинания,
+    а также для расклеивания склеенных слов,
+    то есть разделения пробелами латиницы от кириллицы,
+    чисел от букв и слов в верхнем регистре от слов
+    в нижнем регистре в склеенных словах.
+    """
+
+    s = PUNCTUATION.sub(' ', s)
+    lat = LATIN.findall(s)
+    num = DIGITS.findall(s)
+    up = [i for i in UPPER_CYRILLIC.findall(s) if len(i) > 1]
+    # Повторная замена той же подстроки добавляет только пробелы,
+    # поэтому каждая подстрока заменяется один раз, порядок сохраняется.
+    for i in dict.fromkeys(lat + num + up):
+        s = s.replace(i, ' ' + i + ' ')
+    return ' '.join(s.lower().split())
+
+
+@lru_cache(maxsize=1 << 16)
+def normalize_title(title: str) -> str:
+    """Подготавливаем одно название товара к векторизации.
+
+    Args:
+        - title (str): Название товара.
+
+    Returns:
+        - str: Токены через пробел после лемматизации и стемминга.
+    """
+
+    stop = get_stopwords()
+    return ' '.join(stem(lemmatize(i)) for i in word_tokenize(separation(title))
+                    if i not in stop)
+
+
+def normalize_titles(
+    titles: Iterable[str],
+    workers: int = 1,
+    chunk_size: int = MATCHING_CHUNK_SIZE
+) -> List[str]:
+    """Нормализуем список названий товаров.
+
+    Args:
+        - titles (Iterable[str]): Названия товаров.
+        - workers (int): Количество процессов. 1 - в текущем процессе.
+        - chunk_size (int): Размер чанка для пула процессов.
+
+    Returns:
+        - List[str]: Нормализованные названия в исходном порядке.
+    """
+
+    if workers <= 1:
+        return [normalize_title(title) for title in titles]
+
+    chunks = map_chunks(normalize_titles, list(titles), workers, chunk_size)
+    return [title for chunk in chunks for title in chunk]
@@ -0,0 +1,131 @@
+"""Параллельная обработка данных матчинга в пуле процессов.
+
+Данные делятся на чанки, чанки обрабатываются в ProcessPoolExecutor,
+результаты собираются в исходном порядке. Пул создаётся один раз на
+процесс для каждого initializer и переиспользуется всеми вызовами, так
+что initializer (например, загрузка энкодера) выполняется в процессе
+пула один раз. Если пул запустить не удалось, обработка продолжается в
+текущем процессе.
+"""
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import (Callable, Dict, Hashable, List, Optional, Sequence,
+                    Tuple, TypeVar)
+
+from app.config import MATCHING_CHUNK_SIZE, MATCHING_WORKERS
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_lock = threading.Lock()
+_pools: Dict[Hashable, ProcessPoolExecutor] = {}
+
+
+def split_chunks(items: Sequence[T], chunk_size: int) -> List[Sequence[T]]:
+    """Делим последовательность на чанки по chunk_size элементов."""
+
+    return [items[start:start + chunk_size]
+            for start in range(0, len(items), chunk_size)]
+
+
+def threads_per_worker(workers: int, threads: int = 0) -> int:
+    """Количество потоков torch в одном процессе пула.
+
+    Если количество потоков не задано, ядра делятся поровну между процессами.
+    """
+
+    if threads > 0:
+        return threads
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def get_pool(workers: int, initializer: Optional[Callable] = None,
+             initargs: tuple = ()) -> ProcessPoolExecutor:
+    """Получаем пул процессов из реестра.
+
+    Процессы запускаются методом spawn, что-бы не наследовать потоки
+    torch родительского процесса.
+
+    Args:
+        - workers (int): Количество процессов.
+        - initializer (Optional[Callable]): Инициализация процесса пула.
+        - initargs (tuple): Аргументы для initializer.
+
+    Returns:
+        - ProcessPoolExecutor: Пул, общий для вызовов с теми же аргументами.
+    """
+
+    key = (workers, initializer, initargs)
+    pool = _pools.get(key)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=initializer,
+                    initargs=initargs)
+                _pools[key] = pool
+    return pool
+
+
+def shutdown_pools() -> None:
+    """Останавливаем все пулы процессов, например при остановке приложения."""
+
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _drop_pool(key: Tuple) -> None:
+    with _lock:
+        pool = _pools.pop(key, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def map_chunks(
+    func: Callable[[Sequence[T]], R],
+    items: Sequence[T],
+    workers: int = MATCHING_WORKERS,
+    chunk_size: int = MATCHING_CHUNK_SIZE,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = ()
+) -> List[R]:
+    """Применяем функцию к чанкам данных в пуле процессов.
+
+    Данные делятся поровну между процессами, но не больше chunk_size
+    элементов в чанке. Функция и её аргументы должны сериализоваться
+    pickle.
+
+    Args:
+        - func (Callable): Функция, которая обрабатывает один чанк.
+        - items (Sequence): Данные.
+        - workers (int): Количество процессов. 1 - без пула.
+        - chunk_size (int): Максимальный размер чанка.
+        - initializer (Optional[Callable]): Инициализация процесса пула.
+        - initargs (tuple): Аргументы для initializer.
+
+    Returns:
+        - List: Результаты func для каждого чанка, в исходном порядке.
+    """
+
+    size = min(chunk_size, max(1, math.ceil(len(items) / max(workers, 1))))
+    chunks = split_chunks(items, size)
+    if workers <= 1 or len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+
+    try:
+        pool = get_pool(workers, initializer, initargs)
+        return list(pool.map(func, chunks))
+    except (OSError, BrokenProcessPool) as e:
+        _drop_pool((workers, initializer, initargs))
+        print(f'Пул процессов недоступен ({e}), обработка в одном процессе.')
+        return [func(chunk) for chunk in chunks]
@@ -0,0 +1,251 @@
+"""Онлайн-предсказание для отдельных карточек дилеров.
+
+Модель, эмбеддинги каталога и векторный индекс загружаются один раз на
+процесс и переиспользуются всеми запросами, пока перематчинг или
+load_data не заменят файл модели или эмбеддингов. Одновременные запросы
+собирает MicroBatcher: названия, пришедшие в течение
+MATCHING_BATCH_MAX_WAIT_MS, проходят через энкодер и модель одним
+батчем размером не больше MATCHING_BATCH_MAX_SIZE.
+"""
+import asyncio
+import os
+import pickle
+import threading
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import (ENCODER_NAME, MATCHING_BATCH_MAX_SIZE,
+                        MATCHING_BATCH_MAX_WAIT_MS, MATCHING_CANDIDATES,
+                        MATCHING_INDEX)
+
+from .embedding_store import FEATURES_PATH, load_embeddings, manifest_path
+from .embeddings import embed_texts
+from .index import VectorIndex, get_catalog_index
+from .normalizer import normalize_titles
+from .reranker import Reranker, exact_index
+from .script_ds import predict_top
+
+MODEL_PATH = os.path.join('app/csv/Pikel_model.pkl')
+
+# Список пар (ID товара «Просепт», оценка модели) для одного названия
+Prediction = List[Tuple[int, float]]
+
+
+class Predictor(NamedTuple):
+    """Обученная модель и каталог, подготовленные для предсказания."""
+
+    model: object
+    catalog_ids: np.ndarray
+    features_mp: np.ndarray
+    index: Optional[VectorIndex]
+    # версия файлов модели и эмбеддингов, из которых загружен предиктор
+    version: Optional[Tuple] = None
+
+
+_lock = threading.Lock()
+_predictor: Optional[Predictor] = None
+
+
+def files_version() -> Optional[Tuple]:
+    """Версия файла модели и манифеста эмбеддингов каталога.
+
+    Манифест атомарно заменяется при каждом сохранении эмбеддингов,
+    поэтому меняются его inode и время изменения.
+
+    Returns:
+        - Optional[Tuple]: inode, время изменения и размер обоих файлов
+          или None, если какого-то файла нет.
+    """
+
+    try:
+        stats = [os.stat(path) for path in
+                 (MODEL_PATH, manifest_path(FEATURES_PATH))]
+    except FileNotFoundError:
+        return None
+    return tuple((stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                 for stat in stats)
+
+
+def get_predictor() -> Predictor:
+    """Загружаем модель и каталог при первом обращении.
+
+    Если файл модели или эмбеддингов изменился после загрузки,
+    предиктор загружается заново. Модель на этом пути не обучается:
+    если её ещё нет, нужно выполнить перематчинг или load_data.
+
+    Raises:
+        - HTTPException: 503, если модель или эмбеддинги каталога не найдены.
+
+    Returns:
+        - Predictor: Модель, ID и эмбеддинги каталога, индекс.
+    """
+
+    global _predictor
+    version = files_version()
+    predictor = _predictor
+    if predictor is None or predictor.version != version:
+        with _lock:
+            if _predictor is None or _predictor.version != version:
+                _predictor = _load_predictor(version)
+            predictor = _predictor
+    return predictor
+
+
+def _load_predictor(version: Optional[Tuple]) -> Predictor:
+    try:
+        with open(MODEL_PATH, 'rb') as file:
+            model = pickle.load(file)
+        catalog = load_embeddings(FEATURES_PATH, model_name=ENCODER_NAME)
+    except FileNotFoundError:
+        raise HTTPException(status_code=503,
+                            detail='Модель матчинга ещё не обучена')
+
+    index = None
+    if MATCHING_INDEX:
+        index = get_catalog_index(catalog, MATCHING_INDEX)
+    elif isinstance(model, Reranker):
+        # точный индекс для кандидатов Reranker строится один раз
+        index = exact_index(catalog.features, catalog.ids)
+
+    return Predictor(model, np.asarray(catalog.ids), catalog.features, index,
+                     version)
+
+
+def warmup_predictor() -> None:
+    """Загружаем модель и каталог заранее, если модель уже обучена."""
+
+    try:
+        get_predictor()
+    except HTTPException as e:
+        print(f'Онлайн-предсказание недоступно: {e.detail}.')
+
+
+def predict_titles(titles: Sequence[str], k: int = 5) -> List[Prediction]:
+    """k лучших товаров «Просепт» для каждого названия дилера.
+
+    Одинаковые названия внутри батча векторизуются один раз.
+
+    Args:
+        - titles (Sequence[str]): Названия товаров дилеров.
+        - k (int): Количество товаров в ответе.
+
+    Returns:
+        - List[Prediction]: Для каждого названия список пар
+          (ID товара, оценка) по убыванию оценки.
+    """
+
+    predictor = get_predictor()
+
+    codes, unique = pd.factorize(pd.Series(normalize_titles(titles)))
+    features_mdp = embed_texts(unique.tolist(), progress=False)
+    ids, scores = predict_top(
+        predictor.model, features_mdp, predictor.features_mp,
+        predictor.catalog_ids, k=k, index=predictor.index,
+        candidates=MATCHING_CANDIDATES, titles=unique.tolist())
+
+    return [[(int(id), float(score)) for id, score in
+             zip(ids[code], scores[code]) if id >= 0]
+            for code in codes]
+
+
+class MicroBatcher:
+    """Собирает одновременные запросы в батчи.
+
+    Первый запрос в очереди ждёт не дольше max_wait секунд, пока
+    подойдут другие, затем весь батч (не больше max_batch_size
+    элементов) обрабатывается одним вызовом predict в пуле потоков.
+    Батчи обрабатываются по одному, поэтому энкодер не используется
+    из нескольких потоков одновременно.
+
+    Args:
+        - predict (Callable): Функция: список элементов -> список результатов
+          той же длины.
+        - max_batch_size (int): Максимальный размер батча.
+        - max_wait (float): Максимальное ожидание батча в секундах.
+    """
+
+    def __init__(self, predict: Callable[[List], List],
+                 max_batch_size: int = MATCHING_BATCH_MAX_SIZE,
+                 max_wait: float = MATCHING_BATCH_MAX_WAIT_MS / 1000):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, item):
+        """Добавляем элемент в очередь и ждём результат для него."""
+
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+            self._loop = loop
+
+        future = loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def close(self) -> None:
+        """Останавливаем обработку, ожидающие запросы получают ошибку."""
+
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError('Предсказание остановлено'))
+        self._worker = None
+
+    async def _collect(self) -> List:
+        """Ждём первый элемент, затем добираем батч до размера или таймаута."""
+
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                getter = loop.create_task(self._queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=timeout)
+                if not done:
+                    # незавершённый get не забирает элемент из очереди
+                    getter.cancel()
+                    break
+                batch.append(getter.result())
+            else:
+                batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = [(item, future) for item, future in await self._collect()
+                     if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await run_in_threadpool(
+                    self.predict, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+batcher = MicroBatcher(predict_titles)
@@ -0,0 +1,325 @@
+"""Переранжирование K ближайших кандидатов вместо мультиклассовой модели.
+
+Для каждой строки дилера из каталога извлекаются K ближайших товаров,
+для каждой пары (строка дилера, кандидат) считаются признаки, а модель
+LightGBM (lambdarank или binary) оценивает кандидатов по отдельности.
+Размер модели и стоимость обучения и предсказания не зависят от
+количества товаров в каталоге.
+
+Кроме расстояний модель видит совпадение нормализованного названия
+дилера с названием кандидата: общие слова и числа (объём, артикул).
+Эти признаки различают товары, эмбеддинги которых почти совпадают.
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, Sequence, Tuple
+
+import lightgbm as lgb
+import numpy as np
+from sklearn.model_selection import train_test_split
+
+from app.config import MATCHING_CANDIDATES, MATCHING_RERANKER_OBJECTIVE
+
+from .embedding_store import CatalogEmbeddings
+from .index import VectorIndex, build_index
+from .topk import top_k
+
+FEATURE_NAMES = [
+    'distance',
+    'rank',
+    'delta_first',
+    'ratio_first',
+    'gap_next',
+    'delta_mean',
+    'zscore',
+    'token_overlap',
+    'number_match',
+]
+
+OBJECTIVES = ('lambdarank', 'binary')
+
+
+def retrieve(
+    features_mdp: np.ndarray,
+    features_mp: np.ndarray,
+    catalog_ids: np.ndarray,
+    candidates: int = MATCHING_CANDIDATES,
+    index: Optional[VectorIndex] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Ближайшие товары каталога для каждой строки дилера.
+
+    Args:
+        - features_mdp (np.ndarray): Эмбеддинги строк дилеров.
+        - features_mp (np.ndarray): Эмбеддинги каталога.
+        - catalog_ids (np.ndarray): ID товаров каталога.
+        - candidates (int): Количество кандидатов.
+        - index (Optional[VectorIndex]): Векторный индекс каталога. Если не
+          передан, используется точный поиск.
+
+    Returns:
+        - Tuple[np.ndarray, np.ndarray]: Расстояния и ID кандидатов (N x K),
+          -1 если кандидат не найден.
+    """
+
+    if index is None:
+        index = exact_index(features_mp, catalog_ids)
+    return index.search(features_mdp, candidates)
+
+
+def exact_index(features_mp: np.ndarray,
+                catalog_ids: np.ndarray) -> VectorIndex:
+    """Точный индекс каталога для retrieve.
+
+    Индекс копирует каталог в float64, поэтому его строят один раз на
+    каталог и передают в retrieve, а не строят на каждый чанк.
+    """
+
+    return build_index(
+        CatalogEmbeddings(features_mp, np.asarray(catalog_ids), ''), 'exact')
+
+
+@lru_cache(maxsize=1 << 16)
+def title_tokens(title: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Слова и числа нормализованного названия."""
+
+    words = frozenset(title.split())
+    return words, frozenset(word for word in words if word.isdigit())
+
+
+def text_features(
+    titles: Optional[Sequence[str]],
+    ids: np.ndarray,
+    catalog_titles: Optional[Dict[int, str]]
+) -> np.ndarray:
+    """Признаки совпадения названий строки дилера и кандидата (N x K x 2).
+
+    - token_overlap: доля общих слов (коэффициент Жаккара).
+    - number_match: доля чисел из названия дилера, которые есть в
+      названии кандидата.
+
+    Если названий нет, признаки равны нулю.
+
+    Args:
+        - titles (Optional[Sequence[str]]): Нормализованные названия
+          строк дилеров.
+        - ids (np.ndarray): ID кандидатов (N x K), -1 если кандидат не найден.
+        - catalog_titles (Optional[Dict[int, str]]): Нормализованные
+          названия товаров каталога по ID.
+    """
+
+    features = np.zeros(ids.shape + (2,))
+    if titles is None or not catalog_titles:
+        return features
+
+    for row, title in enumerate(titles):
+        words, numbers = title_tokens(title)
+        for col, id in enumerate(ids[row].tolist()):
+            name = catalog_titles.get(id)
+            if name is None:
+                continue
+            name_words, name_numbers = title_tokens(name)
+            union = len(words | name_words)
+            if union:
+                features[row, col, 0] = len(words & name_words) / union
+            if numbers:
+                features[row, col, 1] = len(numbers & name_numbers) / len(numbers)
+    return features
+
+
+def rerank_features(
+    distances: np.ndarray,
+    ids: np.ndarray,
+    titles: Optional[Sequence[str]] = None,
+    catalog_titles: Optional[Dict[int, str]] = None
+) -> np.ndarray:
+    """Признаки для каждой пары (строка дилера, кандидат).
+
+    Признаки расстояний считаются внутри списка кандидатов строки,
+    признаки названий - по паре названий, поэтому их количество не
+    зависит от размера каталога.
+
+    Args:
+        - distances (np.ndarray): Расстояния до кандидатов (N x K).
+        - ids (np.ndarray): ID кандидатов (N x K), -1 если кандидат не найден.
+        - titles (Optional[Sequence[str]]): Нормализованные названия строк
+          дилеров.
+        - catalog_titles (Optional[Dict[int, str]]): Нормализованные
+          названия товаров каталога по ID.
+
+    Returns:
+        - np.ndarray: Матрица признаков (N * K x len(FEATURE_NAMES)).
+    """
+
+    n_rows, width = distances.shape
+    found = ids >= 0
+    distances = distances.astype(np.float64)
+    # ненайденные кандидаты получают расстояние последнего найденного
+    last = np.where(found, distances, -np.inf).max(axis=1, keepdims=True)
+    distances = np.where(found, distances, last)
+
+    first = distances[:, :1]
+    mean = distances.mean(axis=1, keepdims=True)
+    std = distances.std(axis=1, keepdims=True)
+    gap_next = np.zeros_like(distances)
+    gap_next[:, :-1] = np.diff(distances, axis=1)
+
+    features = np.stack([
+        distances,
+        np.broadcast_to(np.arange(width, dtype=np.float64), distances.shape),
+        distances - first,
+        distances / np.maximum(first, 1e-12),
+        gap_next,
+        distances - mean,
+        (distances - mean) / np.maximum(std, 1e-12),
+    ], axis=2)
+    features = np.concatenate(
+        [features, text_features(titles, ids, catalog_titles)], axis=2)
+    return features.reshape(n_rows * width, len(FEATURE_NAMES))
+
+
+class Reranker:
+    """Модель переранжирования кандидатов.
+
+    Args:
+        - booster (lgb.Booster): Обученная модель LightGBM.
+        - candidates (int): Количество кандидатов, на котором обучена модель.
+        - objective (str): Функция потерь: «lambdarank» или «binary».
+        - catalog_titles (Optional[Dict[int, str]]): Нормализованные
+          названия товаров каталога, на котором обучена модель.
+    """
+
+    def __init__(self, booster: lgb.Booster, candidates: int,
+                 objective: str = MATCHING_RERANKER_OBJECTIVE,
+                 catalog_titles: Optional[Dict[int, str]] = None):
+        self.booster = booster
+        self.candidates = candidates
+        self.objective = objective
+        self.catalog_titles = catalog_titles
+
+    def scores(self, distances: np.ndarray, ids: np.ndarray,
+               titles: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Оценки кандидатов (N x K), -inf для ненайденных."""
+
+        features = rerank_features(
+            distances, ids, titles, getattr(self, 'catalog_titles', None))
+        # модели, обученные до признаков названий, видят только первые
+        # признаки расстояний
+        scores = self.booster.predict(
+            features[:, :self.booster.num_feature()],
+            num_iteration=self.booster.best_iteration).reshape(ids.shape)
+        scores[ids < 0] = -np.inf
+        return scores
+
+    def predict_top(self, distances: np.ndarray, ids: np.ndarray,
+                    k: int = 5, titles: Optional[Sequence[str]] = None
+                    ) -> Tuple[np.ndarray, np.ndarray]:
+        """ID и оценки k лучших кандидатов для каждой строки дилера.
+
+        Args:
+            - distances (np.ndarray): Расстояния до кандидатов (N x K).
+            - ids (np.ndarray): ID кандидатов (N x K).
+            - k (int): Количество id в ответе.
+            - titles (Optional[Sequence[str]]): Нормализованные названия
+              строк дилеров.
+
+        Returns:
+            - Tuple[np.ndarray, np.ndarray]: ID товаров (N x k) по убыванию
+              оценки и их оценки.
+        """
+
+        scores = self.scores(distances, ids, titles)
+        best = top_k(scores, min(k, ids.shape[1]), largest=True)
+        return (np.take_along_axis(ids, best, axis=1),
+                np.take_along_axis(scores, best, axis=1))
+
+    def predict(self, distances: np.ndarray, ids: np.ndarray,
+                k: int = 5, titles: Optional[Sequence[str]] = None
+                ) -> np.ndarray:
+        """ID k лучших кандидатов для каждой строки дилера (N x k)."""
+
+        return self.predict_top(distances, ids, k, titles)[0]
+
+
+def train_reranker(
+    features_mdp: np.ndarray,
+    features_mp: np.ndarray,
+    catalog_ids: np.ndarray,
+    product_ids: np.ndarray,
+    candidates: int = MATCHING_CANDIDATES,
+    objective: str = MATCHING_RERANKER_OBJECTIVE,
+    num_round: int = 100,
+    titles: Optional[Sequence[str]] = None,
+    catalog_titles: Optional[Sequence[str]] = None
+) -> Reranker:
+    """Обучаем модель переранжирования.
+
+    Строки дилеров, у которых верного товара нет среди кандидатов, для
+    lambdarank не несут информации и в обучение не попадают.
+
+    Args:
+        - features_mdp (np.ndarray): Эмбеддинги строк дилеров.
+        - features_mp (np.ndarray): Эмбеддинги каталога.
+        - catalog_ids (np.ndarray): ID товаров каталога.
+        - product_ids (np.ndarray): Верный ID товара для каждой строки дилера.
+        - candidates (int): Количество кандидатов на строку.
+        - objective (str): Функция потерь: «lambdarank» или «binary».
+        - num_round (int): Количество итераций бустинга.
+        - titles (Optional[Sequence[str]]): Нормализованные названия строк
+          дилеров.
+        - catalog_titles (Optional[Sequence[str]]): Нормализованные
+          названия товаров каталога в порядке catalog_ids.
+
+    Raises:
+        - ValueError: Неизвестная функция потерь.
+
+    Returns:
+        - Reranker: Обученная модель.
+    """
+
+    if objective not in OBJECTIVES:
+        raise ValueError(f'Неизвестная функция потерь: {objective}')
+
+    if catalog_titles is not None:
+        catalog_titles = dict(zip(np.asarray(catalog_ids).tolist(),
+                                  catalog_titles))
+    titles = np.asarray(titles if titles is not None else [''] * len(
+        features_mdp), dtype=object)
+
+    distances, ids = retrieve(features_mdp, features_mp, catalog_ids,
+                              candidates)
+    labels = (ids == np.asarray(product_ids)[:, None]).astype(np.float64)
+    if objective == 'lambdarank':
+        has_positive = labels.any(axis=1)
+        distances, ids, labels, titles = (
+            distances[has_positive], ids[has_positive],
+            labels[has_positive], titles[has_positive])
+
+    rows_train, rows_test = train_test_split(np.arange(ids.shape[0]))
+    width = ids.shape[1]
+
+    params = {
+        'objective': objective,
+        'metric': 'ndcg' if objective == 'lambdarank' else 'binary_logloss',
+        'verbose': -1,
+        'learning_rate': 0.05,
+        'num_leaves': 15,
+        'min_data_in_leaf': 20,
+        'feature_fraction': 0.8,
+    }
+    if objective == 'lambdarank':
+        params['eval_at'] = [5]
+
+    def dataset(rows, reference=None):
+        return lgb.Dataset(
+            rerank_features(distances[rows], ids[rows], titles[rows],
+                            catalog_titles),
+            label=labels[rows].ravel(),
+            group=np.full(rows.shape[0], width),
+            feature_name=FEATURE_NAMES,
+            reference=reference)
+
+    train_data = dataset(rows_train)
+    valid_data = dataset(rows_test, reference=train_data)
+
+    booster = lgb.train(params, train_data, num_round,
+                        valid_sets=[valid_data])
+    return Reranker(booster, width, objective, catalog_titles)
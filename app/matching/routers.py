@@ -1,76 +1,198 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Path, status
+from fastapi import (APIRouter, Body, Depends, Header, HTTPException, Path,
+                     Query, Response, status)
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import MATCHING_PAGE_MAX_SIZE
 from app.db.database import get_db
-from app.products.models import MarketingDealerPrice, MarketingProduct
-
-from .crud import (create_dealer_product, get_5_prosept_products,
-                   get_data_by_id, get_data_matching_product_dealer,
-                   get_dealer_name, get_match_positive_product_dealer,
-                   patch_dealer_product, save_delete_dealer_product,
-                   update_statistics)
-from .models import Statistics
-from .schemas import (DealerProductModel, MatchingProductDealerModel,
+from app.products.models import MarketingDealerPrice
+
+from .cards import cards_response, read_cards
+from .catalog_cache import bump_catalog_version, catalog_cache
+from .crud import (DEFAULT_OPERATOR_ID, apply_decisions, count_matching_cards,
+                   create_dealer_product, decode_cursor, encode_cursor,
+                   get_data_by_id, get_statistics_totals,
+                   patch_dealer_product, save_delete_dealer_product)
+from .export import (CSV, MATCHING_CSV_COLUMNS, NDJSON, POSITIVE_CSV_COLUMNS,
+                     card_json, dealer_product_model, iter_matching_cards,
+                     iter_positive_pairs, matching_card_model,
+                     matching_csv_row, positive_csv_row, streaming_media_type,
+                     streaming_response)
+from .jobs import cancel_job, create_job, get_job, submit_job
+from .leases import claim_cards
+from .schemas import (CatalogCacheStats, MatchingDecision,
+                      MatchingDecisionResult, MatchingJobModel,
+                      MatchingPredictionModel, MatchingPredictRequest,
+                      MatchingProductDealerModel,
                       MatchPositiveProductDealerModel, ProductData,
                       StatisticsData)
 
 api_version1 = APIRouter()
 
+# Потоковые форматы ответа, выбираются заголовком Accept
+STREAMING_RESPONSES = {200: {'content': {NDJSON: {}, CSV: {}}}}
+
 
 @api_version1.get('/api/v1/matching', tags=['Матчинг'],
                   response_model=List[MatchingProductDealerModel],
+                  responses=STREAMING_RESPONSES,
                   summary=('Список наиболее вероятных карточек '
                            'производителя для каждой карточки дилера'))
-async def read_dealer_product(db: AsyncSession = Depends(get_db)):
+async def read_dealer_product(
+    limit: Optional[int] = Query(
+        None, ge=1, le=MATCHING_PAGE_MAX_SIZE,
+        description='Количество карточек на странице. Без него - все карточки'),
+    after: Optional[str] = Query(
+        None, description='Курсор из заголовка X-Next-Cursor прошлой страницы'),
+    dealer_id: Optional[int] = Query(None, description='ID дилера'),
+    accept: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
     """
-    - Получаем все объекты модели «MatchingProductDealer».
+    - Получаем объекты модели «MatchingProductDealer» в порядке (order, id).
     - В каждом объекте одна карточка дилера и пять карточек товаров «Просепт».
+    - Карточки хранятся в БД готовыми (см. cards.py) и читаются одним
+      запросом по индексу, без JOIN с карточками дилеров и товарами.
+    - С параметром limit возвращается одна страница. В заголовке
+      X-Next-Cursor курсор следующей страницы, его передают в after.
+    - В заголовке X-Total-Count количество карточек в очереди, без
+      фильтра по дилеру оно приблизительное.
+    - С заголовком Accept: application/x-ndjson или text/csv карточки
+      отдаются потоком по мере чтения из БД, без заголовков X-Total-Count
+      и X-Next-Cursor.
     """
 
-    response = []
+    cursor = decode_cursor(after) if after is not None else None
 
-    matching_products = await get_data_matching_product_dealer(db)
-    for matching_product in matching_products:
-        """
-        Получаем один объект дилера, и получаем для него все
-        необходимые значения, которые нужно передать фронтам
-        """
-        dealer_product = await get_data_by_id(
-            db, MarketingDealerPrice,
-            matching_product.dealer_product_id)
-
-        dealer_pydantic = DealerProductModel(
-            id=dealer_product.id,
-            product_name=dealer_product.product_name,
-            price=dealer_product.price,
-            product_url=dealer_product.product_url,
-            dealer_name=await get_dealer_name(db, dealer_product.dealer_id))
-
-        """
-        - Получаем сразу все 5 карточек товаров Просепт по значениям ID
-          из списка product_ids.
-        - Сортируем их в первоночальном варианте.
-        """
-        prosept_products = await get_5_prosept_products(
-            db, matching_product.product_ids)
-
-        products_dict = {product.id: product for product in prosept_products}
-        sorted_products = [products_dict[id] for id in
-                           matching_product.product_ids if id in products_dict]
-
-        # Сохраняем результат
-        lst_dict_products = [item.to_dict() for item in sorted_products]
-        response.append(MatchingProductDealerModel(
-            id=matching_product.id,
-            dealer_product=dealer_pydantic,
-            products=lst_dict_products
-        ))
+    media_type = streaming_media_type(accept)
+    if media_type is not None:
+        return streaming_response(
+            iter_matching_cards(db, limit, cursor, dealer_id), media_type,
+            MATCHING_CSV_COLUMNS, matching_csv_row, 'matching', card_json)
+
+    cards = await read_cards(db, limit=limit, after=cursor, dealer_id=dealer_id)
 
+    # готовый JSON карточек из БД отдаётся без повторной сериализации
+    response = cards_response(cards)
+    response.headers['X-Total-Count'] = str(
+        await count_matching_cards(db, dealer_id))
+    if limit is not None and len(cards) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(
+            cards[-1].order, cards[-1].id)
     return response
 
 
+@api_version1.get('/api/v1/matching/next', tags=['Матчинг'],
+                  response_model=List[MatchingProductDealerModel],
+                  summary='Взять следующие карточки в работу')
+async def read_next_products(
+    response: Response,
+    n: int = Query(10, ge=1, le=MATCHING_PAGE_MAX_SIZE,
+                   description='Количество карточек'),
+    dealer_id: Optional[int] = Query(None, description='ID дилера'),
+    operator_id: int = Header(DEFAULT_OPERATOR_ID, alias='X-Operator-Id',
+                              description='ID оператора'),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    - Закрепляем за оператором n первых карточек очереди, которые не
+      взял в работу другой оператор.
+    - Карточки, которые оператор уже взял, возвращаются снова, аренда
+      продлевается. В заголовке X-Lease-Expires время окончания аренды.
+    - Принять, отложить или удалить арендованную карточку может только
+      оператор, который её взял. «Отложить» снимает аренду.
+    """
+
+    cards = await claim_cards(db, operator_id, n, dealer_id)
+    if cards:
+        response.headers['X-Lease-Expires'] = (
+            cards[0][0].leased_until.isoformat())
+
+    products_dict = await catalog_cache.get_products(
+        db, [id for matching_product, _, _ in cards
+             for id in matching_product.product_ids])
+
+    return [matching_card_model(*row, products_dict) for row in cards]
+
+
+@api_version1.get('/api/v1/matching/accepted', tags=['Матчинг'],
+                  response_model=List[MatchPositiveProductDealerModel],
+                  responses=STREAMING_RESPONSES,
+                  summary='Выгрузка карточек, принятых оператором')
+async def read_accepted_products(
+    accept: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    - Получаем все объекты модели «MatchPositiveProductDealer» с карточкой
+      дилера и выбранной карточкой «Просепт».
+    - С заголовком Accept: application/x-ndjson или text/csv пары
+      отдаются потоком по мере чтения из БД.
+    """
+
+    chunks = iter_positive_pairs(db)
+    media_type = streaming_media_type(accept)
+    if media_type is not None:
+        return streaming_response(chunks, media_type, POSITIVE_CSV_COLUMNS,
+                                  positive_csv_row, 'accepted')
+    return [pair async for chunk in chunks for pair in chunk]
+
+
+@api_version1.post('/api/v1/matching/predict', tags=['Матчинг'],
+                   response_model=MatchingPredictionModel,
+                   summary='Пять наиболее вероятных товаров для одной карточки')
+async def predict_product(
+    data: MatchingPredictRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    - Принимаем название товара дилера или ID карточки дилера.
+    - Возвращаем пять ID товаров «Просепт» с оценками модели.
+    - Одновременные запросы обрабатываются одним батчем.
+    """
+
+    # Импорт внутри функции, что-бы API не загружал torch до первого запроса
+    from .predictor import batcher
+
+    product_name = data.product_name
+    if product_name is None:
+        dealer_product = await get_data_by_id(
+            db, MarketingDealerPrice, data.dealer_product_id)
+        if dealer_product is None:
+            raise HTTPException(status_code=404,
+                                detail='Карточка дилера не найдена')
+        product_name = dealer_product.product_name
+
+    products = await batcher.submit(product_name)
+    return MatchingPredictionModel(
+        product_name=product_name,
+        products=[{'id': id, 'score': score} for id, score in products])
+
+
+@api_version1.post('/api/v1/matching/batch', tags=['Матчинг'],
+                   response_model=List[MatchingDecisionResult],
+                   summary='Пакет решений оператора')
+async def post_decisions(
+    decisions: List[MatchingDecision] = Body(
+        ..., min_length=1, max_length=MATCHING_PAGE_MAX_SIZE,
+        description='Решения оператора'),
+    operator_id: int = Header(DEFAULT_OPERATOR_ID, alias='X-Operator-Id',
+                              description='ID оператора'),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    - Принимаем, откладываем и удаляем карточки дилеров пакетом, в одной
+      транзакции.
+    - Для каждого решения возвращается результат: status 200, если оно
+      применено, 404 или 409 с причиной, если нет. Отклонённые решения
+      не мешают остальным.
+    """
+
+    return await apply_decisions(
+        db, [decision.model_dump() for decision in decisions], operator_id)
+
+
 @api_version1.post('/api/v1/matching/{dealer_product_id}', tags=['Матчинг'],
                    response_model=MatchPositiveProductDealerModel,
                    status_code=status.HTTP_201_CREATED,
@@ -78,6 +200,8 @@ async def read_dealer_product(db: AsyncSession = Depends(get_db)):
 async def post_product(
         prosept_product_id: ProductData,
         dealer_product_id: int = Path(..., description='ID карточки дилера'),
+        operator_id: int = Header(DEFAULT_OPERATOR_ID, alias='X-Operator-Id',
+                                  description='ID оператора'),
         db: AsyncSession = Depends(get_db)
 ):
     """
@@ -89,26 +213,14 @@ async def post_product(
 
     prosept_id = prosept_product_id.prosept_id
 
-    await create_dealer_product(db, dealer_product_id, prosept_id)
-    await update_statistics(db, 'accepted_cards')
-
-    created_object = await get_match_positive_product_dealer(
-        db, dealer_product_id, prosept_id)
-
-    dealer_product = await get_data_by_id(
-        db, MarketingDealerPrice, created_object.dealer_product_id)
+    pair_id, product_id, dealer_product, dealer_name = (
+        await create_dealer_product(
+            db, dealer_product_id, prosept_id, operator_id))
 
-    dealer_pydantic = DealerProductModel(
-        id=dealer_product.id,
-        product_name=dealer_product.product_name,
-        price=dealer_product.price,
-        product_url=dealer_product.product_url,
-        dealer_name=await get_dealer_name(db, dealer_product.dealer_id))
-
-    prosept = await get_data_by_id(db, MarketingProduct, created_object.product_id)
+    prosept = (await catalog_cache.get_products(db, [product_id]))[product_id]
     response = MatchPositiveProductDealerModel(
-        id=created_object.id,
-        dealer_product=dealer_pydantic,
+        id=pair_id,
+        dealer_product=dealer_product_model(dealer_product, dealer_name),
         prosept_product=prosept.to_dict()
     )
     return response
@@ -119,6 +231,8 @@ async def post_product(
                     summary='Перенести карточку дилера в конец списка')
 async def patch_product(
     dealer_product_id: int = Path(..., description='ID карточки дилера'),
+    operator_id: int = Header(DEFAULT_OPERATOR_ID, alias='X-Operator-Id',
+                              description='ID оператора'),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -127,8 +241,7 @@ async def patch_product(
     - Переносим выбранную карточку дилера в конец списка.
     """
 
-    await patch_dealer_product(db, dealer_product_id)
-    await update_statistics(db, 'postponed_cards')
+    await patch_dealer_product(db, dealer_product_id, operator_id)
 
 
 @api_version1.delete('/api/v1/matching/{dealer_product_id}',
@@ -137,6 +250,8 @@ async def patch_product(
                      summary='Удалить карточку дилера')
 async def delete_product(
     dealer_product_id: int = Path(..., description='ID карточки дилера'),
+    operator_id: int = Header(DEFAULT_OPERATOR_ID, alias='X-Operator-Id',
+                              description='ID оператора'),
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -146,34 +261,103 @@ async def delete_product(
     - Удаляем карточку дилера и 5 связанных с ним карточек товаров «Просепт».
     """
 
-    await save_delete_dealer_product(db, dealer_product_id)
-    await update_statistics(db, 'delete_cards')
+    await save_delete_dealer_product(db, dealer_product_id, operator_id)
 
 
 @api_version1.get('/api/v1/statistics', tags=['Статистика'],
                   response_model=StatisticsData,
                   summary='Статистика работы оператора')
-async def get_statistics(db: AsyncSession = Depends(get_db)):
+async def get_statistics(
+    operator_id: Optional[int] = Query(
+        None, description='ID оператора, без него - по всем операторам'),
+    db: AsyncSession = Depends(get_db)
+):
     """Собираем статистику по работе оператора."""
 
-    id = 1  # В теории тут можно будет передавать ID оператора
-    obj = await get_data_by_id(db, Statistics, id)
+    totals = await get_statistics_totals(db, operator_id)
+    accepted_cards = totals['accepted_cards']
 
     # Общее количество проверенных карточек
-    total_cards_checked = (obj.accepted_cards + obj.delete_cards +
-                           obj.postponed_cards)
+    total_cards_checked = sum(totals.values())
 
     # Процент принятых карточек
     if total_cards_checked == 0:
         percentage_accepted_cards = 0
     else:
-        percentage_accepted_cards = (obj.accepted_cards/total_cards_checked) * 100
+        percentage_accepted_cards = (accepted_cards/total_cards_checked) * 100
 
     response = StatisticsData(
         total_cards_checked=total_cards_checked,
-        accepted_cards=obj.accepted_cards,
-        delete_cards=obj.delete_cards,
-        postponed_cards=obj.postponed_cards,
+        accepted_cards=accepted_cards,
+        delete_cards=totals['delete_cards'],
+        postponed_cards=totals['postponed_cards'],
         percentage_accepted_cards=round(percentage_accepted_cards, 2)
     )
     return response
+
+
+@api_version1.post('/api/v1/matching-jobs', tags=['Перематчинг'],
+                   response_model=MatchingJobModel,
+                   status_code=status.HTTP_202_ACCEPTED,
+                   summary='Запустить перематчинг карточек дилеров')
+async def start_matching_job(db: AsyncSession = Depends(get_db)):
+    """
+    - Создаём задачу со статусом queued и запускаем её в отдельном процессе.
+    - Если перематчинг уже выполняется, вернётся ошибка 409.
+    """
+
+    job = await create_job(db)
+    submit_job(job.id)
+    return job
+
+
+@api_version1.get('/api/v1/matching-jobs/{job_id}', tags=['Перематчинг'],
+                  response_model=MatchingJobModel,
+                  summary='Статус и прогресс задачи перематчинга')
+async def read_matching_job(
+    job_id: int = Path(..., description='ID задачи'),
+    db: AsyncSession = Depends(get_db)
+):
+    """Получаем статус, прогресс и время выполнения задачи."""
+
+    return await get_job(db, job_id)
+
+
+@api_version1.post('/api/v1/matching-jobs/{job_id}/cancel',
+                   tags=['Перематчинг'], response_model=MatchingJobModel,
+                   summary='Отменить задачу перематчинга')
+async def cancel_matching_job(
+    job_id: int = Path(..., description='ID задачи'),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    - Задача из очереди не запустится.
+    - Выполняющаяся задача остановится после текущего чанка, уже
+      сохранённые результаты остаются в БД. До остановки поле
+      finished_at пустое, и новую задачу запустить нельзя.
+    """
+
+    return await cancel_job(db, job_id)
+
+
+@api_version1.get('/api/v1/catalog-cache', tags=['Кэш каталога'],
+                  response_model=CatalogCacheStats,
+                  summary='Состояние кэша каталога в этом процессе')
+async def read_catalog_cache():
+    """Версия каталога, размер кэша, количество попаданий и промахов."""
+
+    return catalog_cache.stats()
+
+
+@api_version1.post('/api/v1/catalog-cache/invalidate', tags=['Кэш каталога'],
+                   response_model=CatalogCacheStats,
+                   summary='Сбросить кэш каталога')
+async def invalidate_catalog_cache(db: AsyncSession = Depends(get_db)):
+    """
+    - Увеличиваем версию каталога, все процессы приложения перечитают
+      каталог не позже чем через CATALOG_CACHE_TTL секунд.
+    - Кэш этого процесса сбрасывается сразу.
+    """
+
+    await bump_catalog_version(db)
+    return catalog_cache.stats()
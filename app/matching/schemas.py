@@ -1,4 +1,7 @@
-from pydantic import BaseModel, Field, conlist
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, conlist, model_validator
 
 
 class DealerProductModel(BaseModel):
@@ -32,6 +35,30 @@ class ProductData(BaseModel):
         description='ID карточки товара от Просепт.')
 
 
+class MatchingDecision(BaseModel):
+    dealer_product_id: int = Field(description='ID карточки дилера')
+    action: Literal['accept', 'postpone', 'delete'] = Field(
+        description='Решение: принять, отложить или удалить')
+    prosept_id: Optional[int] = Field(
+        default=None, description='ID товара Просепт, только для accept')
+
+    @model_validator(mode='after')
+    def check_prosept_id(self):
+        if (self.action == 'accept') != (self.prosept_id is not None):
+            raise ValueError('prosept_id передаётся только для accept')
+        return self
+
+
+class MatchingDecisionResult(BaseModel):
+    dealer_product_id: int = Field(description='ID карточки дилера')
+    action: str = Field(description='Решение')
+    status: int = Field(
+        description='200 - применено, 404 или 409 - решение отклонено')
+    detail: Optional[str] = Field(description='Причина отказа')
+    id: Optional[int] = Field(
+        description='ID принятой пары в БД, только для accept')
+
+
 class StatisticsData(BaseModel):
     total_cards_checked: int = Field(
         description='Общее количество проверенных карточек'
@@ -47,3 +74,53 @@ class MatchPositiveProductDealerModel(BaseModel):
     id: int = Field(description='ID объекта в БД')
     dealer_product: DealerProductModel = Field(description='Карточка товара дилера')
     prosept_product: ProseptProductModel = Field(description='Карточка товара Просепт')
+
+
+class MatchingJobModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int = Field(description='ID задачи')
+    status: str = Field(
+        description='Статус: queued, running, done, failed или cancelled')
+    processed: int = Field(
+        description='Количество обработанных карточек дилеров')
+    total: Optional[int] = Field(description='Количество карточек дилеров')
+    error: Optional[str] = Field(description='Текст ошибки')
+    created_at: Optional[datetime] = Field(description='Время создания')
+    started_at: Optional[datetime] = Field(description='Время запуска')
+    finished_at: Optional[datetime] = Field(description='Время завершения')
+    heartbeat_at: Optional[datetime] = Field(
+        description='Последняя отметка процесса задачи')
+
+
+class MatchingPredictRequest(BaseModel):
+    product_name: Optional[str] = Field(
+        default=None, min_length=1, description='Название товара дилера')
+    dealer_product_id: Optional[int] = Field(
+        default=None, description='ID карточки дилера')
+
+    @model_validator(mode='after')
+    def check_one_source(self):
+        if (self.product_name is None) == (self.dealer_product_id is None):
+            raise ValueError(
+                'Нужно передать product_name или dealer_product_id')
+        return self
+
+
+class ProductScoreModel(BaseModel):
+    id: int = Field(description='ID товара Просепт')
+    score: float = Field(description='Оценка модели')
+
+
+class MatchingPredictionModel(BaseModel):
+    product_name: str = Field(description='Название товара дилера')
+    products: List[ProductScoreModel] = Field(
+        description='Товары Просепт по убыванию оценки')
+
+
+class CatalogCacheStats(BaseModel):
+    version: int = Field(description='Версия каталога в кэше, -1 - кэш пуст')
+    products: int = Field(description='Количество товаров Просепт в кэше')
+    dealers: int = Field(description='Количество дилеров в кэше')
+    hits: int = Field(description='Количество попаданий в кэш')
+    misses: int = Field(description='Количество промахов кэша')
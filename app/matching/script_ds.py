@@ -1,82 +1,140 @@
 """Функция для обучения модели и функция для предсказания от DS."""
 import os
 import pickle
-import re
-from typing import Dict, List
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import lightgbm as lgb
-import nltk
 import numpy as np
 import pandas as pd
-import torch
-import transformers
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer, WordNetLemmatizer
-from nltk.tokenize import word_tokenize
 from scipy.spatial.distance import cdist
 from sklearn.model_selection import train_test_split
-from tqdm import tqdm
 
-nltk.download('stopwords', quiet=True)
-nltk.download('punkt', quiet=True)
-nltk.download('wordnet', quiet=True)
-nltk.download('omw-1.4', quiet=True)
+from app.config import (ENCODER_NAME, MATCHING_CANDIDATES, MATCHING_MODEL,
+                        MATCHING_PREDICT_CHUNK_SIZE, MATCHING_WORKERS)
+
+from .embedding_cache import EmbeddingCache
+from .embedding_store import CatalogEmbeddings, save_embeddings
+from .embeddings import embed_texts
+from .normalizer import normalize_titles
+from .reranker import Reranker, exact_index, retrieve, train_reranker
+from .topk import sort_rows, top_k
+
 pd.options.mode.chained_assignment = None
 
 
-def matching_training(
+def tokenize(df, name):
+    """
+    Функция для подготовки к векторизации: разделение склеенных слов,
+    токенизация, лемматизация, стем, избавление от стоп-слов,
+    приведение к нижнему регистру.
+    """
+
+    df[name + '_tok'] = normalize_titles(df[name], workers=MATCHING_WORKERS)
+    return df
+
+
+def remove_row_dealer(data_mp, data_mdp, data_mpdk, nm='name'):
+    """Функция для удаления строк из данных от дилеров.
+
+    Удаляются строки, для которых нет значений id продуктов
+    из данных производителя и строки, id из данных производителя
+    которых совпадают с id удаляемых строк из данных производителя
+    с отсутствующими описаниями.
+    """
+    test_null = data_mdp.merge(
+        data_mpdk,
+        how='left',
+        left_on='product_key',
+        right_on='key').loc[:, ['product_key', 'key', 'product_id']]
+
+    ind_drop = test_null.loc[test_null['product_id'].isnull()].index.values
+    data_mdp.drop(ind_drop, axis=0, inplace=True)
+
+    id_drop = data_mp.loc[data_mp[nm].isnull()]['id']
+    drop = data_mpdk.loc[data_mpdk['product_id'].isin(id_drop), ['key', 'dealer_id']]
+
+    # анти-джойн по паре (product_key, dealer_id)
+    marked = data_mdp[['product_key', 'dealer_id']].reset_index().merge(
+        drop.drop_duplicates(),
+        how='left',
+        left_on=['product_key', 'dealer_id'],
+        right_on=['key', 'dealer_id'],
+        indicator=True)
+    ind_drop_mdp = marked.loc[marked['_merge'] == 'both', 'index'].values
+
+    data_mdp.drop(ind_drop_mdp, axis=0, inplace=True)
+    data_mdp.reset_index(drop=True, inplace=True)
+
+
+def build_target(ids_sorted: np.ndarray, product_ids: np.ndarray) -> pd.Series:
+    """Целевая переменная для обучения.
+
+    Для каждой строки дилера - номер столбца, в котором в отсортированном
+    по расстоянию списке товаров стоит верный id.
+
+    Args:
+        - ids_sorted (np.ndarray): ID товаров в порядке возрастания
+          расстояния (строки дилеров x товары).
+        - product_ids (np.ndarray): Верный ID товара для каждой строки.
+
+    Raises:
+        - ValueError: Если верного товара нет в каталоге.
+
+    Returns:
+        - pd.Series: Номер столбца с верным id (float64, как и раньше).
+    """
+
+    if ids_sorted.shape[0] != product_ids.shape[0]:
+        raise ValueError('Количество строк дилеров не совпадает с разметкой')
+
+    matches = ids_sorted == product_ids[:, None]
+    missing = np.flatnonzero(~matches.any(axis=1))
+    if missing.shape[0]:
+        raise ValueError(
+            f'Верный товар не найден в каталоге для строк: {missing.tolist()}')
+
+    return pd.Series(matches.argmax(axis=1).astype(np.float64), name='target')
+
+
+class TrainingData(NamedTuple):
+    """Эмбеддинги, разметка и нормализованные названия для обучения."""
+
+    features_mdp: np.ndarray
+    features_mp: np.ndarray
+    catalog_ids: np.ndarray
+    product_ids: np.ndarray
+    titles_mdp: List[str]
+    titles_mp: List[str]
+
+
+def training_data(
     lst_dict_pr: List[Dict],
     lst_dict_dr: List[Dict],
     lst_dict_k: List[Dict],
-    nm: str = 'name'
-):
-    """Функция для обучения модели.
+    nm: str = 'name',
+    cache: Optional[EmbeddingCache] = None
+) -> TrainingData:
+    """Подготавливаем эмбеддинги и разметку для обучения.
 
     Args:
         - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
         - lst_dict_dr (List[Dict]): Список словарей карточек дилеров для обучения.
         - lst_dict_k (List[Dict]): Список словарей внешних ключей.
         - nm (str): Столбец, по которому происходит сравнение(по умолчанию «name»).
+        - cache (Optional[EmbeddingCache]): Кэш эмбеддингов названий.
 
     Returns:
-        - Возвращает обученную модель, которую надо подставить на вход в функцию предсказаний.
+        - TrainingData: Эмбеддинги строк дилеров и каталога, ID товаров
+          каталога, верный ID товара для каждой строки дилера и
+          нормализованные названия строк дилеров и товаров каталога.
     """
 
     data_mdp = pd.DataFrame(lst_dict_dr)
     data_mp = pd.DataFrame(lst_dict_pr)
     data_mpdk = pd.DataFrame(lst_dict_k)
 
-    def remove_row_dealer(data_mp, data_mdp, data_mpdk):
-        """Функция для удаления строк из данных от дилеров.
-
-        Удаляются строки, для которых нет значений id продуктов
-        из данных производителя и строки, id из данных производителя
-        которых совпадают с id удаляемых строк из данных производителя
-        с отсутствующими описаниями.
-        """
-        test_null = data_mdp.merge(
-            data_mpdk,
-            how='left',
-            left_on='product_key',
-            right_on='key').loc[:, ['product_key', 'key', 'product_id']]
-
-        ind_drop = test_null.loc[test_null['product_id'].isnull()].index.values
-        data_mdp.drop(ind_drop, axis=0, inplace=True)
-
-        id_drop = data_mp.loc[data_mp[nm].isnull()]['id']
-        drop = data_mpdk.loc[data_mpdk['product_id'].isin(id_drop), ['key', 'dealer_id']]
-
-        ind_drop_mdp = []
-        for k, v in zip(drop['key'], drop['dealer_id']):
-            ind_drop_mdp.extend(list(data_mdp.loc[
-                (data_mdp['product_key'] == k) & (data_mdp['dealer_id'] == v)].index.values))
-
-        data_mdp.drop(ind_drop_mdp, axis=0, inplace=True)
-        data_mdp.reset_index(drop=True, inplace=True)
-
-        return
-
-    remove_row_dealer(data_mp, data_mdp, data_mpdk)
+    remove_row_dealer(data_mp, data_mdp, data_mpdk, nm)
 
     # удаляем пропуски в столбце name
     data_mp.dropna(subset=[nm], inplace=True)
@@ -84,136 +142,17 @@ def matching_training(
 
     data_mp_name = data_mp[['id', nm]]
 
-    def separation(s):
-        """
-        Функция для удаления знаков препинания,
-        а также для расклеивания склеенных слов,
-        то есть разделения пробелами латиницы от кириллицы,
-        чисел от букв и слов в верхнем регистре от слов
-        в нижнем регистре в склеенных словах.
-        """
-
-        s = re.sub(r'[^\w\s]', ' ', s)
-        lat = re.findall(r"[a-zA-Z]+", s)
-        num = re.findall(r"\d+", s)
-        up = re.findall(r"[А-Я]+", s)
-        for i in lat:
-            s = s.replace(i, ' ' + i + ' ')
-        for i in num:
-            s = s.replace(i, ' ' + i + ' ')
-        for i in up:
-            if len(i) > 1:
-                s = s.replace(i, ' ' + i + ' ')
-        s = ' '.join([i.lower() for i in s.split()])
-        return s
-
-    def tokenize(df, name):
-        """
-        Функция для подготовки к векторизации: разделение склеенных слов,
-        токенизация, лемматизация, стем, избавление от стоп-слов,
-        приведение к нижнему регистру.
-        """
-
-        stopword_en = stopwords.words('english')
-        stopword_ru = stopwords.words('russian')
-        porter = PorterStemmer()
-        lemmatizer = WordNetLemmatizer()
-        tokenized = []
-        for q in df[name]:
-            q = separation(q)
-            q = word_tokenize(q)
-            q = [lemmatizer.lemmatize(i) for i in q if
-                 (i not in stopword_en) and
-                 (i not in stopword_ru)]
-            q = [porter.stem(i) for i in q]
-            tokenized.append(q)
-        name_tok = []
-        for i in tokenized:
-            name_tok.append(' '.join(i))
-        df[name + '_tok'] = name_tok
-        return df
-
     # функция tokenize для данных от производителя
     # и для данных от диллеров
     tokenize(data_mp_name, nm)
     tokenize(data_mdp, 'product_name')
 
-    data_mp_id = data_mp_name.loc[:, ['id', nm + '_tok']]
-    data_mp_name.drop([nm, 'id'], axis=1, inplace=True)
-
-    # трансформер LaBSE
-    bert_name = 'sentence-transformers/LaBSE'
-    enc_tokenizer = transformers.AutoTokenizer.from_pretrained(bert_name)
-    encoder = transformers.AutoModel.from_pretrained(bert_name)
-
     data_train = pd.concat([data_mp_name[nm + '_tok'],
                             data_mdp['product_name_tok']], axis=0)
 
-    def embeddings(data):
-        """
-        Функция для получения эмбеддингов
-        """
-        tokenized = data.apply(lambda x: enc_tokenizer.encode(x,
-                                                              max_length=512,
-                                                              truncation=True,
-                                                              add_special_tokens=True))
-        max_len = 0
-        for i in tokenized.values:
-            if len(i) > max_len:
-                max_len = len(i)
-
-        padded = np.array(
-            [i + [0] * (max_len - len(i)) for i in tokenized.values])
-        attention_mask = np.where(padded != 0, 1, 0)
-
-        batch_size = 32
-        embeddings = []
-        for i in tqdm(range(padded.shape[0] // batch_size)):
-            batch = torch.LongTensor(
-                padded[batch_size * i:batch_size * (i + 1)])
-            attention_mask_batch = torch.LongTensor(
-                attention_mask[batch_size * i:batch_size * (i + 1)])
-            with torch.no_grad():
-                batch_embeddings = encoder(batch,
-                                           attention_mask=attention_mask_batch)
-            embeddings.append(batch_embeddings[0][:, 0, :].numpy())
-
-        features = np.concatenate(embeddings)
-        features = pd.DataFrame(features)
-
-        batch = torch.LongTensor(padded[features.shape[0]:])
-        attention_mask_batch = torch.LongTensor(
-            attention_mask[features.shape[0]:])
-        with torch.no_grad():
-            batch_embeddings = encoder(batch,
-                                       attention_mask=attention_mask_batch)
-        embeddings.append(batch_embeddings[0][:, 0, :].numpy())
-
-        features = np.concatenate(embeddings)
-        features = pd.DataFrame(features)
-
-        return features
-
-    features = embeddings(data_train)
-
-    features_mp = features[:data_mp.shape[0]]
-    features_mdp = features[data_mp.shape[0]:]
-
-    # рассчёт расстояний
-    res = cdist(features_mdp.values, features_mp.values, metric='euclidean')
-
-    # сортировка расстояний
-    res = pd.DataFrame(res)
-    res_sort = pd.DataFrame([np.sort(res.iloc[i, :]) for i in
-                             range(res.shape[0])])
-
-    # фрэйм отсортированных расстояний в значениях id
-    res_lm = pd.DataFrame(
-        [np.argsort(res.iloc[i, :]) for i in range(res.shape[0])])
-
-    df_res_lm = pd.DataFrame(
-        [[data_mp_id.loc[i, 'id'] for i in res_lm.loc[j, :]] for j in
-         range(res_lm.shape[0])])
+    # эмбеддинги трансформера LaBSE
+    features = embed_texts(data_train.tolist(), cache=cache,
+                           workers=MATCHING_WORKERS)
 
     testlm = data_mdp.merge(data_mpdk,
                             how='left',
@@ -222,26 +161,48 @@ def matching_training(
                                                     'key',
                                                     'product_id']]
 
-    testlm = pd.concat([testlm, df_res_lm], axis=1)
+    return TrainingData(
+        features[data_mp.shape[0]:], features[:data_mp.shape[0]],
+        data_mp['id'].to_numpy(), testlm['product_id'].to_numpy(),
+        data_mdp['product_name_tok'].tolist(),
+        data_mp_name[nm + '_tok'].tolist())
 
-    # заполнение 0 и 1 фрэйма с id, где 1 означает верный id
-    for j in range(testlm.shape[0]):
-        df_res_lm.loc[j, :] = np.where(
-            df_res_lm.loc[j, :].values == testlm.loc[
-                j, 'product_id'], 1, 0)
 
-    # целевая переменная - номер столбца, в котором стоит 1,
-    # то есть верного id в отсортированном фрэйме
-    for j in range(df_res_lm.shape[0]):
-        df_res_lm.loc[j, 'target'] = (df_res_lm.loc[j, :].
-                                      values.
-                                      tolist().
-                                      index(1))
+def train_multiclass(
+    features_mdp: np.ndarray,
+    features_mp: np.ndarray,
+    catalog_ids: np.ndarray,
+    product_ids: np.ndarray
+) -> lgb.Booster:
+    """Мультиклассовая модель по полной отсортированной строке расстояний.
+
+    Args:
+        - features_mdp (np.ndarray): Эмбеддинги строк дилеров.
+        - features_mp (np.ndarray): Эмбеддинги каталога.
+        - catalog_ids (np.ndarray): ID товаров каталога.
+        - product_ids (np.ndarray): Верный ID товара для каждой строки дилера.
+
+    Returns:
+        - lgb.Booster: Обученная модель.
+    """
+
+    # рассчёт расстояний
+    res = cdist(features_mdp, features_mp, metric='euclidean')
+
+    # сортировка расстояний
+    res_sort, res_lm = sort_rows(res)
+    res_sort = pd.DataFrame(res_sort)
+
+    # фрэйм отсортированных расстояний в значениях id
+    ids_sorted = catalog_ids[res_lm]
+
+    # целевая переменная - номер столбца с верным id
+    # в отсортированном фрэйме
+    target = build_target(ids_sorted, product_ids)
 
     # разделение данных с отсортированными
     # значениями расстояний на выборки для обучения модели
-    X_train, X_test, Y_train, Y_test = train_test_split(res_sort,
-                                                        df_res_lm.target)
+    X_train, X_test, Y_train, Y_test = train_test_split(res_sort, target)
 
     params = {
         'objective': 'multiclass',
@@ -261,188 +222,317 @@ def matching_training(
 
     # обучение модели LGBM для мультиклассовой классификации
     num_round = 100
-    model = lgb.train(params,
-                      train_data,
-                      num_round,
-                      valid_sets=[valid_data])
+    return lgb.train(params,
+                     train_data,
+                     num_round,
+                     valid_sets=[valid_data])
+
+
+def matching_training(
+    lst_dict_pr: List[Dict],
+    lst_dict_dr: List[Dict],
+    lst_dict_k: List[Dict],
+    nm: str = 'name',
+    cache: Optional[EmbeddingCache] = None,
+    model_type: str = MATCHING_MODEL
+):
+    """Функция для обучения модели.
+
+    Args:
+        - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
+        - lst_dict_dr (List[Dict]): Список словарей карточек дилеров для обучения.
+        - lst_dict_k (List[Dict]): Список словарей внешних ключей.
+        - nm (str): Столбец, по которому происходит сравнение(по умолчанию «name»).
+        - cache (Optional[EmbeddingCache]): Кэш эмбеддингов названий.
+        - model_type (str): «multiclass» - модель по всей строке расстояний,
+          «reranker» - переранжирование MATCHING_CANDIDATES кандидатов.
+
+    Raises:
+        - ValueError: Неизвестный тип модели.
+
+    Returns:
+        - Возвращает обученную модель и эмбеддинги каталога (CatalogEmbeddings),
+          которые надо подставить на вход в функцию предсказаний.
+    """
+
+    if model_type not in ('multiclass', 'reranker'):
+        raise ValueError(f'Неизвестный тип модели: {model_type}')
+
+    (features_mdp, features_mp, catalog_ids, product_ids,
+     titles_mdp, titles_mp) = training_data(
+        lst_dict_pr, lst_dict_dr, lst_dict_k, nm, cache)
+
+    if model_type == 'reranker':
+        model = train_reranker(features_mdp, features_mp, catalog_ids,
+                               product_ids, titles=titles_mdp,
+                               catalog_titles=titles_mp)
+    else:
+        model = train_multiclass(features_mdp, features_mp, catalog_ids,
+                                 product_ids)
 
     Pkl_filename = os.path.join('app/csv/Pikel_model.pkl')
 
     with open(Pkl_filename, 'wb') as file:
         pickle.dump(model, file)
 
-    features_mp.to_csv('app/csv/features_mp.csv')
+    catalog = save_embeddings(features_mp, catalog_ids, ENCODER_NAME)
 
-    return model, features_mp
+    return model, catalog
 
 
-def matching_predict(lst_dict_pr, lst_dict_tst, model_embeddings_pr, k=5, nm='name'):
-    """Функция для предсказания.
+def candidate_features(
+    distances: np.ndarray,
+    ids: np.ndarray,
+    width: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Признаки для модели по кандидатам из векторного индекса.
+
+    Модель обучена на полной отсортированной строке расстояний до всех
+    товаров каталога. Для позиций за пределами найденных кандидатов
+    подставляется расстояние до последнего кандидата - нижняя граница
+    настоящего значения.
 
     Args:
-        - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
-        - lst_dict_dr (List[Dict]): Список словарей карточек дилеров для обучения.
-        - model_embeddings: Обученная модель и эмбеддинги (два объекта из
-          возвращения функции для обучения).
-        - k (int): колличество выводимых id товаров производителя
-          для каждой карточки диллера (по умолчанию равно 5).
-        - nm (str): Столбец, по которому происходит сравнение(по умолчанию «name»).
+        - distances (np.ndarray): Расстояния до кандидатов (N x K).
+        - ids (np.ndarray): ID кандидатов (N x K), -1 если кандидат не найден.
+        - width (int): Количество товаров в каталоге.
+
+    Returns:
+        - Tuple[np.ndarray, np.ndarray]: Признаки (N x width) и ID кандидатов.
     """
 
-    data_mdp_test = pd.DataFrame(lst_dict_tst)
-    data_mp = pd.DataFrame(lst_dict_pr)
+    distances = distances.astype(np.float64)
+    found = ids >= 0
+    last = np.where(found, distances, -np.inf).max(axis=1, keepdims=True)
+    distances = np.where(found, distances, last)
 
-    # удаляем пропуски в столбце name
-    data_mp.dropna(subset=[nm], inplace=True)
-    data_mp.reset_index(drop=True, inplace=True)
+    features = np.repeat(last, width, axis=1)
+    features[:, :distances.shape[1]] = distances
+    return features, ids
 
-    def separation(s):
-        """
-        Функция для удаления знаков препинания,
-        а также для расклеивания склеенных слов,
-        то есть разделения пробелами латиницы от кириллицы,
-        чисел от букв и слов в верхнем регистре от слов
-        в нижнем регистре в склеенных словах.
-        """
-
-        s = re.sub(r'[^\w\s]', ' ', s)
-        lat = re.findall(r"[a-zA-Z]+", s)
-        num = re.findall(r"\d+", s)
-        up = re.findall(r"[А-Я]+", s)
-        for i in lat:
-            s = s.replace(i, ' ' + i + ' ')
-        for i in num:
-            s = s.replace(i, ' ' + i + ' ')
-        for i in up:
-            if len(i) > 1:
-                s = s.replace(i, ' ' + i + ' ')
-        s = ' '.join([i.lower() for i in s.split()])
-        return s
-
-    def tokenize(df, name):
-        """
-        Функция для подготовки к векторизации: разделение склеенных слов,
-        токенизация, лемматизация, стем, избавление от стоп-слов,
-        приведение к нижнему регистру.
-        """
-
-        stopword_en = stopwords.words('english')
-        stopword_ru = stopwords.words('russian')
-        porter = PorterStemmer()
-        lemmatizer = WordNetLemmatizer()
-        tokenized = []
-        for q in df[name]:
-            q = separation(q)
-            q = word_tokenize(q)
-            q = [lemmatizer.lemmatize(i) for i in q if
-                 (i not in stopword_en) and
-                 (i not in stopword_ru)]
-            q = [porter.stem(i) for i in q]
-            tokenized.append(q)
-        name_tok = []
-        for i in tokenized:
-            name_tok.append(' '.join(i))
-        df[name + '_tok'] = name_tok
-        return df
 
-    # функция tokenize для данных от диллера
-    tokenize(data_mdp_test, 'product_name')
+def catalog_embeddings(lst_dict_pr, model_embeddings_pr, nm='name'):
+    """ID товаров каталога и их эмбеддинги для предсказания.
 
-    data_mp_id = pd.DataFrame(data_mp.loc[:, 'id'])
-
-    # трансформер LaBSE
-    bert_name = 'sentence-transformers/LaBSE'
-    enc_tokenizer = transformers.AutoTokenizer.from_pretrained(bert_name)
-    encoder = transformers.AutoModel.from_pretrained(bert_name)
-
-    data_test = data_mdp_test['product_name_tok']
-
-    def embeddings(data):
-        """
-        Функция для получения эмбеддингов
-        """
-        tokenized = data.apply(lambda x: enc_tokenizer.encode(x,
-                                                              max_length=512,
-                                                              truncation=True,
-                                                              add_special_tokens=True))
-        max_len = 0
-        for i in tokenized.values:
-            if len(i) > max_len:
-                max_len = len(i)
-
-        padded = np.array(
-            [i + [0] * (max_len - len(i)) for i in tokenized.values])
-        attention_mask = np.where(padded != 0, 1, 0)
-
-        batch_size = 32
-        embeddings = []
-        for i in tqdm(range(padded.shape[0] // batch_size)):
-            batch = torch.LongTensor(
-                padded[batch_size * i:batch_size * (i + 1)])
-            attention_mask_batch = torch.LongTensor(
-                attention_mask[batch_size * i:batch_size * (i + 1)])
-            with torch.no_grad():
-                batch_embeddings = encoder(batch,
-                                           attention_mask=attention_mask_batch)
-            embeddings.append(batch_embeddings[0][:, 0, :].numpy())
-
-        if embeddings:
-            features = np.concatenate(embeddings)
-            features = pd.DataFrame(features)
-        else:
-            features = pd.DataFrame([])
-
-        batch = torch.LongTensor(padded[features.shape[0]:])
-        attention_mask_batch = torch.LongTensor(
-            attention_mask[features.shape[0]:])
-        with torch.no_grad():
-            batch_embeddings = encoder(batch,
-                                       attention_mask=attention_mask_batch)
-        embeddings.append(batch_embeddings[0][:, 0, :].numpy())
-
-        features = np.concatenate(embeddings)
-        features = pd.DataFrame(features)
-
-        return features
-
-    features = embeddings(data_test)
+    Args:
+        - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
+        - model_embeddings_pr: Обученная модель и эмбеддинги.
+        - nm (str): Столбец с названием товара.
+
+    Returns:
+        - Tuple[np.ndarray, np.ndarray]: ID товаров и матрица эмбеддингов.
+    """
 
     features_mp = model_embeddings_pr[1]
-    features_mdp = features
 
-    # расчёт расстояний
-    res_t = cdist(features_mdp.values,
-                  features_mp.values,
-                  metric='euclidean')
+    if isinstance(features_mp, CatalogEmbeddings):
+        return np.asarray(features_mp.ids), features_mp.features
 
-    res_t = pd.DataFrame(res_t)
+    # эмбеддинги в старом формате (DataFrame из features_mp.csv),
+    # порядок строк совпадает с карточками, у которых есть название
+    data_mp = pd.DataFrame(lst_dict_pr)
+    data_mp.dropna(subset=[nm], inplace=True)
+    return data_mp['id'].to_numpy(), features_mp.values
 
-    # фрэйм отсортированных расстояний
-    res_sort_t = pd.DataFrame(
-        [np.sort(res_t.iloc[i, :]) for i in range(res_t.shape[0])])
-    res_lm_t = pd.DataFrame(
-        [np.argsort(res_t.iloc[i, :]) for i in range(res_t.shape[0])])
-    df_res_lm_t = pd.DataFrame(
-        [[data_mp_id.loc[i, 'id'] for i in res_lm_t.loc[j, :]] for j in
-         range(res_lm_t.shape[0])])
 
-    model = model_embeddings_pr[0]
+def predict_top(model, features_mdp, features_mp, catalog_ids, k=5,
+                index=None, candidates=MATCHING_CANDIDATES, titles=None):
+    """ID и оценки k самых вероятных товаров по эмбеддингам строк дилеров.
+
+    Args:
+        - model: Мультиклассовая модель LightGBM или Reranker.
+        - features_mdp (np.ndarray): Эмбеддинги строк дилеров.
+        - features_mp (np.ndarray): Эмбеддинги каталога.
+        - catalog_ids (np.ndarray): ID товаров каталога.
+        - k (int): Количество id товаров для каждой строки дилера.
+        - index (VectorIndex): Векторный индекс каталога.
+        - candidates (int): Количество кандидатов из индекса.
+        - titles (List[str]): Нормализованные названия строк дилеров,
+          нужны Reranker для признаков совпадения названий.
+
+    Returns:
+        - Tuple[np.ndarray, np.ndarray]: ID товаров (N x k) по убыванию
+          оценки и оценки модели: вероятность класса для мультиклассовой
+          модели, оценка кандидата для Reranker.
+    """
+
+    if isinstance(model, Reranker):
+        # модель переранжирования оценивает только ближайших кандидатов
+        distances, ids = retrieve(features_mdp, features_mp, catalog_ids,
+                                  model.candidates, index)
+        return model.predict_top(distances, ids, k, titles)
+
+    if index is None:
+        # расчёт расстояний
+        res_t = cdist(features_mdp, features_mp, metric='euclidean')
+
+        # фрэйм отсортированных расстояний, id товаров в порядке сортировки
+        res_sort_t, res_lm_t = sort_rows(res_t)
+        ids_sorted = catalog_ids[res_lm_t]
+        del res_t, res_lm_t
+    else:
+        # кандидаты из векторного индекса вместо полной матрицы расстояний
+        res_sort_t, ids_sorted = candidate_features(
+            *index.search(features_mdp, candidates), features_mp.shape[0])
+
     # предсказание для теста (данных от дилеров)
-    y_pred_all = model.predict(res_sort_t,
+    y_pred_all = model.predict(pd.DataFrame(res_sort_t),
                                num_iteration=model.best_iteration)
+    del res_sort_t
+
+    if index is not None:
+        # позиции за пределами найденных кандидатов не рассматриваем
+        y_pred_all = y_pred_all[:, :ids_sorted.shape[1]]
+        y_pred_all[ids_sorted < 0] = -np.inf
 
     # выделение k самых вероятных объектов из
     # данных производителя для каждой строки дилера
-    df_ind_all = pd.DataFrame(
-        [np.argsort(y_pred_all[i])[-1: -(k + 1): -1] for i in
-         range(y_pred_all.shape[0])])
+    ind_all = top_k(y_pred_all, k, largest=True)
+
+    return (np.take_along_axis(ids_sorted, ind_all, axis=1),
+            np.take_along_axis(y_pred_all, ind_all, axis=1))
+
+
+def predict_ids(model, features_mdp, features_mp, catalog_ids, k=5,
+                index=None, candidates=MATCHING_CANDIDATES, titles=None):
+    """ID k самых вероятных товаров по эмбеддингам строк дилеров (N x k).
+
+    Аргументы те же, что у predict_top.
+    """
+
+    return predict_top(model, features_mdp, features_mp, catalog_ids, k=k,
+                       index=index, candidates=candidates, titles=titles)[0]
+
+
+def predict_chunk(data_mdp_test, model, catalog_ids, features_mp, k=5,
+                  index=None, candidates=MATCHING_CANDIDATES, cache=None,
+                  stats=None):
+    """Предсказание для одного чанка строк дилеров.
+
+    Нормализация, эмбеддинги, расстояния до каталога, модель и выбор k
+    лучших id. Все промежуточные матрицы имеют размер чанка, а не всех
+    данных дилеров. Строки с одинаковым нормализованным названием
+    векторизуются и ранжируются один раз, результат копируется на
+    все такие строки.
+
+    Args:
+        - data_mdp_test (pd.DataFrame): Строки дилеров со столбцом product_name.
+        - model: Мультиклассовая модель LightGBM или Reranker.
+        - catalog_ids (np.ndarray): ID товаров каталога.
+        - features_mp (np.ndarray): Эмбеддинги каталога.
+        - k (int): Количество id товаров для каждой строки дилера.
+        - index (VectorIndex): Векторный индекс каталога.
+        - candidates (int): Количество кандидатов из индекса.
+        - cache (EmbeddingCache): Кэш эмбеддингов названий.
+        - stats (Dict[str, int]): Счётчики строк («rows») и уникальных
+          названий («unique»), увеличиваются на значения чанка.
+
+    Returns:
+        - List[Dict]: Словари с k id товаров для каждой строки дилера.
+    """
+
+    # функция tokenize для данных от диллера
+    tokenize(data_mdp_test, 'product_name')
+
+    # одинаковые названия от разных дилеров и за разные даты
+    codes, titles = pd.factorize(data_mdp_test['product_name_tok'])
+    if stats is not None:
+        stats['rows'] = stats.get('rows', 0) + len(codes)
+        stats['unique'] = stats.get('unique', 0) + len(titles)
+
+    # эмбеддинги трансформера LaBSE
+    features_mdp = embed_texts(titles.tolist(), cache=cache,
+                               workers=MATCHING_WORKERS)
+
+    ids_top = predict_ids(model, features_mdp, features_mp, catalog_ids,
+                          k=k, index=index, candidates=candidates,
+                          titles=titles.tolist())[codes]
 
     # итоговый фрэйм с k самых вероятных id
-    result = pd.DataFrame(
-        [[df_res_lm_t.loc[i, df_ind_all.loc[i, :][j]] for j in range(k)]
-         for i in range(df_ind_all.shape[0])])
-    result.columns = [str(i) for i in range(1, k + 1)]
+    result = pd.DataFrame(ids_top)
+    result.columns = [str(i) for i in range(1, ids_top.shape[1] + 1)]
+
+    return result.to_dict('records')
 
-    res_k = result.to_dict('records')
 
-    return res_k
+def matching_predict(lst_dict_pr, lst_dict_tst, model_embeddings_pr, k=5, nm='name',
+                     index=None, candidates=MATCHING_CANDIDATES, cache=None,
+                     stats=None):
+    """Функция для предсказания.
+
+    Args:
+        - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
+        - lst_dict_dr (List[Dict]): Список словарей карточек дилеров для обучения.
+        - model_embeddings: Обученная модель и эмбеддинги (два объекта из
+          возвращения функции для обучения).
+        - k (int): колличество выводимых id товаров производителя
+          для каждой карточки диллера (по умолчанию равно 5).
+        - nm (str): Столбец, по которому происходит сравнение(по умолчанию «name»).
+        - index (VectorIndex): Векторный индекс каталога. Если передан,
+          кандидаты берутся из индекса, а не из полной матрицы расстояний.
+        - candidates (int): Количество кандидатов из индекса.
+        - cache (EmbeddingCache): Кэш эмбеддингов названий.
+        - stats (Dict[str, int]): Счётчики строк и уникальных названий.
+    """
+
+    catalog_ids, features_mp = catalog_embeddings(
+        lst_dict_pr, model_embeddings_pr, nm)
+
+    return predict_chunk(pd.DataFrame(lst_dict_tst), model_embeddings_pr[0],
+                         catalog_ids, features_mp, k=k, index=index,
+                         candidates=candidates, cache=cache, stats=stats)
+
+
+def matching_predict_stream(
+    lst_dict_pr: List[Dict],
+    rows: Iterable[Dict],
+    model_embeddings_pr,
+    k: int = 5,
+    nm: str = 'name',
+    index=None,
+    candidates: int = MATCHING_CANDIDATES,
+    cache: Optional[EmbeddingCache] = None,
+    chunk_size: int = MATCHING_PREDICT_CHUNK_SIZE,
+    stats: Optional[Dict[str, int]] = None
+) -> Iterator[Tuple[Dict, Dict]]:
+    """Потоковое предсказание по чанкам строк дилеров.
+
+    Строки читаются из итератора по chunk_size штук, каждый чанк
+    проходит весь путь предсказания отдельно, поэтому пиковая память
+    зависит от размера чанка, а не от объёма данных дилеров.
+
+    Args:
+        - lst_dict_pr (List[Dict]): Список словарей карточек Просепт.
+        - rows (Iterable[Dict]): Словари карточек дилеров.
+        - model_embeddings_pr: Обученная модель и эмбеддинги.
+        - k (int): Количество id товаров для каждой строки дилера.
+        - nm (str): Столбец с названием товара.
+        - index (VectorIndex): Векторный индекс каталога.
+        - candidates (int): Количество кандидатов из индекса.
+        - cache (EmbeddingCache): Кэш эмбеддингов названий.
+        - chunk_size (int): Количество строк дилеров в чанке.
+        - stats (Optional[Dict[str, int]]): Счётчики строк и уникальных
+          названий. Одинаковые названия схлопываются внутри чанка,
+          между чанками повторная векторизация снимается кэшем эмбеддингов.
+
+    Yields:
+        - Tuple[Dict, Dict]: Строка дилера и словарь с k id товаров.
+    """
+
+    catalog_ids, features_mp = catalog_embeddings(
+        lst_dict_pr, model_embeddings_pr, nm)
+    if index is None and isinstance(model_embeddings_pr[0], Reranker):
+        # кандидаты для всех чанков ищутся по одному индексу
+        index = exact_index(features_mp, catalog_ids)
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        records = predict_chunk(pd.DataFrame(chunk), model_embeddings_pr[0],
+                                catalog_ids, features_mp, k=k, index=index,
+                                candidates=candidates, cache=cache,
+                                stats=stats)
+        yield from zip(chunk, records)
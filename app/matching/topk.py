@@ -0,0 +1,47 @@
+"""Векторизованный отбор ближайших кандидатов по матрице расстояний."""
+from typing import Tuple
+
+import numpy as np
+
+
+def sort_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Сортируем каждую строку матрицы по возрастанию.
+
+    Args:
+        - matrix (np.ndarray): Матрица расстояний (N строк дилера на M товаров).
+
+    Returns:
+        - Tuple[np.ndarray, np.ndarray]: Отсортированные значения и индексы
+          столбцов в порядке сортировки.
+    """
+
+    order = np.argsort(matrix, axis=1)
+    return np.take_along_axis(matrix, order, axis=1), order
+
+
+def top_k(matrix: np.ndarray, k: int, largest: bool = False) -> np.ndarray:
+    """Получаем индексы k наименьших (или наибольших) значений в каждой строке.
+
+    Вместо полной сортировки строки используется np.argpartition, а
+    сортируются только k оставленных столбцов.
+
+    Args:
+        - matrix (np.ndarray): Матрица N x M.
+        - k (int): Количество столбцов, которые нужно оставить.
+        - largest (bool): Отбирать наибольшие значения (по умолчанию наименьшие).
+
+    Returns:
+        - np.ndarray: Матрица индексов N x k, упорядоченная от лучшего к худшему.
+    """
+
+    k = min(k, matrix.shape[1])
+    values = -matrix if largest else matrix
+
+    if k < matrix.shape[1]:
+        kept = np.argpartition(values, k - 1, axis=1)[:, :k]
+    else:
+        kept = np.broadcast_to(np.arange(matrix.shape[1]), matrix.shape)
+
+    kept_values = np.take_along_axis(values, kept, axis=1)
+    order = np.argsort(kept_values, axis=1, kind='stable')
+    return np.take_along_axis(kept, order, axis=1)
@@ -1,6 +1,7 @@
 """Модели для данных из csv файлов."""
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (Column, DateTime, Float, ForeignKey, Integer, String,
+                        func)
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
@@ -100,3 +101,20 @@ class MarketingProductDealerKey(Base):
         в функцию для ML.
         """
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class CatalogVersion(Base):
+    """Версия каталога «Просепт» и списка дилеров.
+
+    Увеличивается при каждой загрузке или изменении каталога, по ней
+    процессы приложения узнают, что кэш каталога устарел.
+    """
+
+    __tablename__ = 'catalog_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0,
+                     comment='Номер версии каталога')
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(),
+        onupdate=func.now(), comment='Время последнего изменения')
@@ -0,0 +1,82 @@
+"""Полнота и задержка поиска кандидатов через векторные индексы.
+
+Эталон - текущий способ: полная матрица cdist в float64.
+Для каждого индекса считается recall@k (доля эталонных k ближайших
+товаров, найденных индексом) и время поиска.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_index
+    python -m benchmarks.bench_index --catalog app/csv/features_mp.npy
+
+Без --catalog используются синтетические кластеризованные векторы.
+С --catalog запросы строятся из эмбеддингов каталога с добавлением шума.
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from app.matching.embedding_store import CatalogEmbeddings, load_embeddings
+from app.matching.index import build_index
+from app.matching.topk import top_k
+
+
+def synthetic(rng, n_catalog, n_queries, dim, n_clusters=200):
+    """Кластеризованные векторы, похожие по структуре на эмбеддинги названий."""
+
+    centers = rng.normal(size=(n_clusters, dim)) * 4
+    catalog = centers[rng.integers(0, n_clusters, n_catalog)]
+    catalog += rng.normal(size=(n_catalog, dim))
+    queries = catalog[rng.integers(0, n_catalog, n_queries)]
+    queries = queries + rng.normal(size=(n_queries, dim)) * 0.7
+    return catalog.astype(np.float32), queries.astype(np.float32)
+
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    """Доля эталонных ID, попавших в найденные."""
+
+    hits = [np.intersect1d(a, b).shape[0] for a, b in zip(found, expected)]
+    return sum(hits) / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--catalog', help='Путь к features_mp.npy')
+    parser.add_argument('--catalog-size', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.catalog:
+        catalog = load_embeddings(args.catalog)
+        rows = rng.integers(0, catalog.features.shape[0], args.queries)
+        queries = np.asarray(catalog.features[rows])
+        queries += rng.normal(scale=queries.std() * 0.3, size=queries.shape)
+    else:
+        features, queries = synthetic(
+            rng, args.catalog_size, args.queries, args.dim)
+        catalog = CatalogEmbeddings(
+            features, np.arange(features.shape[0]), 'synthetic')
+
+    start = time.perf_counter()
+    expected = catalog.ids[top_k(cdist(queries, catalog.features), args.k)]
+    exact_time = time.perf_counter() - start
+    print(f'{"способ":<22} {"recall@" + str(args.k):>10} {"время, c":>10}')
+    print(f'{"cdist, float64":<22} {1:>10.3f} {exact_time:>10.2f}')
+
+    variants = [('exact', {}, 'exact')]
+    variants += [(f'ivf n_probe={n}', {'n_probe': n}, 'ivf') for n in (1, 4, 8, 16, 32)]
+
+    for name, params, kind in variants:
+        index = build_index(catalog, kind, **params)
+        start = time.perf_counter()
+        _, found = index.search(queries, args.k)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<22} {recall(found, expected):>10.3f} {elapsed:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Пропускная способность нормализации названий на 10 тысячах строк.
+
+Названия берутся из app/csv/marketing_product.csv (name, ozon_name,
+wb_name) и повторяются до нужного количества, к части строк добавляется
+случайный объём, как в выдаче парсера.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_normalizer
+"""
+import argparse
+import csv
+import random
+import re
+import time
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer, WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+
+from app.matching import normalizer
+
+
+def legacy(titles):
+    """Прежняя реализация separation()/tokenize() из script_ds.py."""
+
+    def separation(s):
+        s = re.sub(r'[^\w\s]', ' ', s)
+        lat = re.findall(r"[a-zA-Z]+", s)
+        num = re.findall(r"\d+", s)
+        up = re.findall(r"[А-Я]+", s)
+        for i in lat:
+            s = s.replace(i, ' ' + i + ' ')
+        for i in num:
+            s = s.replace(i, ' ' + i + ' ')
+        for i in up:
+            if len(i) > 1:
+                s = s.replace(i, ' ' + i + ' ')
+        s = ' '.join([i.lower() for i in s.split()])
+        return s
+
+    stopword_en = stopwords.words('english')
+    stopword_ru = stopwords.words('russian')
+    porter = PorterStemmer()
+    lemmatizer = WordNetLemmatizer()
+    tokenized = []
+    for q in titles:
+        q = separation(q)
+        q = word_tokenize(q)
+        q = [lemmatizer.lemmatize(i) for i in q if
+             (i not in stopword_en) and
+             (i not in stopword_ru)]
+        q = [porter.stem(i) for i in q]
+        tokenized.append(' '.join(q))
+    return tokenized
+
+
+def load_titles(count):
+    with open('app/csv/marketing_product.csv', encoding='utf-8',
+              newline='') as file:
+        reader = csv.DictReader(file, delimiter=';')
+        base = [row[column] for row in reader
+                for column in ('name', 'ozon_name', 'wb_name') if row[column]]
+
+    rng = random.Random(0)
+    titles = []
+    for _ in range(count):
+        title = rng.choice(base)
+        if rng.random() < 0.5:
+            title += f' {rng.randint(1, 20)} л'
+        titles.append(title)
+    return titles
+
+
+def clear_caches():
+    for func in (normalizer.normalize_title, normalizer.lemmatize,
+                 normalizer.stem):
+        func.cache_clear()
+
+
+def measure(func, titles):
+    start = time.perf_counter()
+    result = func(titles)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=10_000)
+    args = parser.parse_args()
+
+    titles = load_titles(args.count)
+    normalizer.get_stopwords()
+
+    legacy_time, expected = measure(legacy, titles)
+    clear_caches()
+    cold_time, cold = measure(normalizer.normalize_titles, titles)
+    warm_time, warm = measure(normalizer.normalize_titles, titles)
+    assert cold == expected and warm == expected
+
+    print(f'{"реализация":<28} {"время, c":>9} {"строк/с":>10}')
+    for name, elapsed in (('прежняя', legacy_time),
+                          ('normalizer, пустой кэш', cold_time),
+                          ('normalizer, тёплый кэш', warm_time)):
+        print(f'{name:<28} {elapsed:>9.3f} {args.count / elapsed:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
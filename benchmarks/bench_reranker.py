@@ -0,0 +1,90 @@
+"""Мультиклассовая модель и reranker: полнота, задержка и размер модели.
+
+Обе модели обучаются на одних и тех же эмбеддингах: строки дилеров -
+зашумлённые копии товаров каталога. Для каждой модели выводится
+recall@5 (доля строк, у которых верный товар попал в пять предсказанных),
+время обучения, время предсказания и размер сериализованной модели.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_reranker
+    python -m benchmarks.bench_reranker --catalog app/csv/features_mp.npy
+
+Мультиклассовая модель обучается по классу на каждый товар каталога,
+поэтому на больших каталогах её обучение занимает очень много времени.
+"""
+import argparse
+import pickle
+import time
+
+import numpy as np
+
+from app.matching.embedding_store import load_embeddings
+from app.matching.reranker import train_reranker
+from app.matching.script_ds import predict_ids, train_multiclass
+
+from .bench_index import synthetic
+
+
+def measure(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--catalog', help='Путь к features_mp.npy')
+    parser.add_argument('--catalog-size', type=int, default=500)
+    parser.add_argument('--train', type=int, default=5000)
+    parser.add_argument('--test', type=int, default=5000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--candidates', type=int, default=50)
+    parser.add_argument('--noise', type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    count = args.train + args.test
+    if args.catalog:
+        catalog = load_embeddings(args.catalog)
+        features_mp = np.asarray(catalog.features)
+        catalog_ids = catalog.ids
+    else:
+        features_mp, _ = synthetic(rng, args.catalog_size, 0, args.dim)
+        catalog_ids = np.arange(features_mp.shape[0])
+
+    target = rng.integers(0, features_mp.shape[0], count)
+    features_mdp = features_mp[target] + rng.normal(
+        scale=features_mp.std() * args.noise, size=(count, features_mp.shape[1]))
+    features_mdp = features_mdp.astype(np.float32)
+    product_ids = catalog_ids[target]
+
+    train = slice(0, args.train)
+    test = slice(args.train, count)
+
+    models = [
+        ('multiclass', train_multiclass, {}),
+        ('reranker lambdarank', train_reranker,
+         {'candidates': args.candidates, 'objective': 'lambdarank'}),
+        ('reranker binary', train_reranker,
+         {'candidates': args.candidates, 'objective': 'binary'}),
+    ]
+
+    print(f'каталог: {features_mp.shape[0]}, обучение: {args.train}, '
+          f'тест: {args.test}')
+    print(f'{"модель":<22} {"recall@5":>9} {"обучение, c":>12} '
+          f'{"предсказание, c":>16} {"размер, КБ":>11}')
+    for name, train_func, params in models:
+        train_time, model = measure(
+            train_func, features_mdp[train], features_mp, catalog_ids,
+            product_ids[train], **params)
+        predict_time, predicted = measure(
+            predict_ids, model, features_mdp[test], features_mp, catalog_ids)
+
+        recall = (predicted == product_ids[test, None]).any(axis=1).mean()
+        size = len(pickle.dumps(model)) / 1024
+        print(f'{name:<22} {recall:>9.3f} {train_time:>12.2f} '
+              f'{predict_time:>16.2f} {size:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
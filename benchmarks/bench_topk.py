@@ -0,0 +1,83 @@
+"""Сравнение построчного отбора кандидатов через pandas и векторизованного.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_topk
+
+Прежняя реализация на больших матрицах работает часами, поэтому для неё
+замеряется время на первых --legacy-rows строках и пересчитывается на всю
+матрицу. Матрица 100k x 5k обрабатывается блоками строк, как в потоковом
+предсказании.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.matching.topk import sort_rows, top_k
+
+SIZES = ((10_000, 2_000), (100_000, 5_000))
+BLOCK_ROWS = 10_000
+K = 5
+
+
+def legacy(res: np.ndarray, ids: np.ndarray, y_pred: np.ndarray) -> np.ndarray:
+    """Прежняя реализация из matching_predict."""
+
+    res = pd.DataFrame(res)
+    res_lm = pd.DataFrame(
+        [np.argsort(res.iloc[i, :]) for i in range(res.shape[0])])
+    data_mp_id = pd.DataFrame({'id': ids})
+    df_res_lm = pd.DataFrame(
+        [[data_mp_id.loc[i, 'id'] for i in res_lm.loc[j, :]] for j in
+         range(res_lm.shape[0])])
+    df_ind_all = pd.DataFrame(
+        [np.argsort(y_pred[i])[-1: -(K + 1): -1] for i in
+         range(y_pred.shape[0])])
+    result = pd.DataFrame(
+        [[df_res_lm.loc[i, df_ind_all.loc[i, :][j]] for j in range(K)]
+         for i in range(df_ind_all.shape[0])])
+    return result.values
+
+
+def vectorized(res: np.ndarray, ids: np.ndarray, y_pred: np.ndarray) -> np.ndarray:
+    """Новая реализация: сортировка по оси и один fancy-index по массиву id."""
+
+    _, res_lm = sort_rows(res)
+    ind = top_k(y_pred, K, largest=True)
+    return ids[np.take_along_axis(res_lm, ind, axis=1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--legacy-rows', type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"размер":>14} {"pandas, c":>12} {"numpy, c":>10} {"ускорение":>10}')
+
+    for rows, cols in SIZES:
+        ids = rng.permutation(cols * 10)[:cols]
+
+        res = rng.random((args.legacy_rows, cols))
+        y_pred = rng.random((args.legacy_rows, cols))
+        start = time.perf_counter()
+        expected = legacy(res, ids, y_pred)
+        legacy_time = (time.perf_counter() - start) * rows / args.legacy_rows
+        assert np.array_equal(vectorized(res, ids, y_pred), expected)
+
+        new_time = 0.0
+        for start_row in range(0, rows, BLOCK_ROWS):
+            block = min(BLOCK_ROWS, rows - start_row)
+            res = rng.random((block, cols))
+            y_pred = rng.random((block, cols))
+            start = time.perf_counter()
+            vectorized(res, ids, y_pred)
+            new_time += time.perf_counter() - start
+
+        print(f'{rows:>7}x{cols:<6} {legacy_time:>12.1f} {new_time:>10.2f} '
+              f'{legacy_time / new_time:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
 """Скрипт для добавления данных в БД.
 
 - Сначала загружаются данные из csv файлов.
-- После загрузки данных из csv, запускается функция для
-  загрузки данных которые получены от DS.
+- После загрузки данных из csv увеличивается версия каталога, что-бы
+  запущенные процессы приложения сбросили кэш каталога.
+- Затем запускается функция для загрузки данных которые получены от DS.
 - Создаём один объект в модели Statistics.
 """
 
@@ -16,8 +17,10 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.database import engine
+from app.matching.catalog_cache import bump_catalog_version
 from app.matching.load_db import load_data
 from app.matching.models import Statistics
+from app.matching.parallel import shutdown_pools
 from app.products.models import (MarketingDealer, MarketingDealerPrice,
                                  MarketingProduct, MarketingProductDealerKey)
 
@@ -135,7 +138,15 @@ async def add_statistics(session: AsyncSession) -> None:
 async def main():
     async with AsyncSession(engine) as session:
         await add_data_from_csv(csv_files, session)
+        await bump_catalog_version(session)
         await add_statistics(session)
-        await load_data(session)
+        try:
+            await load_data(session)
+        finally:
+            shutdown_pools()
 
-asyncio.run(main())
+
+# Защита нужна для пула процессов матчинга (MATCHING_WORKERS > 1):
+# процессы запускаются методом spawn и заново импортируют этот модуль.
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+from sqlalchemy import delete, insert, update
+
+from app.matching.catalog_cache import (CatalogCache, bump_catalog_version,
+                                        get_catalog_version)
+from app.products.models import (CatalogVersion, MarketingDealer,
+                                 MarketingProduct)
+from tests.conftest import async_session_marker
+
+from .test_matching_read import count_queries
+
+
+async def test_cache_serves_repeated_reads_without_queries(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    cache = CatalogCache(ttl=3600)
+    async with async_session_marker() as session:
+        products = await cache.get_products(session, [3, 1, 3])
+        assert sorted(products) == [1, 3]
+        assert products[1].to_dict() == {
+            'id': 1, 'article': 'Артикул 5', 'cost': 10.0,
+            'name_1c': 'Название в 1C 1'}
+
+        with count_queries() as statements:
+            await cache.get_products(session, [1, 2, 3, 4, 5])
+            name = await cache.get_dealer_name(session, 1)
+
+        assert statements == []
+        assert name == 'Test_Dealer'
+        assert cache.stats()['hits'] == 2 + 5 + 1
+        assert cache.stats()['misses'] == 0
+
+
+async def test_cache_reloads_after_version_bump(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    # ttl=0: версия каталога сверяется при каждом обращении
+    cache = CatalogCache(ttl=0)
+    async with async_session_marker() as session:
+        await cache.get_products(session, [1])
+
+        with count_queries() as statements:
+            await cache.get_products(session, [1])
+        assert len(statements) == 1
+
+        await session.execute(update(MarketingProduct).where(
+            MarketingProduct.id == 1).values(article='Новый артикул'))
+        await session.commit()
+        assert (await cache.get_products(session, [1]))[1].article == (
+            'Артикул 5')
+
+        version = await bump_catalog_version(session)
+        assert version == await get_catalog_version(session)
+        assert (await cache.get_products(session, [1]))[1].article == (
+            'Новый артикул')
+        assert cache.stats()['version'] == version
+
+        await session.execute(update(MarketingProduct).where(
+            MarketingProduct.id == 1).values(article='Артикул 5'))
+        await session.execute(delete(CatalogVersion))
+        await session.commit()
+
+
+async def test_cache_reads_through_missing_products(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    cache = CatalogCache(ttl=3600)
+    async with async_session_marker() as session:
+        await cache.get_products(session, [1])
+        await session.execute(insert(MarketingProduct).values(
+            id=100, article='A100', cost=1, name_1c='Новый товар'))
+        await session.commit()
+
+        products = await cache.get_products(session, [1, 100, 101])
+        assert sorted(products) == [1, 100]
+        assert cache.stats()['misses'] == 2
+
+        with count_queries() as statements:
+            await cache.get_products(session, [100])
+        assert statements == []
+
+        cache.invalidate()
+        assert cache.stats()['products'] == 0
+
+        await session.execute(delete(MarketingProduct).where(
+            MarketingProduct.id == 100))
+        await session.commit()
@@ -0,0 +1,29 @@
+import numpy as np
+
+from app.matching.embedding_cache import EmbeddingCache
+
+
+async def test_embedding_cache_get_put_and_evict(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite3'), 'test-model', 2)
+    vectors = np.arange(6, dtype=np.float32).reshape(3, 2)
+
+    assert cache.get_many(['кран', 'гель']) == [None, None]
+
+    cache.put_many(['кран', 'гель'], vectors[:2])
+    found = cache.get_many(['кран  ', 'гель', 'кран'])
+    assert np.array_equal(found[0], vectors[0])
+    assert np.array_equal(found[1], vectors[1])
+    assert np.array_equal(found[2], vectors[0])
+    assert cache.stats() == {'hits': 3, 'misses': 2}
+
+    # «гель» использовался позже, поэтому вытесняется «кран»
+    cache.get_many(['гель'])
+    cache.put_many(['мыло'], vectors[2:])
+    assert [v is not None for v in cache.get_many(['кран', 'гель', 'мыло'])] == [
+        False, True, True]
+
+    other_model = EmbeddingCache(str(tmp_path / 'cache.sqlite3'), 'other')
+    assert other_model.get_many(['гель']) == [None]
+
+    cache.close()
+    other_model.close()
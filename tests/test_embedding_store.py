@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.matching.embedding_store import (load_embeddings, migrate_legacy_csv,
+                                          save_embeddings)
+
+
+async def test_save_and_load_embeddings(tmp_path):
+    path = str(tmp_path / 'features_mp.npy')
+    features = np.random.default_rng(0).random((4, 8))
+
+    save_embeddings(features, [10, 20, 30, 40], 'test-model', path)
+    catalog = load_embeddings(path, model_name='test-model', verify=True)
+
+    assert isinstance(catalog.features, np.memmap)
+    assert catalog.features.dtype == np.float32
+    assert np.array_equal(catalog.features, features.astype(np.float32))
+    assert catalog.ids.tolist() == [10, 20, 30, 40]
+
+    with pytest.raises(ValueError):
+        load_embeddings(path, model_name='other-model')
+
+
+async def test_migrate_legacy_csv(tmp_path):
+    csv_path = str(tmp_path / 'features_mp.csv')
+    path = str(tmp_path / 'features_mp.npy')
+    features = pd.DataFrame(np.random.default_rng(1).random((3, 5)))
+    features.to_csv(csv_path)
+
+    catalog = migrate_legacy_csv([7, 8, 9], 'test-model', csv_path, path)
+
+    assert np.allclose(catalog.features, features.values)
+    assert catalog.ids.tolist() == [7, 8, 9]
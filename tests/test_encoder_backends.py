@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+import transformers
+
+from app.matching.encoder_backends import backend_path, load_backend
+
+TEXTS = ['кран смеситель 5 л', 'гель для душа prosept', 'антисептик']
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """Маленькая модель BERT со словарём из отдельных символов."""
+
+    chars = list('абвгдеёжзийклмнопрстуфхцчшщъыьэюяabcdefghijklmnopqrstuvwxyz0123456789')
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + chars
+    vocab += ['##' + char for char in chars]
+    path = tmp_path / 'tiny'
+    path.mkdir()
+    (path / 'vocab.txt').write_text('\n'.join(vocab), encoding='utf-8')
+
+    transformers.BertTokenizerFast(
+        vocab_file=str(path / 'vocab.txt')).save_pretrained(str(path))
+    torch.manual_seed(0)
+    transformers.BertModel(transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2,
+        num_attention_heads=2, intermediate_size=64)).save_pretrained(str(path))
+    return str(path)
+
+
+def cls_embeddings(name, encoder):
+    enc_tokenizer = transformers.AutoTokenizer.from_pretrained(name)
+    batch = enc_tokenizer(TEXTS, padding=True, return_tensors='pt')
+    with torch.inference_mode():
+        output = encoder(batch['input_ids'],
+                         attention_mask=batch['attention_mask'])
+    return output[0][:, 0, :].numpy()
+
+
+@pytest.mark.parametrize('backend', ['int8', 'torchscript'])
+async def test_backend_close_to_fp32_and_cached(tiny_model, tmp_path, backend):
+    cache_dir = str(tmp_path / 'encoders')
+    reference = cls_embeddings(tiny_model, load_backend(tiny_model, 'torch'))
+
+    converted = cls_embeddings(
+        tiny_model, load_backend(tiny_model, backend, cache_dir))
+    path = backend_path(tiny_model, backend, cache_dir)
+    modified = os.path.getmtime(path)
+    loaded = cls_embeddings(
+        tiny_model, load_backend(tiny_model, backend, cache_dir))
+
+    cosine = np.einsum('ij,ij->i', reference, converted) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(converted, axis=1))
+    assert cosine.min() > 0.99
+    assert np.allclose(converted, loaded, atol=1e-5)
+    assert os.path.getmtime(path) == modified
+
+
+async def test_unknown_backend(tiny_model):
+    with pytest.raises(ValueError):
+        load_backend(tiny_model, 'tensorrt')
@@ -0,0 +1,65 @@
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from app.matching.embedding_store import (CatalogEmbeddings, load_embeddings,
+                                          save_embeddings)
+from app.matching.index import VectorIndex, build_index, get_catalog_index
+
+
+def make_catalog(rng, size=300, dim=16):
+    features = rng.normal(size=(size, dim)).astype(np.float32)
+    return CatalogEmbeddings(features, np.arange(size) * 10 + 1, 'test-model')
+
+
+async def test_exact_index_matches_cdist():
+    rng = np.random.default_rng(0)
+    catalog = make_catalog(rng)
+    queries = rng.normal(size=(40, 16)).astype(np.float32)
+
+    distances, ids = build_index(catalog, 'exact').search(queries, 5)
+
+    expected = cdist(queries, catalog.features)
+    order = np.argsort(expected, axis=1)[:, :5]
+    assert np.array_equal(ids, catalog.ids[order])
+    assert np.allclose(distances, np.take_along_axis(expected, order, axis=1))
+
+
+async def test_ivf_index_save_load_and_add(tmp_path):
+    rng = np.random.default_rng(1)
+    catalog = make_catalog(rng)
+    index = build_index(catalog, 'ivf', n_probe=4)
+    queries = catalog.features[:10]
+
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+    loaded = VectorIndex.load(path)
+    _, ids = loaded.search(queries, 1)
+
+    assert loaded.kind == 'ivf'
+    assert np.array_equal(ids, index.search(queries, 1)[1])
+    assert ids[:, 0].tolist() == catalog.ids[:10].tolist()
+
+    loaded.add(queries[:2] + 100, [-5, -6])
+    assert len(loaded) == len(catalog.ids) + 2
+    assert loaded.search(queries[:2] + 100, 1)[1][:, 0].tolist() == [-5, -6]
+
+
+async def test_catalog_index_rebuilt_when_vectors_change(tmp_path):
+    rng = np.random.default_rng(2)
+    path = str(tmp_path / 'features.npy')
+    index_path = str(tmp_path / 'index.npz')
+    features = rng.normal(size=(50, 8)).astype(np.float32)
+    ids = np.arange(50) + 1
+
+    save_embeddings(features, ids, 'test-model', path)
+    get_catalog_index(load_embeddings(path), 'exact', index_path)
+    assert np.allclose(VectorIndex.load(index_path).vectors, features)
+
+    save_embeddings(features + 1, ids, 'test-model', path)
+    catalog = load_embeddings(path)
+    index = get_catalog_index(catalog, 'exact', index_path)
+
+    assert np.allclose(index.vectors, features + 1)
+    assert np.allclose(VectorIndex.load(index_path).vectors, features + 1)
+    assert get_catalog_index(catalog, 'exact', index_path).checksum == (
+        index.checksum)
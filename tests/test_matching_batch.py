@@ -0,0 +1,97 @@
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import select, update
+
+from app.matching.crud import get_statistics_totals
+from app.matching.leases import claim_cards
+from app.matching.models import (DelMatchingProductDealer,
+                                 MatchingProductDealer,
+                                 MatchPositiveProductDealer)
+from app.matching.routers import post_decisions
+from app.matching.schemas import MatchingDecision
+from app.products.models import MarketingDealer, MarketingProduct
+from tests.conftest import async_session_marker
+
+from .test_matching_decisions import clear_decisions
+from .test_matching_read import add_matching, count_queries
+
+
+async def test_batch_applies_decisions_with_constant_queries(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    query_counts = []
+    async with async_session_marker() as session:
+        await add_matching(session, 30)
+        for start in (0, 15):
+            decisions = [
+                MatchingDecision(dealer_product_id=1000 + i, action=action,
+                                 prosept_id=(i % 5) + 1
+                                 if action == 'accept' else None)
+                for i, action in zip(range(start, start + 15),
+                                     ['accept', 'postpone', 'delete'] * 5)]
+            with count_queries() as statements:
+                results = await post_decisions(decisions, operator_id=3,
+                                               db=session)
+            query_counts.append(len(statements))
+            assert [item['status'] for item in results] == [200] * 15
+
+        accepted = (await session.execute(select(
+            MatchPositiveProductDealer.dealer_product_id,
+            MatchPositiveProductDealer.product_id))).all()
+        deleted = (await session.scalars(
+            select(DelMatchingProductDealer.dealer_product_id))).all()
+        orders = (await session.scalars(select(MatchingProductDealer.order)
+                                        .order_by(MatchingProductDealer.order)
+                                        )).all()
+        totals = await get_statistics_totals(session, 3)
+        await clear_decisions(session)
+
+    # чтение, две вставки, удаление, обновление и статистика
+    assert query_counts == [6, 6]
+    assert sorted(accepted) == [(1000 + i, (i % 5) + 1)
+                                for i in range(0, 30, 3)]
+    assert sorted(deleted) == list(range(1002, 1030, 3))
+    assert len(orders) == 10 and orders[0] > 30
+    assert results[0]['id'] is not None
+    assert totals == {'accepted_cards': 10, 'delete_cards': 10,
+                      'postponed_cards': 10}
+
+
+async def test_batch_reports_rejected_items(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 3)
+        await claim_cards(session, 2, 1)
+        decisions = [
+            MatchingDecision(dealer_product_id=1000, action='delete'),
+            MatchingDecision(dealer_product_id=1000, action='postpone'),
+            MatchingDecision(dealer_product_id=999, action='delete'),
+            # карточку 1002 (первую в очереди) арендовал оператор 2
+            MatchingDecision(dealer_product_id=1002, action='postpone'),
+            # у карточки 1001 нет товара 1 в product_ids
+            MatchingDecision(dealer_product_id=1001, action='accept',
+                             prosept_id=1),
+        ]
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == 1001).values(
+                product_ids=[2, 3, 4, 5]))
+        await session.commit()
+
+        results = await post_decisions(decisions, operator_id=1, db=session)
+        left = (await session.scalars(select(
+            MatchingProductDealer.dealer_product_id))).all()
+        totals = await get_statistics_totals(session, 1)
+        await clear_decisions(session)
+
+    assert [item['status'] for item in results] == [200, 409, 404, 409, 404]
+    assert sorted(left) == [1001, 1002]
+    assert totals == {'accepted_cards': 0, 'delete_cards': 1,
+                      'postponed_cards': 0}
+
+
+def test_prosept_id_only_for_accept():
+    with pytest.raises(ValidationError):
+        MatchingDecision(dealer_product_id=1, action='accept')
+    with pytest.raises(ValidationError):
+        MatchingDecision(dealer_product_id=1, action='delete', prosept_id=1)
@@ -0,0 +1,123 @@
+from sqlalchemy import select, update
+
+from app.matching.cards import dealer_cards, product_cards
+from app.matching.catalog_cache import bump_catalog_version, catalog_cache
+from app.matching.export import matching_card_model
+from app.matching.models import MatchingProductDealer
+from app.matching.routers import patch_product, post_product
+from app.matching.schemas import ProductData
+from app.products.models import (MarketingDealer, MarketingDealerPrice,
+                                 MarketingProduct)
+from tests.conftest import async_session_marker
+
+from .test_matching_decisions import clear_decisions
+from .test_matching_read import add_matching, read_page
+
+
+async def joined_cards(session):
+    """Карточки, собранные JOIN-запросом из карточек дилеров и каталога."""
+
+    rows = (await session.execute(
+        select(MatchingProductDealer, MarketingDealerPrice,
+               MarketingDealer.name)
+        .join(MarketingDealerPrice,
+              MatchingProductDealer.dealer_product_id == MarketingDealerPrice.id)
+        .join(MarketingDealer,
+              MarketingDealerPrice.dealer_id == MarketingDealer.id)
+        .order_by(MatchingProductDealer.order, MatchingProductDealer.id))).all()
+    products_dict = await catalog_cache.get_products(
+        session, [id for matching_product, _, _ in rows
+                  for id in matching_product.product_ids])
+    return [matching_card_model(*row, products_dict) for row in rows]
+
+
+async def rename(session, product_name, dealer_name):
+    await session.execute(update(MarketingProduct).where(
+        MarketingProduct.id == 1).values(name_1c=product_name))
+    await session.execute(update(MarketingDealer).where(
+        MarketingDealer.id == 1).values(name=dealer_name))
+    await bump_catalog_version(session)
+
+
+async def test_cards_follow_catalog_and_decisions(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 3)
+        cards, _ = await read_page(session)
+        assert cards == await joined_cards(session)
+
+        await rename(session, 'Новое название', 'Renamed_Dealer')
+        renamed, _ = await read_page(session)
+        joined = await joined_cards(session)
+
+        await patch_product(dealer_product_id=1002, operator_id=1,
+                            db=session)
+        await post_product(ProductData(prosept_id=1),
+                           dealer_product_id=1001, operator_id=1, db=session)
+        after_decisions, _ = await read_page(session)
+
+        await rename(session, 'Название в 1C 1', 'Test_Dealer')
+        await clear_decisions(session)
+
+    assert renamed == joined
+    assert {item.dealer_product.dealer_name
+            for item in renamed} == {'Renamed_Dealer'}
+    assert {product.name_1c for item in renamed for product in item.products
+            if product.id == 1} == {'Новое название'}
+    # принятая карточка ушла из очереди, отложенная - в конце без изменений
+    assert [item.dealer_product.id for item in after_decisions] == [
+        1000, 1002]
+    assert after_decisions[1] == renamed[0]
+
+
+async def test_missing_cards_are_built_on_read(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 2)
+        # строка добавлена в обход load_data и перематчинга
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == 1000).values(
+                card=None, dealer_id=None))
+        await session.commit()
+
+        cards, _ = await read_page(session)
+        stored = (await session.execute(select(
+            MatchingProductDealer.dealer_id).where(
+                MatchingProductDealer.card.is_not(None)))).scalars().all()
+        joined = await joined_cards(session)
+        await clear_decisions(session)
+
+    assert [item.dealer_product.id for item in cards] == [1001, 1000]
+    assert cards == joined
+    assert stored == [1, 1]
+
+
+async def test_catalog_change_refreshes_only_related_cards(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 3)
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == 1002).values(
+                product_ids=[2, 3, 4, 5, 2]))
+        await session.execute(update(MatchingProductDealer).values(card={}))
+        await bump_catalog_version(session, product_cards(1))
+        by_product = dict((await session.execute(select(
+            MatchingProductDealer.dealer_product_id,
+            MatchingProductDealer.card != {}))).all())
+
+        await session.execute(update(MatchingProductDealer).values(card={}))
+        await bump_catalog_version(session, dealer_cards(2))
+        other_dealer = (await session.scalars(select(
+            MatchingProductDealer.card != {}))).all()
+
+        await bump_catalog_version(session, dealer_cards(1))
+        cards, _ = await read_page(session)
+        joined = await joined_cards(session)
+        await clear_decisions(session)
+
+    assert by_product == {1000: True, 1001: True, 1002: False}
+    assert other_dealer == [False] * 3
+    assert cards == joined
@@ -0,0 +1,97 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+
+from app.matching.catalog_cache import catalog_cache
+from app.matching.crud import get_statistics_totals
+from app.matching.models import (DelMatchingProductDealer,
+                                 MatchingProductDealer,
+                                 MatchPositiveProductDealer, Statistics)
+from app.matching.routers import delete_product, patch_product, post_product
+from app.matching.schemas import ProductData
+from app.products.models import MarketingDealer, MarketingProduct
+from tests.conftest import async_session_marker
+
+from .test_matching_read import add_matching, clear_matching, count_queries
+
+
+async def clear_decisions(session):
+    await session.execute(delete(MatchPositiveProductDealer))
+    await session.execute(delete(DelMatchingProductDealer))
+    await session.execute(delete(Statistics))
+    await clear_matching(session)
+
+
+async def test_decisions_run_in_one_statement(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        catalog_cache.invalidate()
+        await catalog_cache.get_products(session, [])
+        await add_matching(session, 3)
+        queue_orders = (await session.scalars(
+            select(MatchingProductDealer.order))).all()
+
+        with count_queries() as accept:
+            pair = await post_product(ProductData(prosept_id=2),
+                                      dealer_product_id=1000, operator_id=7,
+                                      db=session)
+        with count_queries() as postpone:
+            await patch_product(dealer_product_id=1001, operator_id=7,
+                                db=session)
+        with count_queries() as remove:
+            await delete_product(dealer_product_id=1002, operator_id=7,
+                                 db=session)
+
+        orders = dict((await session.execute(select(
+            MatchingProductDealer.dealer_product_id,
+            MatchingProductDealer.order))).all())
+        deleted = await session.scalar(
+            select(DelMatchingProductDealer.product_ids))
+        totals = await get_statistics_totals(session, 7)
+        await clear_decisions(session)
+
+    assert [len(accept), len(postpone), len(remove)] == [1, 1, 1]
+    assert pair.dealer_product.id == 1000
+    assert pair.dealer_product.dealer_name == 'Test_Dealer'
+    assert pair.prosept_product.id == 2
+    assert pair.prosept_product.article == 'Артикул 10'
+    # отложенная карточка встала после всех карточек очереди. Значение
+    # order берётся из последовательности и зависит от прошлых тестов
+    assert list(orders) == [1001]
+    assert orders[1001] > max(queue_orders)
+    assert deleted == [3, 4, 5, 1, 2]
+    assert totals == {'accepted_cards': 1, 'delete_cards': 1,
+                      'postponed_cards': 1}
+
+
+async def test_failed_decision_changes_nothing(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 1)
+
+        # ID товара «Просепт», которого нет в списке product_ids карточки
+        await session.execute(update(MatchingProductDealer).values(
+            product_ids=[1, 2, 3, 4]))
+        await session.commit()
+        with pytest.raises(HTTPException) as wrong_product:
+            await post_product(ProductData(prosept_id=5),
+                               dealer_product_id=1000, operator_id=1,
+                               db=session)
+        with pytest.raises(HTTPException) as missing:
+            await delete_product(dealer_product_id=999, operator_id=1,
+                                 db=session)
+        with pytest.raises(HTTPException):
+            await patch_product(dealer_product_id=999, operator_id=1,
+                                db=session)
+
+        matching = await session.scalar(
+            select(func.count()).select_from(MatchingProductDealer))
+        totals = await get_statistics_totals(session)
+        await clear_decisions(session)
+
+    assert 'product_ids' in wrong_product.value.detail
+    assert missing.value.detail == 'Объект не найден'
+    assert matching == 1
+    assert sum(totals.values()) == 0
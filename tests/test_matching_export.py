@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+
+from sqlalchemy import delete, insert, update
+
+from app.matching import export
+from app.matching.models import (MatchingProductDealer,
+                                 MatchPositiveProductDealer)
+from app.matching.routers import read_accepted_products, read_dealer_product
+from app.matching.schemas import MatchingProductDealerModel
+from app.products.models import MarketingDealer, MarketingProduct
+from tests.conftest import async_session_marker
+
+from .test_matching_read import add_matching, clear_matching, read_page
+
+
+async def read_body(response):
+    return ''.join([chunk async for chunk in response.body_iterator])
+
+
+async def test_streaming_media_type():
+    assert export.streaming_media_type(None) is None
+    assert export.streaming_media_type('application/json') is None
+    assert export.streaming_media_type(
+        'text/csv;q=0.9, application/json') == export.CSV
+    assert export.streaming_media_type(
+        'Application/X-NDJSON') == export.NDJSON
+
+
+async def test_matching_ndjson_matches_json(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 8)
+
+        cards, _ = await read_page(session)
+
+        # несколько чанков на небольшом наборе карточек
+        chunks = [chunk async for chunk in export.iter_matching_cards(
+            session, chunk_size=3)]
+        assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+        assert [MatchingProductDealerModel(**json.loads(row.card))
+                for chunk in chunks for row in chunk] == cards
+
+        chunks = [chunk async for chunk in export.iter_matching_cards(
+            session, limit=5, chunk_size=3)]
+        assert [len(chunk) for chunk in chunks] == [3, 2]
+
+        response = await read_dealer_product(
+            limit=None, after=None, dealer_id=None,
+            accept=export.NDJSON, db=session)
+        lines = (await read_body(response)).splitlines()
+
+        assert response.media_type == export.NDJSON
+        assert [json.loads(line) for line in lines] == [
+            card.model_dump() for card in cards]
+
+        response = await read_dealer_product(
+            limit=None, after=None, dealer_id=None,
+            accept=export.CSV, db=session)
+        rows = list(csv.reader(io.StringIO(await read_body(response))))
+        assert rows[0] == export.MATCHING_CSV_COLUMNS
+        assert [int(row[0]) for row in rows[1:]] == [card.id for card in cards]
+        assert rows[1][6:] == [str(product.id) for product in cards[0].products]
+
+        await clear_matching(session)
+
+
+async def test_matching_export_fills_missing_cards(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 4)
+        cards, _ = await read_page(session)
+        # строки добавлены в обход load_data и перематчинга
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id >= 1002).values(card=None))
+        await session.commit()
+
+        response = await read_dealer_product(
+            limit=None, after=None, dealer_id=None,
+            accept=export.NDJSON, db=session)
+        lines = (await read_body(response)).splitlines()
+
+        assert [json.loads(line) for line in lines] == [
+            card.model_dump() for card in cards]
+
+        await clear_matching(session)
+
+
+async def test_export_error_is_written_to_stream():
+    async def chunks():
+        yield [{'id': 1}, {'id': 2}]
+        raise RuntimeError('connection lost')
+
+    for media_type in (export.NDJSON, export.CSV):
+        response = export.streaming_response(
+            chunks(), media_type, ['id'], lambda card: [card['id']],
+            'matching', json.dumps)
+        lines = (await read_body(response)).splitlines()
+
+        # строки до ошибки отправлены, последняя строка - ошибка
+        assert len(lines) == 3 + (media_type == export.CSV)
+        if media_type == export.NDJSON:
+            assert json.loads(lines[-1]) == {'error': export.EXPORT_ERROR}
+        else:
+            assert lines[-1] == f'error,{export.EXPORT_ERROR}'
+
+
+async def test_accepted_pairs_export(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 3)
+        for i in range(3):
+            await session.execute(insert(MatchPositiveProductDealer).values(
+                dealer_product_id=1000 + i, product_id=i + 1))
+        await session.commit()
+
+        pairs = await read_accepted_products(accept=None, db=session)
+        assert [pair.prosept_product.id for pair in pairs] == [1, 2, 3]
+
+        response = await read_accepted_products(accept=export.CSV,
+                                                db=session)
+        rows = list(csv.DictReader(io.StringIO(await read_body(response))))
+        assert response.headers['content-disposition'] == (
+            'attachment; filename="accepted.csv"')
+        assert [row['dealer_product_id'] for row in rows] == [
+            '1000', '1001', '1002']
+        assert [row['prosept_id'] for row in rows] == ['1', '2', '3']
+        assert rows[0]['dealer_name'] == 'Test_Dealer'
+
+        await session.execute(delete(MatchPositiveProductDealer))
+        await clear_matching(session)
@@ -0,0 +1,59 @@
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.dialects import postgresql
+
+from app.matching.cards import cards_query
+from app.matching.models import (MatchingProductDealer,
+                                 MatchPositiveProductDealer)
+from tests.conftest import async_session_marker
+
+
+async def explain(query) -> str:
+    """План запроса без выполнения.
+
+    В тестовой БД всего несколько строк, и планировщику дешевле прочитать
+    таблицу целиком. Последовательное чтение отключается, что-бы
+    проверить, что для запроса есть подходящий индекс.
+    """
+
+    sql = query.compile(dialect=postgresql.dialect(),
+                        compile_kwargs={'literal_binds': True})
+    async with async_session_marker() as session:
+        await session.execute(text('SET LOCAL enable_seqscan = off'))
+        result = await session.execute(text(f'EXPLAIN {sql}'))
+        plan = '\n'.join(result.scalars())
+        await session.rollback()
+    return plan
+
+
+async def test_queue_page_uses_order_index():
+    plan = await explain(cards_query(limit=50, after=(10, 10)))
+    assert 'ix_matching_product_dealer_order_id' in plan
+    assert 'Sort' not in plan
+
+
+async def test_dealer_cards_page_uses_dealer_index():
+    plan = await explain(cards_query(limit=50, after=(10, 10), dealer_id=1))
+    assert 'ix_matching_product_dealer_dealer_id_order_id' in plan
+    assert 'Sort' not in plan
+
+
+async def test_decision_uses_dealer_product_index():
+    plan = await explain(delete(MatchingProductDealer).where(
+        MatchingProductDealer.dealer_product_id == 5))
+    assert 'ix_matching_product_dealer_dealer_product_id' in plan
+
+
+async def test_lease_sweep_uses_partial_index():
+    plan = await explain(
+        update(MatchingProductDealer)
+        .where(MatchingProductDealer.leased_until < func.now())
+        .values(leased_by=None, leased_until=None))
+    assert 'ix_matching_product_dealer_leased_until' in plan
+
+
+async def test_positive_pair_lookup_uses_index():
+    plan = await explain(select(MatchPositiveProductDealer.id).where(
+        MatchPositiveProductDealer.dealer_product_id == 5,
+        MatchPositiveProductDealer.product_id == 1))
+    assert ('ix_match_positive_prod_dealer_dealer_product_id_product_id'
+            in plan)
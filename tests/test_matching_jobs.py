@@ -0,0 +1,233 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+
+from app.matching import jobs, load_db
+from app.matching.crud import (create_dealer_product,
+                               save_delete_dealer_product)
+from app.matching.models import (DelMatchingProductDealer, MatchingJob,
+                                 MatchingProductDealer,
+                                 MatchPositiveProductDealer)
+from app.products.models import (MarketingDealer, MarketingDealerPrice,
+                                 MarketingProduct)
+from tests.conftest import async_session_marker
+
+from .test_matching_decisions import clear_decisions
+from .test_matching_read import add_matching
+
+
+def fake_products(product_ids):
+    """Подменяем DS: одна карточка дилера с заданными ID товаров."""
+
+    async def iter_matching_products(db):
+        yield MatchingProductDealer(product_ids=product_ids,
+                                    dealer_product_id=1)
+
+    return iter_matching_products
+
+
+async def test_create_and_cancel_job(fixture_marketing_dealer_price):
+    async with async_session_marker() as session:
+        job = await jobs.create_job(session)
+        assert job.status == jobs.QUEUED
+
+        with pytest.raises(HTTPException) as error:
+            await jobs.create_job(session)
+        assert error.value.status_code == 409
+
+        cancelled = await jobs.cancel_job(session, job.id)
+        assert cancelled.status == jobs.CANCELLED
+        assert cancelled.finished_at is not None
+
+        # отменённая задача из очереди не запускается
+        await jobs.run_job(job.id, async_session_marker)
+        assert (await jobs.get_job(session, job.id)).status == jobs.CANCELLED
+
+        with pytest.raises(HTTPException) as error:
+            await jobs.cancel_job(session, job.id)
+        assert error.value.status_code == 409
+
+
+async def test_concurrent_create_job_makes_one_job(
+        fixture_marketing_dealer_price):
+    async def create():
+        async with async_session_marker() as session:
+            try:
+                return (await jobs.create_job(session)).status
+            except HTTPException as error:
+                return error.status_code
+
+    results = await asyncio.gather(*[create() for _ in range(5)])
+
+    async with async_session_marker() as session:
+        count = await session.scalar(select(func.count(MatchingJob.id)).where(
+            jobs.unfinished_jobs()))
+        await session.execute(delete(MatchingJob))
+        await session.commit()
+
+    assert sorted(results, key=str) == [409] * 4 + [jobs.QUEUED]
+    assert count == 1
+
+
+async def test_run_job_updates_matching(
+        fixture_marketing_dealer_price: MarketingDealerPrice, monkeypatch):
+    orders = []
+    async with async_session_marker() as session:
+        for product_ids in ([1, 2, 3, 4, 5], [5, 4, 3, 2, 1]):
+            monkeypatch.setattr(load_db, 'iter_matching_products',
+                                fake_products(product_ids))
+            job = await jobs.create_job(session)
+            await jobs.run_job(job.id, async_session_marker)
+
+            job = await jobs.get_job(session, job.id)
+            assert job.status == jobs.DONE
+            assert job.processed == job.total == 1
+            assert job.started_at is not None and job.finished_at is not None
+            orders.append(await session.scalar(
+                select(MatchingProductDealer.order).where(
+                    MatchingProductDealer.dealer_product_id == 1)))
+
+        matching = (await session.execute(select(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == 1))).scalars().all()
+        assert len(matching) == 1
+        assert matching[0].product_ids == [5, 4, 3, 2, 1]
+        # перематчинг сохраняет место карточки в очереди
+        assert orders[0] is not None and orders[0] == orders[1]
+
+        await session.execute(delete(MatchingProductDealer))
+        await session.execute(delete(MatchingJob))
+        await session.commit()
+
+
+async def test_cancelled_job_blocks_new_jobs_until_it_stops(
+        fixture_marketing_dealer_price: MarketingDealerPrice, monkeypatch):
+    blocked = []
+
+    async def iter_matching_products(db):
+        # отмена приходит, пока задача считает чанк
+        async with async_session_marker() as api:
+            cancelled = await jobs.cancel_job(api, job.id)
+            blocked.append(cancelled.finished_at)
+            with pytest.raises(HTTPException) as error:
+                await jobs.create_job(api)
+            blocked.append(error.value.status_code)
+        yield MatchingProductDealer(product_ids=[1, 2, 3, 4, 5],
+                                    dealer_product_id=1)
+
+    monkeypatch.setattr(load_db, 'iter_matching_products',
+                        iter_matching_products)
+    async with async_session_marker() as session:
+        job = await jobs.create_job(session)
+        await jobs.run_job(job.id, async_session_marker)
+        stopped = await jobs.get_job(session, job.id)
+        next_job = await jobs.create_job(session)
+
+        await session.execute(delete(MatchingProductDealer))
+        await session.execute(delete(MatchingJob))
+        await session.commit()
+
+    assert blocked == [None, 409]
+    assert stopped.status == jobs.CANCELLED
+    assert stopped.finished_at is not None
+    assert next_job.status == jobs.QUEUED
+
+
+async def test_only_stale_jobs_are_failed(fixture_marketing_dealer_price):
+    async with async_session_marker() as session:
+        job = await jobs.create_job(session)
+        # задачу выполняет живой процесс другой реплики
+        await jobs.fail_interrupted_jobs(session)
+        alive = (await jobs.get_job(session, job.id)).status
+
+        # процесс задачи перестал отмечаться
+        await session.execute(update(MatchingJob).values(
+            heartbeat_at=datetime.now(timezone.utc) - timedelta(days=1)))
+        await session.commit()
+        next_job = await jobs.create_job(session)
+        stale = await jobs.get_job(session, job.id)
+
+        await session.execute(delete(MatchingJob))
+        await session.commit()
+
+    assert alive == jobs.QUEUED
+    assert stale.status == jobs.FAILED
+    assert stale.finished_at is not None
+    assert next_job.status == jobs.QUEUED
+
+
+async def test_job_in_training_is_not_failed(
+        fixture_marketing_dealer_price: MarketingDealerPrice, monkeypatch):
+    checks = []
+
+    async def iter_matching_products(db):
+        # обучение модели DS блокирует цикл событий дольше срока отметки
+        time.sleep(2)
+        async with async_session_marker() as api:
+            with pytest.raises(HTTPException) as error:
+                await jobs.create_job(api)
+            checks.append(error.value.status_code)
+            checks.append((await jobs.get_job(api, job.id)).status)
+        yield MatchingProductDealer(product_ids=[1, 2, 3, 4, 5],
+                                    dealer_product_id=1)
+
+    monkeypatch.setattr(jobs, 'MATCHING_JOB_HEARTBEAT_SECONDS', 0.2)
+    monkeypatch.setattr(jobs, 'MATCHING_JOB_STALE_SECONDS', 1)
+    monkeypatch.setattr(load_db, 'iter_matching_products',
+                        iter_matching_products)
+    async with async_session_marker() as session:
+        job = await jobs.create_job(session)
+        await jobs.run_job(job.id, async_session_marker)
+        status = (await jobs.get_job(session, job.id)).status
+
+        await session.execute(delete(MatchingProductDealer))
+        await session.execute(delete(MatchingJob))
+        await session.commit()
+
+    assert checks == [409, jobs.RUNNING]
+    assert status == jobs.DONE
+
+
+async def test_run_job_keeps_decisions_made_while_running(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_dealer_price: MarketingDealerPrice,
+        fixture_marketing_products: MarketingProduct, monkeypatch):
+    async def iter_matching_products(db):
+        # оператор принимает и удаляет карточки, пока задача считает чанк,
+        # а другой процесс добавляет в очередь карточку дилера 1
+        async with async_session_marker() as operator:
+            await create_dealer_product(operator, 1000, 1)
+            await save_delete_dealer_product(operator, 1001)
+            operator.add(MatchingProductDealer(product_ids=[1, 2, 3, 4, 5],
+                                               dealer_product_id=1))
+            await operator.commit()
+        for dealer_product_id in (1000, 1001, 1):
+            yield MatchingProductDealer(product_ids=[5, 4, 3, 2, 1],
+                                        dealer_product_id=dealer_product_id)
+
+    monkeypatch.setattr(load_db, 'iter_matching_products',
+                        iter_matching_products)
+    async with async_session_marker() as session:
+        await add_matching(session, 2)
+        job = await jobs.create_job(session)
+        await jobs.run_job(job.id, async_session_marker)
+
+        status = (await jobs.get_job(session, job.id)).status
+        queue = (await session.execute(select(
+            MatchingProductDealer.dealer_product_id,
+            MatchingProductDealer.product_ids))).all()
+        accepted = (await session.scalars(
+            select(MatchPositiveProductDealer.dealer_product_id))).all()
+        deleted = (await session.scalars(
+            select(DelMatchingProductDealer.dealer_product_id))).all()
+        await session.execute(delete(MatchingJob))
+        await clear_decisions(session)
+
+    assert status == jobs.DONE
+    # принятая и удалённая карточки не вернулись в очередь
+    assert queue == [(1, [5, 4, 3, 2, 1])]
+    assert accepted == [1000]
+    assert deleted == [1001]
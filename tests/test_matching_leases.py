@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import select, update
+
+from app.matching.leases import claim_cards, release_expired_leases
+from app.matching.models import MatchingProductDealer
+from app.matching.routers import (delete_product, patch_product,
+                                  read_next_products)
+from app.products.models import MarketingDealer, MarketingProduct
+from tests.conftest import async_session_marker
+
+from .test_matching_decisions import clear_decisions
+from .test_matching_read import add_matching
+
+
+async def claim(operator_id, n):
+    # у каждого оператора своя сессия, как у отдельного запроса API
+    async with async_session_marker() as session:
+        cards = await claim_cards(session, operator_id, n)
+        return [card.dealer_product_id for card, _, _ in cards]
+
+
+async def test_operators_claim_different_cards(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 10)
+
+    claimed = await asyncio.gather(*[claim(operator_id, 3)
+                                     for operator_id in (1, 2, 3)])
+    # повторный запрос возвращает те же карточки оператора
+    again = await claim(2, 3)
+
+    async with async_session_marker() as session:
+        response = Response()
+        cards = await read_next_products(response, n=2, dealer_id=None,
+                                         operator_id=4, db=session)
+        await clear_decisions(session)
+
+    flat = [id for ids in claimed for id in ids]
+    assert len(set(flat)) == 9
+    assert again == claimed[1]
+    # свободной осталась одна карточка, последняя в очереди
+    assert [card.dealer_product.id for card in cards] == [1000]
+    assert 'X-Lease-Expires' in response.headers
+
+
+async def test_leased_card_is_reserved_until_expiry(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await add_matching(session, 2)
+        [first, second] = await claim(1, 2)
+
+        with pytest.raises(HTTPException) as error:
+            await delete_product(dealer_product_id=first, operator_id=2,
+                                 db=session)
+        assert error.value.status_code == 409
+
+        # «Отложить» снимает аренду, карточку может взять другой оператор
+        await patch_product(dealer_product_id=second, operator_id=1,
+                            db=session)
+        assert await claim(2, 1) == [second]
+
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == first).values(
+                leased_until=datetime.now(timezone.utc) - timedelta(1)))
+        await session.commit()
+        released = await release_expired_leases(session)
+        await delete_product(dealer_product_id=first, operator_id=2,
+                             db=session)
+
+        leases = (await session.execute(select(
+            MatchingProductDealer.leased_by))).scalars().all()
+        await clear_decisions(session)
+
+    # снята только просроченная аренда, карточка second осталась за 2
+    assert released == 1
+    assert leases == [2]
+
+
+async def test_concurrent_postpones_get_distinct_orders(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async def postpone(dealer_product_id):
+        async with async_session_marker() as session:
+            await patch_product(dealer_product_id=dealer_product_id,
+                                operator_id=1, db=session)
+
+    async with async_session_marker() as session:
+        await add_matching(session, 5)
+        await asyncio.gather(*[postpone(1000 + i) for i in range(5)])
+        orders = (await session.execute(select(
+            MatchingProductDealer.order))).scalars().all()
+        await clear_decisions(session)
+
+    assert len(set(orders)) == 5
+    assert min(orders) > 5
@@ -0,0 +1,146 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, event, insert, update
+
+from app.matching.cards import refresh_cards
+from app.matching.crud import sync_order_sequence
+from app.matching.models import MatchingProductDealer
+from app.matching.routers import read_dealer_product
+from app.matching.schemas import MatchingProductDealerModel
+from app.products.models import (MarketingDealer, MarketingDealerPrice,
+                                 MarketingProduct)
+from tests.conftest import async_session_marker, engine_test
+
+
+@contextmanager
+def count_queries():
+    """Считаем запросы, отправленные в БД."""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine_test.sync_engine, 'before_cursor_execute',
+                 before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine_test.sync_engine, 'before_cursor_execute',
+                     before_cursor_execute)
+
+
+async def read_page(session, limit=None, after=None, dealer_id=None):
+    """Вызываем обработчик GET /api/v1/matching без HTTP-клиента."""
+
+    response = await read_dealer_product(limit=limit, after=after,
+                                         dealer_id=dealer_id, accept=None,
+                                         db=session)
+    cards = [MatchingProductDealerModel(**card)
+             for card in json.loads(response.body)]
+    return cards, response.headers
+
+
+async def add_matching(session, count, dealer_id=lambda i: 1):
+    """Создаём count карточек дилеров и объектов «MatchingProductDealer»."""
+
+    for i in range(count):
+        await session.execute(insert(MarketingDealerPrice).values(
+            id=1000 + i,
+            product_key=f'key-{i}',
+            price=100 + i,
+            product_url=f'https://example.com/{i}',
+            product_name=f'Товар дилера {i}',
+            date=datetime.now(),
+            dealer_id=dealer_id(i)))
+        await session.execute(insert(MatchingProductDealer).values(
+            dealer_product_id=1000 + i,
+            product_ids=[(i + j) % 5 + 1 for j in range(5)],
+            order=count - i))
+    await refresh_cards(session)
+    await session.commit()
+    await sync_order_sequence(session)
+
+
+async def clear_matching(session):
+    await session.execute(delete(MatchingProductDealer))
+    await session.execute(delete(MarketingDealerPrice).where(
+        MarketingDealerPrice.id >= 1000))
+    await session.commit()
+
+
+async def test_read_matching_query_count_is_constant(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    query_counts = []
+    async with async_session_marker() as session:
+        for count in (1, 25):
+            await add_matching(session, count)
+            with count_queries() as statements:
+                response, _ = await read_page(session)
+            query_counts.append(len(statements))
+
+            assert len(response) == count
+            # порядок по полю order и товары в порядке product_ids
+            assert [item.dealer_product.id for item in response] == [
+                1000 + i for i in reversed(range(count))]
+            for item in response:
+                i = item.dealer_product.id - 1000
+                assert item.dealer_product.dealer_name == 'Test_Dealer'
+                assert [product.id for product in item.products] == [
+                    (i + j) % 5 + 1 for j in range(5)]
+
+            await clear_matching(session)
+
+    # готовые карточки и количество карточек в очереди
+    assert query_counts[0] == query_counts[1] <= 3
+
+
+async def test_read_matching_keyset_pages(
+        fixture_marketing_dealer: MarketingDealer,
+        fixture_marketing_products: MarketingProduct):
+    async with async_session_marker() as session:
+        await session.execute(insert(MarketingDealer).values(
+            id=2, name='Second_Dealer'))
+        await add_matching(session, 10, dealer_id=lambda i: i % 2 + 1)
+        # у двух карточек одинаковый order, порядок между ними по id
+        await session.execute(update(MatchingProductDealer).where(
+            MatchingProductDealer.dealer_product_id == 1000).values(order=5))
+
+        full, headers = await read_page(session)
+        assert headers['X-Total-Count'] == '10'
+        assert 'X-Next-Cursor' not in headers
+
+        pages, after = [], None
+        while True:
+            page, headers = await read_page(session, limit=4, after=after)
+            pages.append(page)
+            after = headers.get('X-Next-Cursor')
+            if after is None:
+                break
+        assert [len(page) for page in pages] == [4, 4, 2]
+        assert [item.id for page in pages for item in page] == [
+            item.id for item in full]
+
+        second, headers = await read_page(session, limit=3, dealer_id=2)
+        assert headers['X-Total-Count'] == '5'
+        assert all(item.dealer_product.dealer_name == 'Second_Dealer'
+                   for item in second)
+        rest, _ = await read_page(session, dealer_id=2,
+                                  after=headers['X-Next-Cursor'])
+        assert [item.id for item in second + rest] == [
+            item.id for item in full
+            if item.dealer_product.dealer_name == 'Second_Dealer']
+
+        with pytest.raises(HTTPException) as error:
+            await read_page(session, limit=2, after='page-2')
+        assert error.value.status_code == 422
+
+        await clear_matching(session)
+        await session.execute(delete(MarketingDealer).where(
+            MarketingDealer.id == 2))
+        await session.commit()
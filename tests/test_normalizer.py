@@ -0,0 +1,66 @@
+import csv
+import re
+
+from nltk.corpus import stopwords
+from nltk.stem import PorterStemmer, WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+
+from app.matching.normalizer import normalize_titles
+
+EXTRA_TITLES = [
+    'Антисептик невымываемыйPROSEPT ULTRAконцентрат 1:10  / 1 л',
+    'ГЕЛЬ для МЫТЬЯ посуды5л, aaa aa a',
+    'Средство PROSEPTBath Acid+ 0,75л (12шт)',
+    'ababa aba 1010 10 ДДД Д',
+    'The cleaner and the гель и мыло',
+    '',
+]
+
+
+def legacy_tokenize(titles):
+    """Прежняя реализация separation()/tokenize() из script_ds.py."""
+
+    def separation(s):
+        s = re.sub(r'[^\w\s]', ' ', s)
+        lat = re.findall(r"[a-zA-Z]+", s)
+        num = re.findall(r"\d+", s)
+        up = re.findall(r"[А-Я]+", s)
+        for i in lat:
+            s = s.replace(i, ' ' + i + ' ')
+        for i in num:
+            s = s.replace(i, ' ' + i + ' ')
+        for i in up:
+            if len(i) > 1:
+                s = s.replace(i, ' ' + i + ' ')
+        s = ' '.join([i.lower() for i in s.split()])
+        return s
+
+    stopword_en = stopwords.words('english')
+    stopword_ru = stopwords.words('russian')
+    porter = PorterStemmer()
+    lemmatizer = WordNetLemmatizer()
+    tokenized = []
+    for q in titles:
+        q = separation(q)
+        q = word_tokenize(q)
+        q = [lemmatizer.lemmatize(i) for i in q if
+             (i not in stopword_en) and
+             (i not in stopword_ru)]
+        q = [porter.stem(i) for i in q]
+        tokenized.append(' '.join(q))
+    return tokenized
+
+
+async def test_normalize_titles_matches_legacy_pipeline():
+    with open('app/csv/marketing_product.csv', encoding='utf-8',
+              newline='') as file:
+        reader = csv.DictReader(file, delimiter=';')
+        titles = [row[column] for row in reader
+                  for column in ('name', 'ozon_name', 'wb_name') if row[column]]
+    titles += EXTRA_TITLES
+
+    expected = legacy_tokenize(titles)
+
+    assert normalize_titles(titles) == expected
+    # повторный вызов берёт результаты из кэша
+    assert normalize_titles(titles) == expected
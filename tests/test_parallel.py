@@ -0,0 +1,59 @@
+import os
+import time
+
+import numpy as np
+
+from app.config import ENCODER_NUM_THREADS
+from app.matching.embeddings import _init_encoder_worker, embed_texts
+from app.matching.parallel import (get_pool, map_chunks, shutdown_pools,
+                                   threads_per_worker)
+
+from .test_encoder_backends import TEXTS, tiny_model  # noqa: F401
+
+
+def probe(_):
+    """PID процесса пула и экземпляр энкодера из его реестра."""
+
+    from app.matching.encoder import get_encoder
+
+    time.sleep(0.05)
+    return os.getpid(), id(get_encoder(backend='torch')[1])
+
+
+async def test_map_chunks_splits_data_between_workers():
+    assert map_chunks(len, list(range(10)), workers=1, chunk_size=4) == [
+        4, 4, 2]
+    try:
+        assert map_chunks(len, list(range(10)), workers=2,
+                          chunk_size=100) == [5, 5]
+    finally:
+        shutdown_pools()
+
+
+async def test_embed_texts_reuses_pool_workers(tiny_model,  # noqa: F811
+                                               monkeypatch):
+    # процессы пула запускаются методом spawn и читают настройки заново
+    monkeypatch.setenv('ENCODER_NAME', tiny_model)
+    initargs = (threads_per_worker(2, ENCODER_NUM_THREADS), 'torch')
+    try:
+        first = embed_texts(TEXTS * 4, workers=2, backend='torch',
+                            progress=False)
+        pool = get_pool(2, _init_encoder_worker, initargs)
+        pids = set(pool._processes)
+        loaded = dict(pool.map(probe, range(8)))
+
+        second = embed_texts(TEXTS * 4, workers=2, backend='torch',
+                             progress=False)
+        reused = get_pool(2, _init_encoder_worker, initargs)
+        again = dict(pool.map(probe, range(8)))
+        after = set(pool._processes)
+    finally:
+        shutdown_pools()
+
+    assert reused is pool
+    assert after == pids and len(pids) == 2
+    # энкодер загружен в процессе один раз, при запуске пула
+    assert set(again) <= pids
+    assert all(again[pid] == loaded[pid] for pid in set(again) & set(loaded))
+    assert first.shape == (12, 32)
+    assert np.allclose(first, second)
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from app.matching import predictor
+from app.matching.embedding_store import save_embeddings
+from app.matching.predictor import MicroBatcher, Predictor
+
+from .test_streaming_predict import NearestModel, fake_embed, make_data
+
+
+async def test_concurrent_requests_share_batches():
+    batches = []
+
+    def predict(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait=0.05)
+    results = await asyncio.gather(*[batcher.submit(i) for i in range(10)])
+    await batcher.close()
+
+    assert results == [i * 2 for i in range(10)]
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+async def test_single_request_waits_at_most_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=8,
+                           max_wait=0.01)
+    result = await asyncio.wait_for(batcher.submit('title'), timeout=1)
+    await batcher.close()
+
+    assert result == 'title'
+
+
+async def test_batch_error_reaches_every_caller():
+    calls = []
+
+    def predict(items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise RuntimeError('encoder failed')
+        return items
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait=0.05)
+    results = await asyncio.gather(batcher.submit(1), batcher.submit(2),
+                                   return_exceptions=True)
+    # после ошибки батчер продолжает обрабатывать запросы
+    after = await batcher.submit(3)
+    await batcher.close()
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert after == 3
+
+
+async def test_predict_titles_scores_follow_ranking(monkeypatch):
+    catalog, rows = make_data()
+    encoded = []
+
+    def counting_embed(texts, **kwargs):
+        encoded.extend(texts)
+        return fake_embed(texts)
+
+    monkeypatch.setattr(predictor, 'embed_texts', counting_embed)
+    monkeypatch.setattr(predictor, 'normalize_titles', list)
+    monkeypatch.setattr(predictor, '_predictor', Predictor(
+        NearestModel(), catalog.ids, catalog.features, None,
+        predictor.files_version()))
+
+    titles = [row['product_name'] for row in rows[:3]] * 2
+    result = predictor.predict_titles(titles)
+
+    assert len(encoded) == 3
+    assert result[:3] == result[3:]
+    for title, products in zip(titles, result):
+        distances = np.linalg.norm(
+            catalog.features - fake_embed([title]), axis=1)
+        expected = catalog.ids[np.argsort(distances)[:5]]
+        assert [id for id, _ in products] == expected.tolist()
+        scores = [score for _, score in products]
+        assert scores == sorted(scores, reverse=True)
+        assert scores == pytest.approx(-np.sort(distances)[:5], rel=1e-4)
+
+
+async def test_predictor_reloads_changed_files(tmp_path, monkeypatch):
+    catalog, _ = make_data()
+    model_path = str(tmp_path / 'model.pkl')
+    features_path = str(tmp_path / 'features.npy')
+    monkeypatch.setattr(predictor, 'MODEL_PATH', model_path)
+    monkeypatch.setattr(predictor, 'FEATURES_PATH', features_path)
+    monkeypatch.setattr(predictor, 'MATCHING_INDEX', '')
+    monkeypatch.setattr(predictor, '_predictor', None)
+
+    with open(model_path, 'wb') as file:
+        pickle.dump({'model': 1}, file)
+    save_embeddings(catalog.features, catalog.ids, predictor.ENCODER_NAME,
+                    features_path)
+    first = predictor.get_predictor()
+    assert predictor.get_predictor() is first
+
+    # перематчинг сохранил новые эмбеддинги каталога с теми же ID
+    save_embeddings(catalog.features + 1, catalog.ids,
+                    predictor.ENCODER_NAME, features_path)
+    second = predictor.get_predictor()
+    assert np.allclose(second.features_mp, catalog.features + 1)
+
+    with open(model_path, 'wb') as file:
+        pickle.dump({'model': 2}, file)
+    os.utime(model_path, ns=(0, 0))
+    assert predictor.get_predictor().model == {'model': 2}
@@ -0,0 +1,118 @@
+import pickle
+
+import numpy as np
+
+from app.matching import script_ds
+from app.matching.embedding_store import CatalogEmbeddings
+from app.matching.index import build_index
+from app.matching.reranker import (FEATURE_NAMES, Reranker, rerank_features,
+                                   retrieve, text_features, train_reranker)
+from app.matching.script_ds import matching_predict_stream, predict_ids
+
+
+def make_data(seed=0, size=200, rows=1500, dim=16):
+    """Каталог и строки дилеров - зашумлённые копии товаров."""
+
+    rng = np.random.default_rng(seed)
+    features_mp = rng.normal(size=(size, dim)).astype(np.float32)
+    catalog_ids = np.arange(size) * 7 + 1
+    target = rng.integers(0, size, rows)
+    features_mdp = (features_mp[target]
+                    + rng.normal(scale=0.35, size=(rows, dim))).astype(np.float32)
+    return features_mdp, features_mp, catalog_ids, catalog_ids[target]
+
+
+def recall_at_5(predicted, product_ids):
+    return (predicted == product_ids[:, None]).any(axis=1).mean()
+
+
+async def test_rerank_features_shape_and_padding():
+    distances = np.array([[1.0, 2.0, np.inf], [0.5, 0.5, 1.5]])
+    ids = np.array([[3, 4, -1], [5, 6, 7]])
+
+    features = rerank_features(distances, ids)
+
+    assert features.shape == (6, len(FEATURE_NAMES))
+    assert np.isfinite(features).all()
+    assert features[:3, FEATURE_NAMES.index('rank')].tolist() == [0, 1, 2]
+    assert features[2, 0] == 2.0
+
+
+async def test_reranker_recall_and_pickle():
+    features_mdp, features_mp, catalog_ids, product_ids = make_data()
+    reranker = train_reranker(features_mdp[:1000], features_mp, catalog_ids,
+                              product_ids[:1000], candidates=20)
+
+    loaded = pickle.loads(pickle.dumps(reranker))
+    predicted = predict_ids(loaded, features_mdp[1000:], features_mp,
+                            catalog_ids)
+
+    assert isinstance(loaded, Reranker) and loaded.candidates == 20
+    assert predicted.shape == (500, 5)
+    assert recall_at_5(predicted, product_ids[1000:]) > 0.95
+
+
+async def test_reranker_uses_index_candidates():
+    features_mdp, features_mp, catalog_ids, product_ids = make_data(1)
+    reranker = train_reranker(features_mdp, features_mp, catalog_ids,
+                              product_ids, candidates=10, objective='binary')
+    index = build_index(CatalogEmbeddings(features_mp, catalog_ids, ''), 'exact')
+
+    assert np.array_equal(
+        predict_ids(reranker, features_mdp[:50], features_mp, catalog_ids,
+                    index=index),
+        predict_ids(reranker, features_mdp[:50], features_mp, catalog_ids))
+    assert retrieve(features_mdp[:3], features_mp, catalog_ids, 10)[1].shape == (3, 10)
+
+
+async def test_text_features():
+    ids = np.array([[1, 2, -1]])
+    features = text_features(['средств 500 мл'], ids,
+                             {1: 'средств 500 мл', 2: 'средств 1000 мл'})
+
+    assert features[0, :, 0].tolist() == [1.0, 0.5, 0.0]
+    assert features[0, :, 1].tolist() == [1.0, 0.0, 0.0]
+    assert not text_features(None, ids, {1: 'средств'}).any()
+
+
+async def test_reranker_uses_titles():
+    # пары товаров с одинаковыми эмбеддингами отличаются только объёмом
+    rng = np.random.default_rng(2)
+    base = rng.normal(size=(50, 16)).astype(np.float32)
+    features_mp = np.repeat(base, 2, axis=0)
+    catalog_ids = np.arange(100) + 1
+    catalog_titles = [f'средств {i // 2} {(500, 1000)[i % 2]} мл'
+                      for i in range(100)]
+    target = rng.integers(0, 100, 3000)
+    features_mdp = (features_mp[target]
+                    + rng.normal(scale=0.1, size=(3000, 16))).astype(np.float32)
+    titles = [catalog_titles[i] for i in target]
+
+    reranker = train_reranker(
+        features_mdp[:2000], features_mp, catalog_ids, catalog_ids[target[:2000]],
+        candidates=10, titles=titles[:2000], catalog_titles=catalog_titles)
+    predicted = predict_ids(reranker, features_mdp[2000:], features_mp,
+                            catalog_ids, k=1, titles=titles[2000:])
+
+    assert (predicted[:, 0] == catalog_ids[target[2000:]]).mean() > 0.95
+
+
+async def test_stream_builds_reranker_index_once(monkeypatch):
+    features_mdp, features_mp, catalog_ids, product_ids = make_data(3)
+    reranker = train_reranker(features_mdp, features_mp, catalog_ids,
+                              product_ids, candidates=10)
+    indexes = []
+
+    def predict_chunk(data, model, catalog_ids, features_mp, index=None,
+                      **kwargs):
+        indexes.append(index)
+        return [{}] * len(data)
+
+    monkeypatch.setattr(script_ds, 'predict_chunk', predict_chunk)
+    rows = [{'id': i, 'product_name': str(i)} for i in range(12)]
+    list(matching_predict_stream(
+        [], rows, (reranker, CatalogEmbeddings(features_mp, catalog_ids, '')),
+        chunk_size=5))
+
+    assert len(indexes) == 3 and indexes[0] is not None
+    assert all(index is indexes[0] for index in indexes)
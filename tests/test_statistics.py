@@ -0,0 +1,49 @@
+import asyncio
+
+from sqlalchemy import delete
+
+from app.matching.crud import get_statistics_totals, update_statistics
+from app.matching.models import Statistics
+from app.matching.routers import get_statistics
+from tests.conftest import async_session_marker
+
+
+async def increment(column: str, operator_id: int) -> int:
+    # у каждого действия своя сессия, как у отдельного запроса API
+    async with async_session_marker() as session:
+        return await update_statistics(session, column, operator_id)
+
+
+async def test_concurrent_increments_are_not_lost():
+    values = await asyncio.gather(
+        *[increment('accepted_cards', 1) for _ in range(20)])
+
+    async with async_session_marker() as session:
+        totals = await get_statistics_totals(session, 1)
+        await session.execute(delete(Statistics))
+        await session.commit()
+
+    assert sorted(values) == list(range(1, 21))
+    assert totals == {'accepted_cards': 20, 'delete_cards': 0,
+                      'postponed_cards': 0}
+
+
+async def test_statistics_per_operator_and_total():
+    await increment('accepted_cards', 1)
+    await increment('delete_cards', 2)
+    await increment('accepted_cards', 2)
+    await increment('postponed_cards', 2)
+
+    async with async_session_marker() as session:
+        operator = await get_statistics(operator_id=2, db=session)
+        total = await get_statistics(operator_id=None, db=session)
+        await session.execute(delete(Statistics))
+        await session.commit()
+        empty = await get_statistics(operator_id=None, db=session)
+
+    assert operator.total_cards_checked == 3
+    assert operator.percentage_accepted_cards == 33.33
+    assert total.accepted_cards == 2
+    assert total.total_cards_checked == 4
+    assert total.percentage_accepted_cards == 50
+    assert empty.total_cards_checked == 0
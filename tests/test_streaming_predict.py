@@ -0,0 +1,81 @@
+import numpy as np
+
+from app.matching import script_ds
+from app.matching.embedding_store import CatalogEmbeddings
+
+
+class NearestModel:
+    """Модель-заглушка: чем меньше расстояние, тем выше оценка."""
+
+    best_iteration = 0
+
+    def predict(self, data, num_iteration=None):
+        return -data.to_numpy()
+
+
+def fake_embed(texts, cache=None, workers=1):
+    """Детерминированные эмбеддинги вместо LaBSE."""
+
+    return np.stack([
+        np.random.default_rng(sum(map(ord, text))).normal(size=8)
+        for text in texts]).astype(np.float32)
+
+
+def make_data():
+    rng = np.random.default_rng(0)
+    catalog = CatalogEmbeddings(
+        rng.normal(size=(30, 8)).astype(np.float32),
+        np.arange(30) * 3 + 1, 'test-model')
+    rows = [{'id': i, 'product_name': f'Средство {i} ml'} for i in range(23)]
+    return catalog, rows
+
+
+async def test_stream_matches_full_predict(monkeypatch):
+    monkeypatch.setattr(script_ds, 'embed_texts', fake_embed)
+    catalog, rows = make_data()
+    model_embeddings = (NearestModel(), catalog)
+
+    expected = script_ds.matching_predict([], rows, model_embeddings)
+    streamed = list(script_ds.matching_predict_stream(
+        [], iter(rows), model_embeddings, chunk_size=5))
+
+    assert [row for row, _ in streamed] == rows
+    assert [record for _, record in streamed] == expected
+
+
+async def test_stream_reads_one_chunk_at_a_time(monkeypatch):
+    monkeypatch.setattr(script_ds, 'embed_texts', fake_embed)
+    catalog, rows = make_data()
+    consumed = []
+
+    def source():
+        for row in rows:
+            consumed.append(row['id'])
+            yield row
+
+    stream = script_ds.matching_predict_stream(
+        [], source(), (NearestModel(), catalog), chunk_size=5)
+    next(stream)
+
+    assert consumed == list(range(5))
+
+
+async def test_duplicate_titles_encoded_once(monkeypatch):
+    encoded = []
+
+    def counting_embed(texts, cache=None, workers=1):
+        encoded.extend(texts)
+        return fake_embed(texts)
+
+    monkeypatch.setattr(script_ds, 'embed_texts', counting_embed)
+    catalog, rows = make_data()
+    rows = [{'id': 100 + i, 'product_name': row['product_name']}
+            for i, row in enumerate(rows * 3)]
+    stats = {}
+
+    records = script_ds.matching_predict(
+        [], rows, (NearestModel(), catalog), stats=stats)
+
+    assert len(encoded) == len(set(encoded)) == 23
+    assert stats == {'rows': 69, 'unique': 23}
+    assert records[:23] == records[23:46] == records[46:]
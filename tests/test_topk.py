@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from app.matching.topk import sort_rows, top_k
+
+
+def legacy_ranking(res, ids, y_pred, k):
+    """Прежняя реализация из matching_predict (построчно через pandas)."""
+
+    res = pd.DataFrame(res)
+    res_sort = pd.DataFrame(
+        [np.sort(res.iloc[i, :]) for i in range(res.shape[0])])
+    res_lm = pd.DataFrame(
+        [np.argsort(res.iloc[i, :]) for i in range(res.shape[0])])
+    data_mp_id = pd.DataFrame({'id': ids})
+    df_res_lm = pd.DataFrame(
+        [[data_mp_id.loc[i, 'id'] for i in res_lm.loc[j, :]] for j in
+         range(res_lm.shape[0])])
+    df_ind_all = pd.DataFrame(
+        [np.argsort(y_pred[i])[-1: -(k + 1): -1] for i in
+         range(y_pred.shape[0])])
+    result = pd.DataFrame(
+        [[df_res_lm.loc[i, df_ind_all.loc[i, :][j]] for j in range(k)]
+         for i in range(df_ind_all.shape[0])])
+    return res_sort.values, df_res_lm.values, result.values
+
+
+async def test_sort_rows_and_top_k_match_legacy():
+    rng = np.random.default_rng(42)
+    res = rng.random((50, 40))
+    ids = rng.permutation(1000)[:40]
+    y_pred = rng.random((50, 40))
+
+    legacy_sort, legacy_ids, legacy_result = legacy_ranking(res, ids, y_pred, 5)
+
+    res_sort, res_lm = sort_rows(res)
+    result = ids[np.take_along_axis(res_lm, top_k(y_pred, 5, largest=True),
+                                    axis=1)]
+
+    assert np.array_equal(res_sort, legacy_sort)
+    assert np.array_equal(ids[res_lm], legacy_ids)
+    assert np.array_equal(result, legacy_result)
+
+
+async def test_top_k_smallest_and_small_matrix():
+    matrix = np.array([[3.0, 1.0, 2.0], [0.5, 0.7, 0.1]])
+
+    assert top_k(matrix, 2).tolist() == [[1, 2], [2, 0]]
+    assert top_k(matrix, 10).tolist() == [[1, 2, 0], [2, 0, 1]]
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from app.matching.script_ds import build_target, remove_row_dealer
+
+
+def legacy_remove_row_dealer(data_mp, data_mdp, data_mpdk, nm='name'):
+    """Прежняя реализация из matching_training."""
+
+    test_null = data_mdp.merge(
+        data_mpdk,
+        how='left',
+        left_on='product_key',
+        right_on='key').loc[:, ['product_key', 'key', 'product_id']]
+
+    ind_drop = test_null.loc[test_null['product_id'].isnull()].index.values
+    data_mdp.drop(ind_drop, axis=0, inplace=True)
+
+    id_drop = data_mp.loc[data_mp[nm].isnull()]['id']
+    drop = data_mpdk.loc[data_mpdk['product_id'].isin(id_drop), ['key', 'dealer_id']]
+
+    ind_drop_mdp = []
+    for k, v in zip(drop['key'], drop['dealer_id']):
+        ind_drop_mdp.extend(list(data_mdp.loc[
+            (data_mdp['product_key'] == k) & (data_mdp['dealer_id'] == v)].index.values))
+
+    data_mdp.drop(ind_drop_mdp, axis=0, inplace=True)
+    data_mdp.reset_index(drop=True, inplace=True)
+
+
+def legacy_target(df_res_lm, testlm):
+    """Прежнее построение целевой переменной из matching_training."""
+
+    testlm = pd.concat([testlm, df_res_lm], axis=1)
+    for j in range(testlm.shape[0]):
+        df_res_lm.loc[j, :] = np.where(
+            df_res_lm.loc[j, :].values == testlm.loc[
+                j, 'product_id'], 1, 0)
+    for j in range(df_res_lm.shape[0]):
+        df_res_lm.loc[j, 'target'] = (df_res_lm.loc[j, :].
+                                      values.
+                                      tolist().
+                                      index(1))
+    return df_res_lm.target
+
+
+def fixture_data():
+    """Каталог с пропущенными названиями, строки дилеров без разметки."""
+
+    rng = np.random.default_rng(0)
+    data_mp = pd.DataFrame({
+        'id': np.arange(1, 31) * 3,
+        'name': [None if i % 7 == 0 else f'Товар {i}' for i in range(30)],
+    })
+    keys = [f'key{i}' for i in range(200)]
+    data_mpdk = pd.DataFrame({
+        'id': range(180),
+        'key': keys[:180],
+        'product_id': rng.choice(data_mp['id'], 180),
+        'dealer_id': rng.integers(1, 4, 180),
+    })
+    data_mdp = pd.DataFrame({
+        'id': range(200),
+        'product_key': keys,
+        'product_name': [f'Товар дилера {i}' for i in range(200)],
+        'dealer_id': np.concatenate([data_mpdk['dealer_id'].to_numpy(),
+                                     rng.integers(1, 4, 20)]),
+    })
+    # строки с тем же ключом, но другим дилером не удаляются
+    named = data_mpdk['product_id'].isin(data_mp.dropna()['id'])
+    data_mdp.loc[named[named].index[::9], 'dealer_id'] = 5
+    return data_mp, data_mdp, data_mpdk
+
+
+async def test_remove_row_dealer_matches_legacy():
+    data_mp, data_mdp, data_mpdk = fixture_data()
+    expected = data_mdp.copy()
+
+    legacy_remove_row_dealer(data_mp, expected, data_mpdk)
+    remove_row_dealer(data_mp, data_mdp, data_mpdk)
+
+    assert len(data_mdp) < 200
+    pd.testing.assert_frame_equal(data_mdp, expected)
+
+
+async def test_build_target_matches_legacy():
+    data_mp, data_mdp, data_mpdk = fixture_data()
+    remove_row_dealer(data_mp, data_mdp, data_mpdk)
+    data_mp = data_mp.dropna(subset=['name']).reset_index(drop=True)
+
+    rng = np.random.default_rng(1)
+    res_lm = np.argsort(rng.random((len(data_mdp), len(data_mp))), axis=1)
+    ids_sorted = data_mp['id'].to_numpy()[res_lm]
+    testlm = data_mdp.merge(data_mpdk, how='left', left_on='product_key',
+                            right_on='key').loc[:, ['product_key', 'key',
+                                                    'product_id']]
+
+    expected = legacy_target(pd.DataFrame(ids_sorted), testlm)
+    target = build_target(ids_sorted, testlm['product_id'].to_numpy())
+
+    pd.testing.assert_series_equal(target, expected)